@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the HvControllerGUI software.
+# The HvAsyncController class is an asyncio version of the HvController,
+# allowing to operate many HV devices from a single event loop. It is
+# POSIX only: it registers the file descriptor of the tty with the
+# add_reader method of the event loop, which Windows does not support.
+#
+# Copyright 2018-2019 Aurélie Vancraeyenest
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import time
+import asyncio
+
+import serial
+
+import HvController as hv
+import codec
+import metrics
+
+
+class HvAsyncController(hv.HvController):
+    '''
+    Asyncio version of the HvController
+
+    The serial port is opened in non-blocking mode and its file
+    descriptor is registered with the running event loop: a command
+    only waits for its answer, up to the CR terminator, without any
+    thread or sleep. The commands are encoded and the answers decoded
+    as in the HvController, and the S commands clamped, trimmed, kept
+    as setpoint and recorded in the telemetry and the metrics as well:
+    it can replace the HvController for the same work.
+
+    Use the awaitable open(), query(), set(), reset(), version() and
+    close() methods from within an event loop. The blocking methods of
+    the HvController must not be used with an instance of this class.
+
+    If the port hangs up (e.g. the device is unplugged), the pending
+    command and the following ones raise a serial.SerialException.
+    Only available on POSIX systems.
+    '''
+
+    def __init__(self):
+        super(HvAsyncController, self).__init__()
+        self._loop = None
+        self._lock = None
+        self._rxBuffer = bytearray()
+        self._answer = None
+        self._reading = False
+
+    async def open(self, port):
+        '''
+        Open the port for communication with HV supply
+
+        Parameters
+        ----------
+        port : str
+            Port name
+        '''
+        self._loop = asyncio.get_running_loop()
+        self._lock = asyncio.Lock()
+        self.device.port = port
+        self.device.timeout = 0
+        self.device.open()
+        self._loop.add_reader(self.device.fileno(), self._onReadable)
+        self._reading = True
+        self.metrics = metrics.ControllerMetrics(port, self.registry)
+
+    async def close(self):
+        '''
+        Reset the HV and close the port
+
+        Returns
+        -------
+        output : str
+            Succesful or still open
+        '''
+        try:
+            await self.reset()
+        finally:
+            self._stopReading()
+            self.device.close()
+        if self.device.is_open is False:
+            return ("Device on port {} has been closed succesfully"
+                    .format(self.device.name))
+        else:
+            return ("The close command has failed: port {} is still open!"
+                    .format(self.device.name))
+
+    async def query(self, verbosity=False):
+        '''
+        Query the HV (Q command), see HvController.queryHV()
+        '''
+        answer = await self._transact(codec.QUERY_FRAME)
+        reading = self._decodeQuery(answer)
+
+        if verbosity:
+            return self._statusMessage(reading)
+        return reading
+
+    async def set(self, voltToSet, curToSet, digitContr='on',
+                  verbosity=False, trim=0):
+        '''
+        Send a set HV command (S command), see HvController.setHV()
+        '''
+        cmdToSend, kind, voltage = self._setCommand(voltToSet, curToSet,
+                                                    digitContr, trim)
+        try:
+            answer = await self._transact(cmdToSend, readTI=0.5)
+        except hv.HvError as err:
+            self._recordSet(kind, voltage, curToSet, 'E{}'.format(err.code))
+            raise
+        self._recordSet(kind, voltage, curToSet,
+                        answer.decode('ascii', 'replace'))
+        self._setAnswered(answer, voltToSet, curToSet, digitContr, trim)
+
+        if verbosity:
+            return self._setMessage(answer, voltToSet, curToSet)
+
+        return await self.query()
+
+    async def reset(self, verbosity=False):
+        '''
+        Send a reset HV command (S command), see HvController.resetHV()
+        '''
+        return await self.set(0.0, 0.0, 'reset', verbosity)
+
+    async def version(self):
+        '''
+        Ask the version number (V command), see HvController.version()
+        '''
+        answer = await self._transact(codec.VERSION_FRAME)
+        self._checkChecksum(answer)
+        return ("The firmware version is: {}"
+                .format(answer[1:-2].decode()))
+
+    async def _transact(self, cmdToSend, readTI=0.1):
+        '''
+        Send a command and wait for its answer
+
+        Parameters
+        ----------
+        cmdToSend : bytes
+            Format b'\\\\x01XXXXXXX\\\\x0D'
+        readTI : float
+            Upper deadline for the answer to arrive (default 0.1 s)
+
+        Returns
+        -------
+        Answer : bytes
+            return the answer received in bytes, stripped from b'\\\\r'
+
+        Raises
+        ------
+        HvError
+            If the HV answers with an error code
+        serial.SerialException
+            If the port hung up
+        '''
+        async with self._lock:
+            if not self._reading:
+                raise serial.SerialException('Port {} is closed or hung up'
+                                             .format(self.device.port))
+            self._rxBuffer.clear()
+            self._answer = self._loop.create_future()
+            sent = time.monotonic()
+            start = self._loop.time()
+            os.write(self.device.fileno(), cmdToSend)
+            try:
+                answer = await asyncio.wait_for(self._answer, readTI)
+            except asyncio.TimeoutError:
+                answer = bytes(self._rxBuffer)
+            finally:
+                self._answer = None
+            self.metrics.transaction(cmdToSend, answer,
+                                     self._loop.time() - start)
+
+        answer = answer.strip(b'\r')
+        if answer.startswith(b'E'):
+            self._raiseError(answer)
+        if answer:
+            self.lastTransaction = sent
+        return answer
+
+    def _onReadable(self):
+        ''' Event loop callback collecting the bytes of the answer '''
+        try:
+            data = os.read(self.device.fileno(), 256)
+        except BlockingIOError:
+            return
+        except OSError as err:
+            # EIO once the other end of a pseudo-terminal is closed
+            self._hangUp(serial.SerialException(
+                    'Port {} hung up: {}'.format(self.device.port, err)))
+            return
+        if not data:
+            self._hangUp(serial.SerialException(
+                    'Port {} hung up'.format(self.device.port)))
+            return
+        self._rxBuffer += data
+        if self._answer is not None and not self._answer.done():
+            end = self._rxBuffer.find(b'\r')
+            if end >= 0:
+                self._answer.set_result(bytes(self._rxBuffer[:end + 1]))
+
+    def _hangUp(self, error):
+        ''' Stop reading a port at its end, failing the pending command '''
+        self._stopReading()
+        if self._answer is not None and not self._answer.done():
+            self._answer.set_exception(error)
+
+    def _stopReading(self):
+        if self._reading:
+            self._loop.remove_reader(self.device.fileno())
+            self._reading = False
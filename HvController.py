@@ -21,8 +21,82 @@
 import serial
 import time
 import logging
+import collections
+import functools
 
 import checksum
+import codec
+import metrics
+
+
+@functools.lru_cache(maxsize=None)
+def _scaleTable(maxValue, maxCounts):
+    ''' Return the value rounded to 0.1 of each 12 bit ADC count value '''
+    return tuple(round(counts * maxValue / maxCounts, 1)
+                 for counts in range(0x1000))
+
+
+class HvReading(collections.namedtuple(
+        'HvReading', 'timestamp voltCounts curCounts status voltage current')):
+    '''
+    Immutable snapshot of the HV status decoded from a Q command
+
+    A tuple subclass without instance dictionary, cheap to create and
+    to keep in long histories, and safe to share between threads.
+
+    Attributes
+    ----------
+    timestamp : float
+        time.monotonic() at the reception of the answer
+    voltCounts : int
+        Voltage in ADC counts
+    curCounts : int
+        Current in ADC counts
+    status : int
+        Status digit of the answer (see codec.STATUS_TABLE)
+    voltage : float
+        Voltage value in kV
+    current : float
+        Current value in mA
+    hvOn : bool
+        True if HV is on
+    fault : bool
+        True if HV is faulty
+    ctrlMode : str
+        'voltage' or 'current'
+    '''
+    __slots__ = ()
+
+    @property
+    def hvOn(self):
+        return codec.STATUS_TABLE[self.status][0]
+
+    @property
+    def fault(self):
+        return codec.STATUS_TABLE[self.status][1]
+
+    @property
+    def ctrlMode(self):
+        return codec.STATUS_TABLE[self.status][2]
+
+
+class HvError(Exception):
+    '''
+    Error answer (E1 to E6) of the HV device
+
+    Attributes
+    ----------
+    code : int
+        Error code
+    '''
+
+    def __init__(self, code, message):
+        super(HvError, self).__init__(message)
+        self.code = code
+
+
+#: Status before the first query: HV off, no fault, voltage mode
+NO_READING = HvReading(0.0, 0, 0, 0, 0.0, 0.0)
 
 
 class HvController():
@@ -38,22 +112,94 @@ class HvController():
 
        MAX_HEX_VAL_SENT = 0xFFF
 
+    The status of the HV is the HvReading of the last query, held in
+    lastReading (None before the first query). The voltage, current,
+    hvOn, fault and ctrlMode attributes are read-only shortcuts to it.
+    lastTransaction is the time.monotonic() start of the last command
+    answered by the HV without error, which reset its watchdog.
+
+    The encoded S commands are kept in a LRU cache of FRAME_CACHE_SIZE
+    entries, so repeated setpoints are not encoded again. Its use is
+    counted in frameCacheHits and frameCacheMisses.
+
+    Each query and S command is recorded in telemetry, a
+    telemetry.TelemetrySink, if set (default None). The last S command
+    accepted by the HV is kept in setpoint, as (voltage, current,
+    digitContr) arguments of setHV() (None before the first one), and
+    its voltage trim in DAC counts in trim.
+
+    Parameters
+    ----------
+    framedRead : bool
+        Read the answers up to the CR terminator (default True) instead
+        of waiting a fixed time before reading
+    device : serial.Serial
+        Serial port, or any object with the same interface such as an
+        HvEmulator.HvEmulator (default a new closed serial.Serial)
+    registry : MetricsRegistry
+        Registry of the communication metrics, recorded in a
+        ControllerMetrics labelled by the port once it is open (default
+        metrics.REGISTRY)
+
     '''
 
     MAX_VOLTAGE = 40.0
     MAX_CURENT = 3.0
     MAX_HEX_VAL_RECEIVE = 0x3FF
     MAX_HEX_VAL_SENT = 0xFFF
-
-    def __init__(self):
-        self.device = serial.Serial()
-        self.voltage = 0
-        self.current = 0
-        self.hvOn = False
-        self.fault = False
-        self.ctrlMode = 'voltage'
+    FRAME_CACHE_SIZE = 256
+
+    def __init__(self, framedRead=True, device=None, registry=None):
+        self.device = serial.Serial() if device is None else device
+        self.framedRead = framedRead
+        self._frameCache = collections.OrderedDict()
+        self.frameCacheHits = 0
+        self.frameCacheMisses = 0
+        self._voltTable = _scaleTable(self.MAX_VOLTAGE,
+                                      self.MAX_HEX_VAL_RECEIVE)
+        self._curTable = _scaleTable(self.MAX_CURENT, self.MAX_HEX_VAL_RECEIVE)
+        self.lastReading = None
+        self.lastTransaction = None
+        self.registry = metrics.REGISTRY if registry is None else registry
+        self.metrics = None
+        self.telemetry = None
+        self.setpoint = None
+        self.trim = 0
         self.logger = logging.getLogger('hvController')
 
+    @property
+    def voltage(self):
+        ''' Voltage value in kV of the last query '''
+        return (self.lastReading or NO_READING).voltage
+
+    @property
+    def current(self):
+        ''' Current value in mA of the last query '''
+        return (self.lastReading or NO_READING).current
+
+    @property
+    def hvOn(self):
+        ''' True if HV was on at the last query '''
+        return (self.lastReading or NO_READING).hvOn
+
+    @property
+    def fault(self):
+        ''' True if HV was faulty at the last query '''
+        return (self.lastReading or NO_READING).fault
+
+    @property
+    def ctrlMode(self):
+        ''' 'voltage' or 'current' control mode at the last query '''
+        return (self.lastReading or NO_READING).ctrlMode
+
+    @property
+    def targetVoltage(self):
+        ''' Voltage in kV expected from the setpoint, None before it '''
+        if self.setpoint is None:
+            return None
+        voltage, current, digitContr = self.setpoint
+        return voltage if digitContr == 'on' else 0.0
+
     def openPortHV(self, port, defaultTI=2):
         '''
         Open the port for communication with HV supply
@@ -68,6 +214,7 @@ class HvController():
         self.device.port = port
         self.device.timeout = defaultTI
         self.device.open()
+        self.metrics = metrics.ControllerMetrics(port, self.registry)
 
     def closePortHV(self):
         '''
@@ -101,52 +248,60 @@ class HvController():
         -------
         Status : str
             return str of the status if verbosity set to True
+        reading : HvReading
+            return the new reading otherwise
 
         Updated values
         --------------
-        hvOn : bool
-            True if HV is on
-        fault : bool
-            True if HV is faulty
-        ctrlMode : str
-            'voltage' or 'current'
-        voltage : float
-            Voltage value in kV
-        current : float
-            Current value in mA
+        lastReading : HvReading
+            New reading of the HV status
         '''
         self.device.read_all()
 
-        queryCmd = self._encodeCommand('Q')
-        answer = self._sendCommand(queryCmd)
-        checksum.checkChecksum(answer)
-
-        controlMode = {'0': 'voltage', '1': 'current'}
-        faultStatus = {'0': False, '1': True}
-        hvOnStatus = {'0': False, '1': True}
+        answer = self._sendCommand(codec.QUERY_FRAME)
+        reading = self._decodeQuery(answer)
 
-        # First extract the HV status and update the status
-        statusBits = bin(int(answer[10:11], 16)).lstrip('0b').zfill(3)
-        self.hvOn = hvOnStatus[statusBits[0]]
-        self.fault = faultStatus[statusBits[1]]
-        self.ctrlMode = controlMode[statusBits[2]]
-
-        # Then extract the HV voltage and current values
-        voltageByte = answer[1:4]
-        curentByte = answer[4:7]
+        if verbosity:
+            return self._statusMessage(reading)
+        return reading
 
-        self.voltage = round(int(voltageByte, 16)
-                             * self.MAX_VOLTAGE / self.MAX_HEX_VAL_RECEIVE, 1)
-        self.current = round(int(curentByte, 16)
-                             * self.MAX_CURENT / self.MAX_HEX_VAL_RECEIVE, 1)
+    def _decodeQuery(self, answer):
+        '''
+        HV controller method to decode the answer to a Q command
 
-        if verbosity:
-            return ('HV status: \n V = {v} \n I = {A}'
-                    '\n HV mode : {mode} \n HV fault: {f} \n HV on: {on}'
-                    .format(v=self.voltage, A=self.current, mode=self.ctrlMode,
-                            f=self.fault, on=self.hvOn))
+        Parameters
+        ----------
+        answer : bytes
+            Answer of the HV stripped from b'\\r'
 
-    def setHV(self, voltToSet, curToSet, digitContr='on', verbosity=False):
+        Returns
+        -------
+        reading : HvReading
+            New reading, also stored in lastReading and recorded in the
+            telemetry, if any
+        '''
+        self._checkChecksum(answer)
+        voltCounts, curCounts, status = codec.decodeQuery(answer)
+
+        reading = HvReading(time.monotonic(), voltCounts, curCounts, status,
+                            self._voltTable[voltCounts],
+                            self._curTable[curCounts])
+        self.lastReading = reading
+        if self.telemetry is not None:
+            self.telemetry.poll(self.device.port, reading)
+        return reading
+
+    @staticmethod
+    def _statusMessage(reading):
+        ''' Return the verbose HV status message of a reading '''
+        return ('HV status: \n V = {v} \n I = {A}'
+                '\n HV mode : {mode} \n HV fault: {f} \n HV on: {on}'
+                .format(v=reading.voltage, A=reading.current,
+                        mode=reading.ctrlMode, f=reading.fault,
+                        on=reading.hvOn))
+
+    def setHV(self, voltToSet, curToSet, digitContr='on', verbosity=False,
+              trim=0):
         '''
         HV controller method to send a set HV command (S command)
 
@@ -160,53 +315,170 @@ class HvController():
             'on' 'off' or 'reset'
         verbosity : bool
             Set to True for verbose output
+        trim : int
+            Offset added to the voltage in DAC counts (default 0), to
+            correct a steady error of the supply
 
         Returns
         -------
         Output : str
             return str succes or failed if verbosity set to True
+        reading : HvReading
+            return the reading of the query made after the execution
+            otherwise
 
         Updated values by a query after the execution:
         ----------------------------------------------
-        hvOn : bool
-            True if HV is on
-        fault : bool
-            True if HV is faulty
-        ctrlMode : str
-            'voltage' or 'current'
-        voltage : float
-            Voltage value in kV
-        current : float
-            Current value in mA
+        lastReading : HvReading
+            New reading of the HV status
         '''
 
-        # Construct the S commmand
-        # Voltage and current are given in % of MAX_VALUE
-        voltHex = round(voltToSet * self.MAX_HEX_VAL_SENT / self.MAX_VOLTAGE)
-        curHex = round(curToSet * self.MAX_HEX_VAL_SENT / self.MAX_CURENT)
-
-        # "%0.3X" % voltHex for 3 digit uppercase hex value
-        if digitContr == 'off':
-            cmd = 'S' + "%0.3X" % voltHex + "%0.3X" % curHex + '0000001'
-        elif digitContr == 'on':
-            cmd = 'S' + "%0.3X" % voltHex + "%0.3X" % curHex + '0000002'
-        elif digitContr == 'reset':
-            cmd = 'S' + "%0.3X" % 0 + "%0.3X" % 0 + '0000004'
-
-        cmdToSend = self._encodeCommand(cmd)
-        answer = self._sendCommand(cmdToSend, readTI=0.5)
+        cmdToSend, kind, voltage = self._setCommand(voltToSet, curToSet,
+                                                    digitContr, trim)
+        answer = self._sendSet(cmdToSend, kind, voltage, curToSet)
+        self._setAnswered(answer, voltToSet, curToSet, digitContr, trim)
 
         # Handle the answer
         if verbosity:
-            if answer == b'A':
-                return ("The set command sent succesfully: {} V, {} mA "
-                        .format(voltToSet, curToSet))
-            else:
-                return ("Set command has failed \n Returned answer: {}"
-                        .format(answer))
+            return self._setMessage(answer, voltToSet, curToSet)
 
         # update of the HV status values
-        self.queryHV()
+        return self.queryHV()
+
+    def _setCommand(self, voltToSet, curToSet, digitContr, trim=0):
+        '''
+        Prepare a S command, see setHV
+
+        Returns
+        -------
+        cmdToSend : bytes
+            Encoded S command, see _setFrame()
+        kind : str
+            Kind of the command in the telemetry
+        voltage : float
+            Voltage set with the trim in kV
+        '''
+        cmdToSend = self._setFrame(voltToSet, curToSet, digitContr, trim)
+        kind = 'set' if digitContr == 'on' else digitContr
+        trimVoltage = trim * self.MAX_VOLTAGE / self.MAX_HEX_VAL_SENT
+        return cmdToSend, kind, voltToSet + trimVoltage
+
+    def _setAnswered(self, answer, voltToSet, curToSet, digitContr, trim=0):
+        ''' Keep the setpoint and the trim of an accepted S command '''
+        if answer == b'A':
+            self.setpoint = (voltToSet, curToSet, digitContr)
+            self.trim = trim
+
+    def _setFrame(self, voltToSet, curToSet, digitContr, trim=0):
+        '''
+        HV controller method to encode a S command
+
+        Parameters
+        ----------
+        voltToSet, curToSet, digitContr, trim : see setHV
+
+        Returns
+        -------
+        Command : bytes
+            Encoded S command, from the frame cache if already encoded
+        '''
+        if digitContr == 'reset':
+            key = (0, 0, digitContr)
+        else:
+            # Voltage and current are given in % of MAX_VALUE
+            voltCounts = round(voltToSet * self.MAX_HEX_VAL_SENT
+                               / self.MAX_VOLTAGE) + trim
+            key = (min(max(voltCounts, 0), self.MAX_HEX_VAL_SENT),
+                   round(curToSet * self.MAX_HEX_VAL_SENT / self.MAX_CURENT),
+                   digitContr)
+
+        frame = self._frameCache.get(key)
+        if frame is not None:
+            self.frameCacheHits += 1
+            self._frameCache.move_to_end(key)
+            return frame
+
+        self.frameCacheMisses += 1
+        frame = codec.encodeSet(*key)
+        self._frameCache[key] = frame
+        if len(self._frameCache) > self.FRAME_CACHE_SIZE:
+            self._frameCache.popitem(last=False)
+        return frame
+
+    def sendSetFrame(self, frame):
+        '''
+        HV controller method to send a S command encoded beforehand
+
+        Used to run the schedules of program.compileProgram(), whose
+        frames are encoded before the program starts.
+
+        Parameters
+        ----------
+        frame : bytes
+            Encoded S command, with the SOH and CR characters
+
+        Returns
+        -------
+        Answer : bytes
+            b'A' if the command was accepted
+        '''
+        scale = self.MAX_HEX_VAL_SENT
+        voltage = int(frame[2:5], 16) * self.MAX_VOLTAGE / scale
+        current = int(frame[5:8], 16) * self.MAX_CURENT / scale
+        answer = self._sendSet(frame, 'program', voltage, current)
+        if answer == b'A':
+            self.setpoint = (voltage, current, 'on')
+            self.trim = 0
+        return answer
+
+    def restoreSetpoint(self, verbosity=False, trim=None):
+        '''
+        HV controller method to send the last accepted S command again
+
+        Parameters
+        ----------
+        verbosity : bool
+            Set to True for verbose output
+        trim : int
+            Offset of the voltage in DAC counts (default None, the trim
+            of the last accepted S command)
+
+        Returns
+        -------
+        see setHV(), None if no S command was accepted yet
+        '''
+        if self.setpoint is None:
+            return None
+        if trim is None:
+            trim = self.trim
+        return self.setHV(*self.setpoint, verbosity=verbosity, trim=trim)
+
+    def _sendSet(self, cmdToSend, kind, voltage, current):
+        ''' Send a S command and record it in the telemetry, if any '''
+        try:
+            answer = self._sendCommand(cmdToSend, readTI=0.5)
+        except HvError as err:
+            self._recordSet(kind, voltage, current, 'E{}'.format(err.code))
+            raise
+        self._recordSet(kind, voltage, current,
+                        answer.decode('ascii', 'replace'))
+        return answer
+
+    def _recordSet(self, kind, voltage, current, answer):
+        ''' Record a S command and its answer in the telemetry, if any '''
+        if self.telemetry is not None:
+            self.telemetry.command(self.device.port, kind, voltage, current,
+                                   answer)
+
+    @staticmethod
+    def _setMessage(answer, voltToSet, curToSet):
+        ''' Return the verbose output of a S command from its answer '''
+        if answer == b'A':
+            return ("The set command sent succesfully: {} V, {} mA "
+                    .format(voltToSet, curToSet))
+        else:
+            return ("Set command has failed \n Returned answer: {}"
+                    .format(answer))
 
     def version(self):
         '''
@@ -221,9 +493,8 @@ class HvController():
 
         '''
 
-        cmdToSend = self._encodeCommand('V')
-        answer = self._sendCommand(cmdToSend)
-        checksum.checkChecksum(answer)
+        answer = self._sendCommand(codec.VERSION_FRAME)
+        self._checkChecksum(answer)
         return ("The firmware version is: {}"
                 .format(answer[1:-2].decode()))
 
@@ -243,19 +514,14 @@ class HvController():
         -------
         Output : str
             Return str succes or failed if verbosity set to True
+        reading : HvReading
+            Return the reading of the query made after the execution
+            otherwise
 
         Updated values by a query after the execution
         ---------------------------------------------
-        hvOn : bool
-            True if HV is on
-        fault : bool
-            True if HV is faulty
-        ctrlMode : str
-            'voltage' or 'current'
-        voltage : float
-            Voltage value in kV
-        current : float
-            Current value in mA
+        lastReading : HvReading
+            New reading of the HV status
 
         '''
 
@@ -285,7 +551,7 @@ class HvController():
 
         '''
         if timeoutMode == "enable":
-            configCmd = self._encodeCommand('C0')
+            configCmd = codec.CONFIG_FRAMES['enable']
             answer = self._sendCommand(configCmd)
             if answer is b'A':
                 print("The timeout has been enabled")
@@ -293,7 +559,7 @@ class HvController():
                 print(answer)
 
         elif timeoutMode == "disable":
-            configCmd = self._encodeCommand('C1')
+            configCmd = codec.CONFIG_FRAMES['disable']
             answer = self._sendCommand(configCmd)
             if answer is b'A':
                 print("The timeout has been disabled")
@@ -309,21 +575,88 @@ class HvController():
         cmdToSend : bytes
             Format b'\\\\x01XXXXXXX\\\\x0D'
         readTI : float
-            Timeout for read method (default 0.1 s)
+            Timeout for read method (default 0.1 s). In framed read mode
+            it is only the upper deadline for the answer to arrive.
         Returns
         -------
         Answer : bytes
             return the answer received in bytes
 
+        Raises
+        ------
+        HvError
+            If the HV answers with an error code
+
         '''
         self.device.read_all()
+        sent = time.monotonic()
+        start = time.perf_counter()
         self.device.write(cmdToSend)
-        time.sleep(readTI)
-        answer = self.device.read_all().strip(b'\r')
-        if answer.startswith(b'E'):
-            self._handleError(answer)
+        if self.framedRead:
+            answer = self._readFrame(readTI)
         else:
-            return answer
+            time.sleep(readTI)
+            answer = self.device.read_all()
+        if self.metrics is not None:
+            self.metrics.transaction(cmdToSend, answer,
+                                     time.perf_counter() - start)
+        answer = answer.strip(b'\r')
+        if answer.startswith(b'E'):
+            self._raiseError(answer)
+        if answer:
+            self.lastTransaction = sent
+        return answer
+
+    def _checkChecksum(self, answer):
+        ''' Check the checksum of an answer and count the failures '''
+        valid = checksum.checkChecksum(answer)
+        if not valid and self.metrics is not None:
+            self.metrics.checksumFailures.inc()
+        return valid
+
+    def _raiseError(self, errorMes):
+        '''
+        Count, log and raise an error answer of the HV
+
+        Parameters
+        ----------
+        errorMes : bytes
+            Error message stripped for b'\\\\r'
+
+        Raises
+        ------
+        HvError
+            Always
+        '''
+        if self.metrics is not None:
+            self.metrics.error(errorMes)
+        message = self._handleErrors(errorMes)
+        self.logger.warning(message)
+        raise HvError(int(errorMes[1:2] or 0), message)
+
+    def _readFrame(self, readTI):
+        '''
+        HV controller method to read an answer framed by the CR character
+
+        Return as soon as the CR terminator is received instead of
+        waiting for a fixed time, so the round-trip only lasts the time
+        needed on the wire.
+
+        Parameters
+        ----------
+        readTI : float
+            Upper deadline for the answer to arrive
+
+        Returns
+        -------
+        Answer : bytes
+            Bytes received up to and including the CR terminator, or
+            whatever arrived before the deadline
+        '''
+        # Changing the timeout reconfigures the port, only do it if needed
+        if self.device.timeout != readTI:
+            self.device.timeout = readTI
+        return self.device.read_until(b'\r')
 
     def _encodeCommand(self, cmd):
         '''
@@ -344,10 +677,9 @@ class HvController():
             Return the command bytes (e.g. b'\\\\x01Q051\\\\x0D')
 
         '''
-        csum = checksum.calculateChksum(cmd)
-        cmdToSend = b'\x01' + bytes(cmd, 'ascii') + csum + b'\x0D'
+        cmd = cmd.encode('ascii')
 
-        return cmdToSend
+        return codec.SOH + cmd + checksum.calculateChksum(cmd) + codec.CR
 
     def _handleErrors(self, errorMes):
         '''
@@ -363,10 +695,6 @@ class HvController():
         message : str
             Return the error message
 
-        Note
-        ----
-        Not in use in the current version
-
         '''
         errorKey = int(errorMes.lstrip(b'E').decode('ascii')[0])
         errorDict = {1: "Undefined Command Code",
@@ -18,22 +18,27 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import os
 import sys
+import argparse
+import functools
 import logging
-import datetime
-import webbrowser
-from PyQt5 import QtWidgets, QtCore, QtGui
+from PyQt5 import QtWidgets, QtCore
 
 import serial
-from serial.tools import list_ports
 
 import HvGUI
 import HvController as hv
+import HvRack
+import console
+import logwriter
+import metrics
+import program
+import statusview
+import stripchart
+import telemetry
 import workers
 
-ICON_RED_LED = ":/icons/led-red-on.png"
-ICON_GREEN_LED = ":/icons/green-led-on.png"
-
 
 class MainWindow(QtWidgets.QMainWindow, HvGUI.Ui_MainWindow):
     '''
@@ -43,68 +48,103 @@ class MainWindow(QtWidgets.QMainWindow, HvGUI.Ui_MainWindow):
     Glassman remotely through a graphical user interface. It was
     developped for use with a FJ model +40kV 3.0 mA.
 
-    It makes use of QRunnables and QThreadPool for running small
-    repetitive opperations without freezing the GUI. It also makes
-    extensive use of PyQt signal and slot design for communication
-    between threads.
+    Several HV devices can be opened at once, each one on its own
+    serial port: they are listed in the supplies table and the control
+    panel acts on the selected one.
+
+    All the communication with a HV device is done in a dedicated
+    acquisition thread, which performs the keep-alive query and runs
+    the commands from the GUI, so the GUI is never frozen by the serial
+    port. It also makes extensive use of PyQt signal and slot design for
+    communication between threads. The readings are rendered by a
+    StatusView, at most once per screen refresh and only in the widgets
+    whose value changed. The command outputs are shown in a bounded
+    CommandConsole, filtered by command type and severity, and the
+    history of the selected device is plotted in a StripChart. The HV
+    programs are run by the acquisition thread of their device, which
+    also checks the stability of the voltage at every reading.
+
+    Parameters
+    ----------
+    metricsPort : int
+        Local TCP port serving the communication metrics in the
+        Prometheus text format (default None, not served)
+    telemetryFormat : str
+        Format of the telemetry files of the queries and commands,
+        'csv' or 'parquet', see telemetry.TelemetrySink (default 'csv',
+        None for no telemetry)
+    maxTrim : int
+        Maximum trim of the voltage setpoint by the setpoint corrections
+        in DAC counts (default 0, no trim)
 
     '''
 
-    def __init__(self, parent=None):
+    def __init__(self, parent=None, metricsPort=None,
+                 telemetryFormat='csv', maxTrim=0):
         super(MainWindow, self).__init__(parent)
         self.setupUi(self)
 
-        # Setup application logger
+        # Setup application logger: the records are written to a
+        # rotating file by a writer thread, never from the GUI thread
         self.logger = logging.getLogger('hvController')
         self.logger.setLevel(logging.INFO)
-        # create file handler which logs info messages
-        fh = logging.FileHandler('hvCtrl.log', mode='w')
-        fh.setLevel(logging.INFO)
-        # create formatter and add it to the handler
-        formatter = logging.Formatter(
-                '%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-        fh.setFormatter(formatter)
-        # add the handler to the logger
-        self.logger.addHandler(fh)
-
-        self.hvdevice = hv.HvController()
-        self.querytimer = QtCore.QTimer()
+        self.logWriter = logwriter.setupLogging(self.logger, 'hvCtrl.log')
+
+        self.telemetry = None
+        if telemetryFormat is not None:
+            try:
+                self.telemetry = telemetry.TelemetrySink(
+                        '.', telemetryFormat)
+            except ImportError:
+                self.logger.warning('pyarrow is not installed, telemetry '
+                                    'written in CSV')
+                self.telemetry = telemetry.TelemetrySink('.', 'csv')
+        self.rack = HvRack.HvRack(logDir='.', telemetry=self.telemetry,
+                                  maxTrim=maxTrim)
+        self.rack.reading.connect(self.updateStatus)
+        self.rack.error.connect(self.keepAliveFailed)
+        self.rack.closed.connect(self.portClosed)
+        self.rack.programEnded.connect(self.programEnded)
+        self.rack.stabilityChanged.connect(self.stabilityChanged)
+        self.rack.setpointCorrected.connect(self.setpointCorrected)
+        self.activePort = None
+        self.statusView = statusview.StatusView(self, lambda: self.activePort,
+                                                parent=self)
+        self.console = console.CommandConsole(self.cmdOutText, parent=self)
+        self.chart = stripchart.StripChart(
+                self.prgVoltGraph, maxVoltage=hv.HvController.MAX_VOLTAGE,
+                maxCurrent=hv.HvController.MAX_CURENT, band=self.rack.band,
+                parent=self)
+        self.metricsServer = None
+        if metricsPort is not None:
+            self.metricsServer = metrics.MetricsServer(metricsPort)
+            self.metricsServer.start()
         self.checktimer = QtCore.QTimer()
         self.setupTimers()
-        self.threadpool = QtCore.QThreadPool()
         self._setupUiDesign()
-
-        # Extract some useful values from the GUI
-        self.targetHV = self.voltValueToSet.value()
-        self.targetI = self.curValueToSet.value()
         # TODO : add settings for saving preferences
 
     def _setupUiDesign(self):
         '''Prepare the initial desgin of the GUI. '''
-        self.voltValueToSet.setMaximum(self.hvdevice.MAX_VOLTAGE)
-        self.curValueToSet.setMaximum(self.hvdevice.MAX_CURENT)
+        self.voltValueToSet.setMaximum(hv.HvController.MAX_VOLTAGE)
+        self.curValueToSet.setMaximum(hv.HvController.MAX_CURENT)
         self.disableAll()
-        for name, desc, add in sorted(list_ports.comports()):
-            self.prtList.addItem(name)
-        # Put COM4 port as default: adapt to workstation or improve
-        # and implement with QSettings
-        if self.prtList.findText('COM4') >= 0:
-            self.prtList.setCurrentIndex(self.prtList.findText('COM4'))
+        # The serial ports are listed in the background and added to
+        # prtList as they are found, once the window is shown
+        self.portScanner = workers.PortScanner(self)
+        self.portScanner.portFound.connect(self.portFound)
+        QtWidgets.QApplication.instance().aboutToQuit.connect(
+                self.portScanner.wait)
+        self.portScanner.start()
 
     def setupTimers(self):
-        '''Configure the timers for query and stability check'''
-        # The Glassman HV has a communication timeout of 1.5 s
-        # so we perform a query every 500 ms
-        self.querytimer.setInterval(500)
-        self.querytimer.timeout.connect(self.hvdevice.queryHV)
-        self.querytimer.timeout.connect(self.updateStatus)
-
-        self.checktimer.setInterval(60000)  # can be changed to longer
+        '''Configure the timer of the stability summary'''
+        # The keep-alive queries are scheduled by the acquisition
+        # thread (the Glassman HV has a communication timeout of 1.5 s),
+        # which also checks the stability at every reading
+        self.checktimer.setInterval(600000)  # can be changed to longer
         self.checktimer.timeout.connect(self.checkStability)
 
-        self.now = datetime.datetime.today()
-        self.lastEntryTime = datetime.datetime.today()
-
     # ---------------- Slots --------------
     # define here pyqtslot using connectSlotsByName() convention
     @QtCore.pyqtSlot()
@@ -120,112 +160,174 @@ class MainWindow(QtWidgets.QMainWindow, HvGUI.Ui_MainWindow):
 
     @QtCore.pyqtSlot()
     def on_actionHV_firmware_version_triggered(self):
-        if self.hvdevice.device.is_open:
-            message = self.hvdevice.version()
-            self.showMessage(message)
+        if self.activePort is not None:
+            versionWk = workers.HvWorker(
+                    self.rack.controllers[self.activePort].version)
+            versionWk.signals.output.connect(self.showMessage)
+            self.rack.submit(self.activePort, versionWk,
+                             workers.PRIORITY_POLL, key='version')
         else:
             self.showMessage('The device COM port should be open'
                              ' to get the firmware version.'
                              '\nOpen the port and try again.')
 
+    @QtCore.pyqtSlot()
+    def on_actionMetrics_triggered(self):
+        self.showMessage(self._metricsSummary())
+
     @QtCore.pyqtSlot()
     def on_actionOnline_documentation_triggered(self):
+        import webbrowser
         webbrowser.open('https://github.com/avancra/HvControllerGUI')
 
     @QtCore.pyqtSlot()
     def on_prtOpenBtn_clicked(self):
         '''
-        Open the selected port and instantiate an HV controller
+        Open the selected port and add its HV device to the rack
 
         Get the port from the GUI, open it and init the hv controler.
-        If success, start a timer which will query the HV every 0.5s.
+        If success, start the acquisition thread which will query the HV
+        within its watchdog timeout and select the new device in the
+        supplies table.
         '''
-        # ??? : check for opened port and close it
         portName = self.prtList.currentText()
+        if portName in self.rack.controllers:
+            self.rackTable.selectRow(self._rackRow(portName))
+            return
 
         try:
-            self.hvdevice.openPortHV(portName)
+            self.rack.openPort(portName)
         except serial.SerialException:
             QtWidgets.QMessageBox.warning(
                     self, 'HV ctrl',
                     'Serial Exception: could not open the {} port'
                     .format(portName))
+        except ValueError as err:
+            QtWidgets.QMessageBox.warning(self, 'HV ctrl', str(err))
         else:
-            self.querytimer.start()
+            self._addRackRow(portName)
             self.checktimer.start()
             self.enableAll()
-            self.prtList.setEnabled(False)
-            self.prtOpenBtn.setEnabled(False)
-            self.updateStatus()
 
     @QtCore.pyqtSlot()
     def on_prtCloseBtn_clicked(self):
-        ''' Close the current port and disable the GUI widget once closed '''
+        ''' Close the port of the selected HV device '''
 
-        self.querytimer.stop()
-        try:
-            output = self.hvdevice.closePortHV()
-        except serial.SerialException:
-            QtWidgets.QMessageBox.warning(
-                    self, 'HV ctrl',
-                    '''Serial Exception: could not close the {} port'''
-                    .format(self.hvdevice.device.port))
+        closeWk = workers.HvWorker(
+                self.rack.controllers[self.activePort].closePortHV)
+        self._connectOutput(closeWk, console.PORT)
+        closeWk.signals.error.connect(
+                functools.partial(self.closeFailed, self.activePort))
+
+        self.rack.closePort(self.activePort, closeWk)
+
+    @QtCore.pyqtSlot()
+    def on_rackTable_itemSelectionChanged(self):
+        ''' Make the selected HV device the one of the control panel '''
+        row = self.rackTable.currentRow()
+        if row < 0:
+            return
+        self.activePort = self.rackTable.item(row, 0).text()
+        state = self.rack.states[self.activePort]
+        self.voltValueToSet.setValue(state.targetHV)
+        self.curValueToSet.setValue(state.targetI)
+        self.chart.setDevice(state)
+        self._updateProgramButtons()
+        if state.reading is not None:
+            self.updateStatus(self.activePort, state.reading)
+            self.statusView.flush()
+
+    @QtCore.pyqtSlot()
+    def on_prgSelectBtn_clicked(self):
+        ''' Select the file of the HV program to run '''
+        path, _ = QtWidgets.QFileDialog.getOpenFileName(
+                self, 'Select a HV program', self.prgFilenameLineEdit.text(),
+                'HV programs (*.txt *.csv);;All files (*)')
+        if path:
+            self.prgFilenameLineEdit.setText(path)
+
+    @QtCore.pyqtSlot()
+    def on_prgStartBtn_clicked(self):
+        '''
+        Start, pause or resume the HV program of the selected device
+
+        The program file is loaded and compiled into S commands before
+        the start, then run by the acquisition thread of the device.
+        '''
+        state = self.rack.states[self.activePort]
+        if state.program is None:
+            path = self.prgFilenameLineEdit.text()
+            try:
+                schedule = program.compileProgram(
+                        program.loadProgram(path),
+                        hv.HvController.MAX_VOLTAGE,
+                        hv.HvController.MAX_CURENT,
+                        hv.HvController.MAX_HEX_VAL_SENT,
+                        startVoltage=(state.reading or hv.NO_READING).voltage)
+            except (OSError, ValueError) as err:
+                QtWidgets.QMessageBox.warning(
+                        self, 'HV ctrl',
+                        'Could not load the program {}:\n{}'
+                        .format(path, err))
+                return
+            self.rack.startProgram(
+                    self.activePort,
+                    program.ProgramRun(schedule, os.path.basename(path)),
+                    self._programOutput)
         else:
-            self.prtList.setEnabled(True)
-            self.prtOpenBtn.setEnabled(True)
-            self.disableAll()
-            self.cmdOutText.append(output)
+            self.rack.pauseProgram(self.activePort, not state.programPaused,
+                                   self._programOutput)
+        self._updateProgramButtons()
+
+    @QtCore.pyqtSlot()
+    def on_prgStopBtn_clicked(self):
+        ''' Stop the HV program of the selected device '''
+        self.rack.stopProgram(self.activePort, self._programOutput)
+
+    @QtCore.pyqtSlot(bool)
+    def on_prgPlotVoltBtn_toggled(self, checked):
+        ''' Start or stop plotting the history of the selected device '''
+        if checked:
+            self.chart.start()
+        else:
+            self.chart.stop()
 
     @QtCore.pyqtSlot()
     def on_queryBtn_clicked(self):
         '''
-        Method to launch the query thread worker through the threadpool
+        Method to queue the query worker in the acquisition thread
 
         Keyword arguments
         -----------------
         verbosity : bool
         '''
 
-        queryWk = workers.HvWorker(self.hvdevice.queryHV)
+        queryWk = workers.HvWorker(
+                self.rack.controllers[self.activePort].queryHV)
         queryWk.kwargs['verbosity'] = True
-        queryWk.signals.output.connect(self.printOutput)
-        queryWk.signals.done.connect(self.updateStatus)
-        queryWk.signals.done.connect(self.querytimer.start)
+        self._connectOutput(queryWk, console.QUERY)
 
-        self.querytimer.stop()
-        self.threadpool.start(queryWk)
+        self.rack.submit(self.activePort, queryWk, workers.PRIORITY_POLL,
+                         key='query')
 
     @QtCore.pyqtSlot()
     def on_setBtn_clicked(self):
         '''
-        Method to launch the set HV thread worker through the threadpool
-
-        Keyword arguments
-        -----------------
-        voltToSet : float
-            voltage
-        curToSet : float
-            current
-        verbosity : bool
+        Set the selected HV device to the values of the GUI
         '''
-        self.targetHV = round(self.voltValueToSet.value(), 2)
-        self.targetI = round(self.curValueToSet.value(), 2)
-        setWk = workers.HvWorker(self.hvdevice.setHV)
-        setWk.kwargs['voltToSet'] = self.targetHV
-        setWk.kwargs['curToSet'] = self.targetI
-        setWk.kwargs['verbosity'] = True
-
-        setWk.signals.done.connect(self.updateStatus)
-        setWk.signals.done.connect(self.querytimer.start)
-        setWk.signals.output.connect(self.printOutput)
-
-        self.querytimer.stop()
-        self.threadpool.start(setWk)
+        state = self.rack.states[self.activePort]
+        state.targetHV = round(self.voltValueToSet.value(), 2)
+        state.targetI = round(self.curValueToSet.value(), 2)
+        self.submitSet(self.activePort)
 
     @QtCore.pyqtSlot()
     def on_resetBtn_clicked(self):
         '''
-        Method to launch the reset HV thread worker through the threadpool
+        Method to queue the reset HV worker in the acquisition thread
+
+        The reset jumps ahead of the other queued commands of the device
+        and drops its pending set commands. The program of the device is
+        stopped first.
 
         Keyword arguments
         -----------------
@@ -233,105 +335,362 @@ class MainWindow(QtWidgets.QMainWindow, HvGUI.Ui_MainWindow):
         '''
         self.voltValueToSet.setValue(0.0)
         self.curValueToSet.setValue(0.0)
-        self.targetHV = 0.0
-        self.targetI = 0.0
-
-        resetWK = workers.HvWorker(self.hvdevice.resetHV)
+        state = self.rack.states[self.activePort]
+        state.targetHV = 0.0
+        state.targetI = 0.0
+        if state.program is not None:
+            self.on_prgStopBtn_clicked()
+
+        resetWK = workers.HvWorker(
+                self.rack.controllers[self.activePort].resetHV)
         resetWK.kwargs['verbosity'] = True
+        self._connectOutput(resetWK, console.RESET)
 
-        resetWK.signals.done.connect(self.updateStatus)
-        resetWK.signals.done.connect(self.querytimer.start)
-        resetWK.signals.output.connect(self.printOutput)
-
-        self.querytimer.stop()
-        self.threadpool.start(resetWK)
+        self.rack.submit(self.activePort, resetWK, workers.PRIORITY_RESET,
+                         key='reset')
 
     @QtCore.pyqtSlot()
     def on_actionExit_triggered(self):
-        self.querytimer.stop()
+        self.portScanner.wait()
         self.checktimer.stop()
-        if self.hvdevice.device.is_open:
-            self.hvdevice.closePortHV()
+        self.chart.stop()
+        self.rack.closeAll()
+        if self.telemetry is not None:
+            self.telemetry.close()
+        if self.metricsServer is not None:
+            self.metricsServer.stop()
+        self.logger.removeHandler(self.logWriter.queueHandler)
+        self.logWriter.stop()
         self.close()
 
     # ---------------- Other slots --------------
     # define here other pyqtslots
-    @QtCore.pyqtSlot()
-    def updateStatus(self):
+    @QtCore.pyqtSlot(str)
+    def portFound(self, name):
+        '''
+        Add a serial port found by the port scanner to the port list
+
+        The list is kept sorted and the COM4 port selected when found.
+
+        Parameters
+        ----------
+        name : str
+            Device name of the serial port
+        '''
+        if self.prtList.findText(name) >= 0:
+            return
+        index = 0
+        while (index < self.prtList.count()
+               and self.prtList.itemText(index) < name):
+            index += 1
+        self.prtList.insertItem(index, name)
+        # Put COM4 port as default: adapt to workstation or improve
+        # and implement with QSettings
+        if name == 'COM4':
+            self.prtList.setCurrentIndex(index)
+
+    @QtCore.pyqtSlot(str, object)
+    def updateStatus(self, port, reading):
         '''
         Update the values/icons of the GUI corresponding to the HV status
 
-        Updated values
-        --------------
-        hvOn : bool
-            True if HV is on
-        fault : bool
-            True if HV is faulty
-        ctrlMode : str
-            'voltage' or 'current'
-        voltage : float
-            Voltage value in kV
-        current : float
-            Current value in mA
-        '''
-
-        self.voltValueRead.display(self.hvdevice.voltage)
-        self.curValueRead.display(self.hvdevice.current)
-        if self.hvdevice.ctrlMode == "voltage":
-            self.ctrlModeVoltBtn.setChecked(True)
-        elif self.hvdevice.ctrlMode == "current":
-            self.ctrlModeCurBtn.setChecked(True)
-
-        if self.hvdevice.hvOn is True:
-            self.hvOnLed.setPixmap(QtGui.QPixmap(ICON_GREEN_LED))
-        elif self.hvdevice.hvOn is False:
-            self.hvOnLed.setPixmap(QtGui.QPixmap(ICON_RED_LED))
-        else:
-            self.hvOnLed.setEnabled(False)
+        The row of the device in the supplies table is always updated,
+        the control panel only if the device is the selected one. The
+        update is done by the StatusView at the next screen refresh.
 
-        if self.hvdevice.fault is True:
-            self.faultLed.setPixmap(QtGui.QPixmap(ICON_RED_LED))
-        else:
-            self.faultLed.setEnabled(False)
+        Parameters
+        ----------
+        port : str
+            Port name of the HV device
+        reading : HvReading
+            Snapshot of the HV status emitted by the acquisition thread
+        '''
+        self.statusView.update(port, reading)
 
-    @QtCore.pyqtSlot(str)
-    def printOutput(self, s):
+    @QtCore.pyqtSlot(str, str)
+    def printOutput(self, command, s):
         '''
-        Append command outputs to the text box of the GUI
+        Append command outputs to the console of the GUI
 
         Parameters
         ----------
+        command : str
+            Command type, one of console.COMMANDS
         s : str
-            emitted via threadpool threads
+            emitted by the acquisition thread workers
+        '''
+        severity = logging.WARNING if 'failed' in s else logging.INFO
+        self.console.append(s, command, severity)
+
+    @QtCore.pyqtSlot(str, tuple)
+    def printError(self, command, error):
+        '''
+        Append the error of a failed command to the console
+
+        Parameters
+        ----------
+        command : str
+            Command type, one of console.COMMANDS
+        error : tuple
+            (exctype, value, traceback) emitted by the acquisition thread
+        '''
+        self.console.append('The {} command has failed: {}'
+                            .format(command, error[1]), command, logging.ERROR)
+
+    @QtCore.pyqtSlot(str, tuple)
+    def keepAliveFailed(self, port, error):
         '''
-        self.cmdOutText.append(s)
+        Append the error of a failed keep-alive query to the console
+
+        Parameters
+        ----------
+        port : str
+            Port name of the HV device
+        error : tuple
+            (exctype, value, traceback) emitted by the acquisition thread
+        '''
+        self.console.append('Query failed on {}: {}'.format(port, error[1]),
+                            console.KEEPALIVE, logging.ERROR)
+
+    @QtCore.pyqtSlot(int)
+    def on_outCommandFilter_currentIndexChanged(self, index):
+        ''' Only show the outputs of the selected command type '''
+        self.console.setFilter(
+                None if index <= 0 else [console.COMMANDS[index - 1]],
+                self.console.minSeverity)
+
+    @QtCore.pyqtSlot(int)
+    def on_outSeverityFilter_currentIndexChanged(self, index):
+        ''' Only show the outputs of the selected severity and above '''
+        self.console.setFilter(self.console.commands,
+                               console.SEVERITIES[max(index, 0)])
+
+    @QtCore.pyqtSlot(str)
+    def portClosed(self, port):
+        ''' Remove the HV device from the supplies table once closed '''
+        self.statusView.forget(port)
+        row = self._rackRow(port)
+        if row >= 0:
+            self.rackTable.removeRow(row)
+        if port == self.activePort:
+            self.activePort = None
+            if self.rackTable.rowCount() > 0:
+                self.rackTable.selectRow(0)
+        if self.activePort is None:
+            self.checktimer.stop()
+            self.chart.setDevice(None)
+            self.disableAll()
+
+    def closeFailed(self, port, error):
+        ''' Warn the user that the port could not be closed '''
+        QtWidgets.QMessageBox.warning(
+                self, 'HV ctrl',
+                'Could not close the {} port, try again.\n{}: {}'
+                .format(port, error[0].__name__, error[1]))
 
     @QtCore.pyqtSlot()
     def checkStability(self):
-        ''' Check if the voltage is within a 0.2 V from the targetted one '''
-        delta = 0.2
-        if (self.targetHV-delta < self.hvdevice.voltage < self.targetHV+delta):
-            # if last log entry more than 1min:
-            self.makeLogEntry('HV stability ok: %.2f',
-                              value=self.hvdevice.voltage, level='info')
+        '''
+        Log the stability statistics of the devices
+
+        The statistics of the longest window of the stability monitor of
+        each device, updated by its acquisition thread at every reading,
+        are logged every 10 minutes. The devices running a program are
+        not logged.
+        '''
+        for port, state in list(self.rack.states.items()):
+            if state.monitor is None or state.program is not None:
+                continue
+            summary = state.monitor.summaries[-1]
+            if summary.count == 0:
+                continue
+            level = logging.INFO if state.stable else logging.WARNING
+            self.logger.log(level, 'HV stability %s on %s over %.0f s: mean '
+                            '%.3f kV, std %.3f kV, min %.3f kV, max %.3f kV, '
+                            'drift %.3f kV/h', 'ok' if state.stable
+                            else 'fails', port, summary.window, summary.mean,
+                            summary.std, summary.min, summary.max,
+                            3600 * summary.slope)
+
+    @QtCore.pyqtSlot(str, object)
+    def stabilityChanged(self, port, event):
+        '''
+        Report a change of the stability of a device
+
+        The violations of the band, whose setpoint is corrected by the
+        acquisition thread of the device, and the returns in the band
+        are logged.
+
+        Parameters
+        ----------
+        port : str
+            Port name of the HV device
+        event : StabilityEvent
+            Change of the stability, with the statistics of the shortest
+            window
+        '''
+        summary = event.summary
+        if event.kind == 'violation':
+            message = ('HV stability fails on {}: {:.2f} kV for {:.1f} s, '
+                       'target {:.2f} kV (mean {:.3f} kV, std {:.3f} kV over '
+                       '{:.0f} s)'.format(port, event.voltage, event.duration,
+                                          event.target, summary.mean,
+                                          summary.std, summary.window))
+            self.logger.warning(message)
+            self.console.append(message, console.STABILITY, logging.WARNING)
+            if self.rack.correct:
+                self.logger.warning('Try to return to target value...  %.2f',
+                                    event.target)
         else:
-            self.makeLogEntry('HV stability fails: %.2f',
-                              value=self.hvdevice.voltage, level='warning')
-            self.makeLogEntry('Try to return to target value...  %.2f',
-                              value=self.targetHV, level='warning')
-            self.on_setBtn_clicked()
-            if (self.targetHV-delta < self.hvdevice.voltage < self.targetHV+delta):
-                self.makeLogEntry('HV back to target voltage: %.2f',
-                                  value=self.hvdevice.voltage, level='info')
-            else:
-                self.makeLogEntry('Tentative failed, voltage value: %.2f',
-                                  value=self.hvdevice.voltage, level='warning')
+            message = ('HV back to target voltage on {}: {:.2f} kV after '
+                       '{:.1f} s out of the band'.format(port, event.voltage,
+                                                         event.duration))
+            self.logger.info(message)
+            self.console.append(message, console.STABILITY)
+
+    @QtCore.pyqtSlot(str, object)
+    def setpointCorrected(self, port, step):
+        '''
+        Report the end of a correction of the setpoint of a device
 
-    @QtCore.pyqtSlot()
-    def programEnded(self):
-        QtWidgets.QMessageBox.warning(self, "Warning", "Thread is done")
+        Parameters
+        ----------
+        port : str
+            Port name of the HV device
+        step : CorrectionStep
+            Result of the correction, with its recovery time
+        '''
+        if step.kind == 'recovered':
+            message = ('HV back in the band on {} {:.2f} s after the start of '
+                       'the correction: {} setpoint(s) sent, trim {:+d} '
+                       'counts'.format(port, step.duration, step.attempts,
+                                       step.trim))
+            severity = logging.INFO
+        else:
+            message = ('Correction failed on {}: still out of the band {:.1f} '
+                       's after {} setpoint(s), trim {:+d} counts'
+                       .format(port, step.duration, step.attempts, step.trim))
+            severity = logging.ERROR
+        self.logger.log(severity, message)
+        self.console.append(message, console.STABILITY, severity)
+
+    @QtCore.pyqtSlot(str, object)
+    def programEnded(self, port, run):
+        '''
+        Report the end of the program of a device in the console
+
+        Parameters
+        ----------
+        port : str
+            Port name of the HV device
+        run : ProgramRun
+            Program done, stopped or failed, with its achieved timing
+        '''
+        severity = logging.INFO if run.error is None else logging.WARNING
+        self.console.append('{}: {}'.format(port, run.summary()),
+                            console.PROGRAM, severity)
+        if port == self.activePort:
+            self._updateProgramButtons()
 
     # --------------- Other class methods --------
+    def submitSet(self, port):
+        '''
+        Queue the set HV worker of a device in its acquisition thread
+
+        Keyword arguments
+        -----------------
+        voltToSet : float
+            target voltage of the device
+        curToSet : float
+            target current of the device
+        verbosity : bool
+        '''
+        state = self.rack.states[port]
+        setWk = workers.HvWorker(self.rack.controllers[port].setHV)
+        setWk.kwargs['voltToSet'] = state.targetHV
+        setWk.kwargs['curToSet'] = state.targetI
+        setWk.kwargs['verbosity'] = True
+
+        self._connectOutput(setWk, console.SET)
+
+        # only the latest setpoint of the device matters
+        self.rack.submit(port, setWk, workers.PRIORITY_SET, key='set')
+
+    def _connectOutput(self, worker, command):
+        ''' Show the output and the error of a worker in the console '''
+        worker.signals.output.connect(functools.partial(self.printOutput,
+                                                        command))
+        worker.signals.error.connect(functools.partial(self.printError,
+                                                       command))
+
+    def _programOutput(self, s):
+        ''' Show the output of a program command in the console '''
+        self.printOutput(console.PROGRAM, s)
+
+    def _updateProgramButtons(self):
+        ''' Show the program state of the selected device on the buttons '''
+        state = self.rack.states.get(self.activePort)
+        if state is None:
+            return
+        running = state.program is not None
+        self.prgSelectBtn.setEnabled(not running)
+        self.prgFilenameLineEdit.setEnabled(not running)
+        self.prgStartBtn.setEnabled(True)
+        self.prgStopBtn.setEnabled(running)
+        if not running:
+            self.prgStartBtn.setText('Start')
+        elif state.programPaused:
+            self.prgStartBtn.setText('Resume')
+        else:
+            self.prgStartBtn.setText('Pause')
+
+    def _addRackRow(self, port):
+        ''' Add a HV device to the supplies table and select it '''
+        row = self.rackTable.rowCount()
+        self.rackTable.insertRow(row)
+        self.rackTable.setItem(row, 0, QtWidgets.QTableWidgetItem(port))
+        for column in range(1, self.rackTable.columnCount()):
+            self.rackTable.setItem(row, column, QtWidgets.QTableWidgetItem())
+        self.rackTable.selectRow(row)
+
+    def _metricsSummary(self):
+        ''' Return the text summary of the communication metrics '''
+        snapshot = metrics.REGISTRY.snapshot()
+        lines = []
+        latency = snapshot.get('hv_command_latency_seconds',
+                               {'series': []})
+        for entry in latency['series']:
+            if entry['count']:
+                lines.append('{port} {command}: {count} commands, mean '
+                             '{mean:.1f} ms, p99 <= {p99:.0f} ms'.format(
+                                 mean=1e3 * entry['sum'] / entry['count'],
+                                 p99=1e3 * entry['p99'], count=entry['count'],
+                                 **entry['labels']))
+        for name, metric in sorted(snapshot.items()):
+            if metric['type'] != 'counter':
+                continue
+            for entry in metric['series']:
+                if entry['value']:
+                    labels = dict(entry['labels'])
+                    port = labels.pop('port', '')
+                    lines.append(' '.join([port, name] + list(labels.values()))
+                                 + ': {}'.format(entry['value']))
+        for port, acquisition in self.rack.acquisitions.items():
+            scheduler = acquisition.scheduler
+            if scheduler.minSlack is not None:
+                lines.append('{} keep-alive every {:.2f} s, watchdog slack '
+                             '{:.2f} s (min {:.2f} s)'.format(
+                                 port, scheduler.interval, scheduler.slack,
+                                 scheduler.minSlack))
+        if self.metricsServer is not None:
+            lines.append('\nServed on http://127.0.0.1:{}/metrics'
+                         .format(self.metricsServer.port))
+        return '\n'.join(lines) or 'No communication yet.'
+
+    def _rackRow(self, port):
+        ''' Return the row of a HV device in the supplies table, or -1 '''
+        return statusview.rackRow(self.rackTable, port)
+
     def disableAll(self):
         ''' Disable all the widgets for HV control of the GUI '''
 
@@ -346,8 +705,10 @@ class MainWindow(QtWidgets.QMainWindow, HvGUI.Ui_MainWindow):
         self.prgSelectBtn.setEnabled(False)
         self.prgStartBtn.setEnabled(False)
         self.prgStopBtn.setEnabled(False)
+        self.prgPlotVoltBtn.setChecked(False)
         self.prgPlotVoltBtn.setEnabled(False)
         self.prgFilenameLineEdit.setEnabled(False)
+        self.statusView.invalidate()
 
     def enableAll(self):
         ''' Enable all the widgets of the GUI for HV control '''
@@ -360,12 +721,9 @@ class MainWindow(QtWidgets.QMainWindow, HvGUI.Ui_MainWindow):
         self.faultLed.setEnabled(True)
         self.hvOnLed.setEnabled(True)
         self.prtCloseBtn.setEnabled(True)
-        # for future use when functionnality is implemented
-#        self.prgSelectBtn.setEnabled(True)
-#        self.prgStartBtn.setEnabled(True)
-#        self.prgStopBtn.setEnabled(True)
-#        self.prgPlotVoltBtn.setEnabled(True)
-#        self.prgFilenameLineEdit.setEnabled(True)
+        self.prgPlotVoltBtn.setEnabled(True)
+        self.statusView.invalidate()
+        self._updateProgramButtons()
 
     def showMessage(self, message):
         '''
@@ -388,47 +746,23 @@ class MainWindow(QtWidgets.QMainWindow, HvGUI.Ui_MainWindow):
         messageBox.raise_()
         messageBox.exec_()
 
-    def makeLogEntry(self, message, **kwargs):
-        '''
-        Make a new entry if the last one was done less than 10 min ago
-
-        Parameters
-        ---------
-        message : str
-            Message to print to the log file
-        kwargs : dict
-            keyword arguments
-
-        keyword arguments
-        -----------------
-        value : obj
-            Variable to log (type must match the format given in the message)
-        level : str
-            Level of the log entry (lower case)
-        '''
-
-        self.now = datetime.datetime.today()
-        dtime = self.now - self.lastEntryTime
-        if dtime.total_seconds()/60 > 10:
-            if kwargs['level'] == 'debug':
-                self.logger.debug(message, kwargs['value'])
-                self.lastEntryTime = self.now
-            elif kwargs['level'] == 'info':
-                self.logger.info(message, kwargs['value'])
-                self.lastEntryTime = self.now
-            elif kwargs['level'] == 'warning':
-                self.logger.warning(message, kwargs['value'])
-                self.lastEntryTime = self.now
-            elif kwargs['level'] == 'error':
-                self.logger.error(message, kwargs['value'])
-                self.lastEntryTime = self.now
-            elif kwargs['level'] == 'critical':
-                self.logger.critical(message, kwargs['value'])
-                self.lastEntryTime = self.now
-
-
 if __name__ == '__main__':
-    app = QtWidgets.QApplication(sys.argv)
-    form = MainWindow()
+    parser = argparse.ArgumentParser(description='HV controller GUI')
+    parser.add_argument('--metrics-port', type=int, default=None,
+                        help='serve the communication metrics in the '
+                             'Prometheus text format on this local port')
+    parser.add_argument('--max-trim', type=int, default=0,
+                        help='maximum trim of the voltage setpoint by the '
+                             'setpoint corrections in DAC counts (default 0)')
+    parser.add_argument('--telemetry', choices=('csv', 'parquet', 'off'),
+                        default='csv',
+                        help='format of the telemetry files of every query '
+                             'and command (default csv)')
+    args, qtArgs = parser.parse_known_args()
+    app = QtWidgets.QApplication(sys.argv[:1] + qtArgs)
+    form = MainWindow(metricsPort=args.metrics_port,
+                      telemetryFormat=(None if args.telemetry == 'off'
+                                       else args.telemetry),
+                      maxTrim=args.max_trim)
     form.show()
     app.exec()
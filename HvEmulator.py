@@ -0,0 +1,538 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the HvControllerGUI software.
+# The HvEmulator module emulates a Glassman FJ HV power supply, in
+# process or on pseudo-terminals, to run the software without hardware.
+#
+# Copyright 2018-2019 Aurélie Vancraeyenest
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import math
+import time
+import heapq
+import selectors
+import threading
+import collections
+
+import serial
+
+import checksum
+import codec
+
+# Digital control byte of the S command
+_DIGIT_OFF = ord('1')
+_DIGIT_ON = ord('2')
+_DIGIT_RESET = ord('4')
+_HEX = b'0123456789ABCDEFabcdef'
+
+
+class FjModel():
+    '''
+    Behaviour of a Glassman FJ power supply, independent of the transport
+
+    The model answers the Q, S, V and C commands with correct checksums,
+    or with the E1 to E6 error codes:
+
+       E1: undefined command code
+
+       E2: checksum error
+
+       E3: extra or missing byte(s)
+
+       E4: illegal digital control byte in a S command
+
+       E5: S command turning the HV on while a fault is active
+
+       E6: processing error (non hexadecimal set value)
+
+    The output voltage follows the set voltage with a first order
+    response of time constant settleTime, limited to a full scale ramp
+    in rampTime. The current is the one of a resistive load drawing
+    load times the full scale current at full scale voltage. When it
+    reaches the set current, the supply switches to current mode and
+    the voltage drops accordingly.
+
+    When the watchdog is enabled (the power-up default, C0 command) and
+    no valid command is received for WATCHDOG seconds while the HV is
+    on, the HV is turned off and the fault set, as with tripFault(). A
+    S command with the reset control byte clears the fault.
+
+    Parameters
+    ----------
+    rampTime : float
+        Time of a full scale voltage ramp in seconds (default 1 s)
+    settleTime : float
+        Time constant of the voltage response in seconds (default 0.1 s)
+    load : float
+        Current at full scale voltage, in full scale current (default
+        0.5)
+    version : str
+        Firmware version answered to the V command (default '12')
+    clock : callable
+        Time source in seconds (default time.monotonic)
+    '''
+
+    MAX_HEX_VAL_RECEIVE = 0x3FF
+    MAX_HEX_VAL_SENT = 0xFFF
+    WATCHDOG = 1.5
+
+    def __init__(self, rampTime=1.0, settleTime=0.1, load=0.5,
+                 version='12', clock=time.monotonic):
+        self.rampTime = rampTime
+        self.settleTime = settleTime
+        self.load = load
+        self.version = version.encode('ascii')
+        self.clock = clock
+        self.setVoltage = 0
+        self.setCurrent = 0
+        self.hvOn = False
+        self.fault = False
+        self.watchdogEnabled = True
+        self.commands = 0
+        self._output = 0.0
+        self._now = clock()
+        self._lastCommand = self._now
+        self._errors = collections.deque()
+
+    @property
+    def voltage(self):
+        ''' Output voltage in full scale fraction '''
+        return min(self._output, self._currentLimit())
+
+    @property
+    def current(self):
+        ''' Output current in full scale fraction '''
+        return self.voltage * self.load
+
+    @property
+    def currentMode(self):
+        ''' True if the output is limited by the set current '''
+        return self.hvOn and self._output > self._currentLimit()
+
+    def status(self):
+        ''' Return the status digit of the answer to the Q command '''
+        return (self.hvOn << 2) | (self.fault << 1) | self.currentMode
+
+    def tripFault(self):
+        ''' Turn the HV off and set the fault, as a hardware fault would '''
+        self.hvOn = False
+        self.fault = True
+
+    def injectError(self, code):
+        '''
+        Answer the next command with an error instead of processing it
+
+        Parameters
+        ----------
+        code : int
+            Error code, 1 to 6
+        '''
+        self._errors.append(code)
+
+    def advance(self, now=None):
+        '''
+        Update the output and the watchdog up to now
+
+        Parameters
+        ----------
+        now : float
+            Time in clock seconds (default the current time)
+        '''
+        if now is None:
+            now = self.clock()
+        dt = now - self._now
+        if dt <= 0:
+            return
+        self._now = now
+
+        if (self.watchdogEnabled and self.hvOn
+                and now - self._lastCommand > self.WATCHDOG):
+            self.tripFault()
+
+        target = self.setVoltage / self.MAX_HEX_VAL_SENT if self.hvOn else 0.0
+        output = self._output
+        if self.settleTime > 0:
+            step = (target - output) * -math.expm1(-dt / self.settleTime)
+        else:
+            step = target - output
+        if self.rampTime > 0:
+            maxStep = dt / self.rampTime
+            step = max(-maxStep, min(maxStep, step))
+        self._output = output + step
+
+    def process(self, frame, now=None):
+        '''
+        Process a command and return its answer
+
+        Parameters
+        ----------
+        frame : bytes
+            Command, with or without the SOH and CR characters
+        now : float
+            Time at which the command is received in clock seconds
+            (default the current time)
+
+        Returns
+        -------
+        answer : bytes
+            Answer terminated by the CR character
+        '''
+        self.advance(now)
+        if frame.startswith(codec.SOH):
+            frame = frame[1:]
+        frame = frame.rstrip(codec.CR)
+        cmd, chksum = frame[:-2], frame[-2:]
+        if self._errors:
+            return b'E%d\r' % self._errors.popleft()
+        if not cmd or checksum.calculateChksum(cmd) != chksum:
+            return b'E2\r'
+
+        kind = cmd[:1]
+        if kind == b'Q':
+            answer = self._query(cmd)
+        elif kind == b'S':
+            answer = self._set(cmd)
+        elif kind == b'V':
+            answer = self._version(cmd)
+        elif kind == b'C':
+            answer = self._configure(cmd)
+        else:
+            answer = b'E1'
+        if not answer.startswith(b'E'):
+            self._lastCommand = self._now
+            self.commands += 1
+        return answer + codec.CR
+
+    def _query(self, cmd):
+        if len(cmd) != 1:
+            return b'E3'
+        voltCounts = round(self.voltage * self.MAX_HEX_VAL_RECEIVE)
+        curCounts = round(self.current * self.MAX_HEX_VAL_RECEIVE)
+        return self._answer(b'R' + codec.HEX3_TABLE[voltCounts]
+                            + codec.HEX3_TABLE[curCounts] + b'000'
+                            + b'%X' % self.status())
+
+    def _set(self, cmd):
+        if len(cmd) != 14:
+            return b'E3'
+        digit = cmd[13]
+        if digit not in (_DIGIT_OFF, _DIGIT_ON, _DIGIT_RESET):
+            return b'E4'
+        if any(char not in _HEX for char in cmd[1:13]):
+            return b'E6'
+        if digit == _DIGIT_ON and self.fault:
+            return b'E5'
+
+        self.setVoltage = int(cmd[1:4], 16)
+        self.setCurrent = int(cmd[4:7], 16)
+        if digit == _DIGIT_RESET:
+            self.fault = False
+        self.hvOn = digit == _DIGIT_ON
+        return b'A'
+
+    def _version(self, cmd):
+        if len(cmd) != 1:
+            return b'E3'
+        return self._answer(b'B' + self.version)
+
+    def _configure(self, cmd):
+        if cmd not in (b'C0', b'C1'):
+            return b'E3' if len(cmd) != 2 else b'E1'
+        self.watchdogEnabled = cmd == b'C0'
+        return b'A'
+
+    def _currentLimit(self):
+        if self.load <= 0:
+            return math.inf
+        return self.setCurrent / self.MAX_HEX_VAL_SENT / self.load
+
+    @staticmethod
+    def _answer(body):
+        # the answer checksum does not cover the leading answer type
+        return body + checksum.calculateChksum(body[1:])
+
+
+class HvEmulator():
+    '''
+    In process emulated serial port connected to a FjModel
+
+    Implements the part of the serial.Serial interface used by the
+    HvController, so it can be given as its device:
+
+    >>> hvdevice = HvController(device=HvEmulator())
+    >>> hvdevice.openPortHV('emulator')
+
+    Each byte takes 10 bits at the baud rate plus byteLatency on the
+    wire, and the model answers responseLatency after the end of the
+    command. The reads wait (sleep) for the bytes to arrive.
+
+    Parameters
+    ----------
+    model : FjModel
+        Emulated power supply (default a new FjModel)
+    baudrate : int
+        Emulated baud rate (default 9600)
+    byteLatency : float
+        Extra time per byte in seconds (default 0 s)
+    responseLatency : float
+        Processing time of a command in seconds (default 0 s)
+    '''
+
+    def __init__(self, model=None, baudrate=9600, byteLatency=0.0,
+                 responseLatency=0.0):
+        self.model = FjModel() if model is None else model
+        self.baudrate = baudrate
+        self.byteLatency = byteLatency
+        self.responseLatency = responseLatency
+        self.port = None
+        self.timeout = None
+        self.is_open = False
+        self._txBuffer = b''
+        self._txEnd = 0.0
+        # answers as [arrival time of the first byte, bytes]
+        self._rx = collections.deque()
+
+    @property
+    def name(self):
+        return self.port
+
+    @property
+    def byteTime(self):
+        ''' Time of a byte on the wire in seconds '''
+        return 10 / self.baudrate + self.byteLatency
+
+    @property
+    def in_waiting(self):
+        return self._available(time.monotonic())
+
+    def open(self):
+        if self.is_open:
+            raise serial.SerialException('Port is already open.')
+        self.is_open = True
+
+    def close(self):
+        self.is_open = False
+        self._txBuffer = b''
+        self._rx.clear()
+
+    def write(self, data):
+        self._checkOpen()
+        data = bytes(data)
+        now = time.monotonic()
+        self._txEnd = max(self._txEnd, now)
+        byteTime = self.byteTime
+        for byte in data:
+            self._txEnd += byteTime
+            self._txBuffer += bytes((byte,))
+            if byte == codec.CR[0]:
+                answer = self.model.process(self._txBuffer, self._txEnd)
+                self._txBuffer = b''
+                self._rx.append([self._txEnd + self.responseLatency, answer])
+        return len(data)
+
+    def read_all(self):
+        self._checkOpen()
+        return self._take(self._available(time.monotonic()))
+
+    def read_until(self, expected=b'\r', size=None):
+        self._checkOpen()
+        deadline = None
+        if self.timeout is not None:
+            deadline = time.monotonic() + self.timeout
+
+        # time at which the expected sequence (or size bytes) is available
+        pending = b''.join(answer for _, answer in self._rx)
+        end = pending.find(expected)
+        count = len(pending) if end < 0 else end + len(expected)
+        if size is not None:
+            count = min(count, size)
+        arrival = self._arrival(count) if count else None
+        if arrival is not None and (end >= 0 or size is not None):
+            wait = arrival if deadline is None else min(arrival, deadline)
+        else:
+            wait = deadline
+        if wait is not None:
+            delay = wait - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        return self._take(min(count, self._available(time.monotonic())))
+
+    def reset_input_buffer(self):
+        self._rx.clear()
+
+    def _checkOpen(self):
+        if not self.is_open:
+            raise serial.SerialException('Attempting to use a port that '
+                                         'is not open')
+
+    def _available(self, now):
+        ''' Number of received bytes arrived at now '''
+        count = 0
+        byteTime = self.byteTime
+        for start, answer in self._rx:
+            arrived = int((now - start) / byteTime) if now > start else 0
+            count += min(arrived, len(answer))
+            if arrived < len(answer):
+                break
+        return count
+
+    def _arrival(self, count):
+        ''' Time at which count received bytes will have arrived '''
+        byteTime = self.byteTime
+        for start, answer in self._rx:
+            if count <= len(answer):
+                return start + count * byteTime
+            count -= len(answer)
+        return None
+
+    def _take(self, count):
+        data = b''
+        while count > 0 and self._rx:
+            start, answer = self._rx[0]
+            chunk = answer[:count]
+            data += chunk
+            count -= len(chunk)
+            if len(chunk) == len(answer):
+                self._rx.popleft()
+            else:
+                # the rest of the answer arrives after the bytes taken
+                self._rx[0] = [start + len(chunk) * self.byteTime,
+                               answer[len(chunk):]]
+        return data
+
+
+class PtyEmulator(threading.Thread):
+    '''
+    Emulated power supplies on pseudo-terminals
+
+    Each FjModel answers on its own pseudo-terminal, whose name is in
+    ports: any serial client, the HvController or the HvAsyncController
+    included, can open it as a real port. Each answer is written once
+    the command and the answer would have gone through the wire at the
+    baud rate (10 bits per byte, plus byteLatency) and after
+    responseLatency.
+
+    Parameters
+    ----------
+    count : int
+        Number of emulated devices (default 1)
+    baudrate : int
+        Emulated baud rate (default 9600)
+    byteLatency : float
+        Extra time per byte in seconds (default 0 s)
+    responseLatency : float
+        Processing time of a command in seconds (default 0 s)
+    model : callable
+        Factory of the FjModel of each device (default FjModel)
+    '''
+
+    def __init__(self, count=1, baudrate=9600, byteLatency=0.0,
+                 responseLatency=0.0, model=FjModel):
+        super(PtyEmulator, self).__init__(daemon=True)
+        self.baudrate = baudrate
+        self.byteLatency = byteLatency
+        self.responseLatency = responseLatency
+        self.ports = []
+        self.models = {}
+        self._fds = []
+        self._buffers = {}
+        self._pending = []
+        self._running = True
+        self._selector = selectors.DefaultSelector()
+        # pty is only available on POSIX, import it here so the in process
+        # emulator stays usable on Windows
+        import pty
+        for _ in range(count):
+            master, slave = pty.openpty()
+            os.set_blocking(master, False)
+            port = os.ttyname(slave)
+            self.ports.append(port)
+            self.models[master] = model()
+            # keep the slave end open so the pty survives port re-opening
+            self._fds.append((master, slave))
+            self._buffers[master] = b''
+            self._selector.register(master, selectors.EVENT_READ)
+
+    def model(self, port):
+        ''' Return the FjModel answering on a port '''
+        return self.models[self._fds[self.ports.index(port)][0]]
+
+    def stop(self):
+        ''' Stop the thread and close the pseudo-terminals '''
+        self._running = False
+        self.join()
+        for master, slave in self._fds:
+            os.close(master)
+            os.close(slave)
+
+    def run(self):
+        byteTime = 10 / self.baudrate + self.byteLatency
+        while self._running:
+            timeout = 0.05
+            if self._pending:
+                timeout = max(0, min(timeout,
+                                     self._pending[0][0] - time.monotonic()))
+            for key, _ in self._selector.select(timeout):
+                self._receive(key.fd, byteTime)
+            now = time.monotonic()
+            while self._pending and self._pending[0][0] <= now:
+                _, fd, answer = heapq.heappop(self._pending)
+                os.write(fd, answer)
+
+    def _receive(self, fd, byteTime):
+        try:
+            self._buffers[fd] += os.read(fd, 1024)
+        except OSError:
+            return
+        while codec.CR in self._buffers[fd]:
+            frame, _, self._buffers[fd] = self._buffers[fd].partition(codec.CR)
+            received = time.monotonic()
+            answer = self.models[fd].process(frame, received)
+            ready = (received + self.responseLatency
+                     + (len(frame) + 1 + len(answer)) * byteTime)
+            heapq.heappush(self._pending, (ready, fd, answer))
+
+
+def main(argv=None):
+    ''' Serve emulated power supplies on pseudo-terminals until Ctrl-C '''
+    import argparse
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('-n', '--count', type=int, default=1,
+                        help='number of power supplies (default 1)')
+    parser.add_argument('-b', '--baudrate', type=int, default=9600,
+                        help='emulated baud rate (default 9600)')
+    parser.add_argument('--byte-latency', type=float, default=0.0,
+                        help='extra time per byte in s (default 0)')
+    parser.add_argument('--response-latency', type=float, default=0.0,
+                        help='processing time of a command in s (default 0)')
+    args = parser.parse_args(argv)
+
+    emulator = PtyEmulator(args.count, args.baudrate, args.byte_latency,
+                           args.response_latency)
+    emulator.start()
+    for port in emulator.ports:
+        print(port)
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        emulator.stop()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -29,6 +29,7 @@ class Ui_MainWindow(object):
         self.prtNameLabel.setObjectName("prtNameLabel")
         self.formLayout.setWidget(0, QtWidgets.QFormLayout.LabelRole, self.prtNameLabel)
         self.prtList = QtWidgets.QComboBox(self.centralwidget)
+        self.prtList.setEditable(True)
         self.prtList.setObjectName("prtList")
         self.formLayout.setWidget(0, QtWidgets.QFormLayout.FieldRole, self.prtList)
         self.prtOpenBtn = QtWidgets.QPushButton(self.centralwidget)
@@ -160,14 +161,12 @@ class Ui_MainWindow(object):
         self.hvOnLed = QtWidgets.QLabel(self.centralwidget)
         self.hvOnLed.setMaximumSize(QtCore.QSize(21, 21))
         self.hvOnLed.setText("")
-        self.hvOnLed.setPixmap(QtGui.QPixmap(":/icons/green-led-on.png"))
         self.hvOnLed.setScaledContents(True)
         self.hvOnLed.setObjectName("hvOnLed")
         self.formLayout_4.setWidget(0, QtWidgets.QFormLayout.FieldRole, self.hvOnLed)
         self.faultLed = QtWidgets.QLabel(self.centralwidget)
         self.faultLed.setMaximumSize(QtCore.QSize(21, 21))
         self.faultLed.setText("")
-        self.faultLed.setPixmap(QtGui.QPixmap(":/icons/led-red-on.png"))
         self.faultLed.setScaledContents(True)
         self.faultLed.setObjectName("faultLed")
         self.formLayout_4.setWidget(1, QtWidgets.QFormLayout.FieldRole, self.faultLed)
@@ -203,6 +202,7 @@ class Ui_MainWindow(object):
         self.formLayout_5.setWidget(0, QtWidgets.QFormLayout.FieldRole, self.prgFilenameLineEdit)
         self.verticalLayout_3.addLayout(self.formLayout_5)
         self.prgPlotVoltBtn = QtWidgets.QPushButton(self.centralwidget)
+        self.prgPlotVoltBtn.setCheckable(True)
         self.prgPlotVoltBtn.setObjectName("prgPlotVoltBtn")
         self.verticalLayout_3.addWidget(self.prgPlotVoltBtn)
         self.prgVoltGraph = QtWidgets.QGraphicsView(self.centralwidget)
@@ -210,14 +210,66 @@ class Ui_MainWindow(object):
         self.verticalLayout_3.addWidget(self.prgVoltGraph)
         self.horizontalLayout.addLayout(self.verticalLayout_3)
         self.verticalLayout_4.addLayout(self.horizontalLayout)
+        self.rackLabel = QtWidgets.QLabel(self.centralwidget)
+        font = QtGui.QFont()
+        font.setBold(True)
+        font.setWeight(75)
+        self.rackLabel.setFont(font)
+        self.rackLabel.setObjectName("rackLabel")
+        self.verticalLayout_4.addWidget(self.rackLabel)
+        self.rackTable = QtWidgets.QTableWidget(self.centralwidget)
+        self.rackTable.setMaximumSize(QtCore.QSize(16777215, 120))
+        self.rackTable.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        self.rackTable.setSelectionMode(QtWidgets.QAbstractItemView.SingleSelection)
+        self.rackTable.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectRows)
+        self.rackTable.setObjectName("rackTable")
+        self.rackTable.setColumnCount(6)
+        self.rackTable.setRowCount(0)
+        item = QtWidgets.QTableWidgetItem()
+        self.rackTable.setHorizontalHeaderItem(0, item)
+        item = QtWidgets.QTableWidgetItem()
+        self.rackTable.setHorizontalHeaderItem(1, item)
+        item = QtWidgets.QTableWidgetItem()
+        self.rackTable.setHorizontalHeaderItem(2, item)
+        item = QtWidgets.QTableWidgetItem()
+        self.rackTable.setHorizontalHeaderItem(3, item)
+        item = QtWidgets.QTableWidgetItem()
+        self.rackTable.setHorizontalHeaderItem(4, item)
+        item = QtWidgets.QTableWidgetItem()
+        self.rackTable.setHorizontalHeaderItem(5, item)
+        self.rackTable.horizontalHeader().setStretchLastSection(True)
+        self.rackTable.verticalHeader().setVisible(False)
+        self.verticalLayout_4.addWidget(self.rackTable)
+        self.horizontalLayout_2 = QtWidgets.QHBoxLayout()
+        self.horizontalLayout_2.setObjectName("horizontalLayout_2")
         self.cmdOutLabel = QtWidgets.QLabel(self.centralwidget)
         font = QtGui.QFont()
         font.setBold(True)
         font.setWeight(75)
         self.cmdOutLabel.setFont(font)
         self.cmdOutLabel.setObjectName("cmdOutLabel")
-        self.verticalLayout_4.addWidget(self.cmdOutLabel)
-        self.cmdOutText = QtWidgets.QTextEdit(self.centralwidget)
+        self.horizontalLayout_2.addWidget(self.cmdOutLabel)
+        spacerItem = QtWidgets.QSpacerItem(40, 20, QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Minimum)
+        self.horizontalLayout_2.addItem(spacerItem)
+        self.outCommandFilter = QtWidgets.QComboBox(self.centralwidget)
+        self.outCommandFilter.setObjectName("outCommandFilter")
+        self.outCommandFilter.addItem("")
+        self.outCommandFilter.addItem("")
+        self.outCommandFilter.addItem("")
+        self.outCommandFilter.addItem("")
+        self.outCommandFilter.addItem("")
+        self.outCommandFilter.addItem("")
+        self.outCommandFilter.addItem("")
+        self.outCommandFilter.addItem("")
+        self.horizontalLayout_2.addWidget(self.outCommandFilter)
+        self.outSeverityFilter = QtWidgets.QComboBox(self.centralwidget)
+        self.outSeverityFilter.setObjectName("outSeverityFilter")
+        self.outSeverityFilter.addItem("")
+        self.outSeverityFilter.addItem("")
+        self.outSeverityFilter.addItem("")
+        self.horizontalLayout_2.addWidget(self.outSeverityFilter)
+        self.verticalLayout_4.addLayout(self.horizontalLayout_2)
+        self.cmdOutText = QtWidgets.QPlainTextEdit(self.centralwidget)
         self.cmdOutText.setReadOnly(True)
         self.cmdOutText.setObjectName("cmdOutText")
         self.verticalLayout_4.addWidget(self.cmdOutText)
@@ -240,6 +292,8 @@ class Ui_MainWindow(object):
         self.actionSettings.setObjectName("actionSettings")
         self.actionHV_firmware_version = QtWidgets.QAction(MainWindow)
         self.actionHV_firmware_version.setObjectName("actionHV_firmware_version")
+        self.actionMetrics = QtWidgets.QAction(MainWindow)
+        self.actionMetrics.setObjectName("actionMetrics")
         self.actionOnline_documentation = QtWidgets.QAction(MainWindow)
         self.actionOnline_documentation.setObjectName("actionOnline_documentation")
         self.actionAbout = QtWidgets.QAction(MainWindow)
@@ -247,6 +301,7 @@ class Ui_MainWindow(object):
         self.menuExit.addAction(self.actionSettings)
         self.menuExit.addAction(self.actionExit)
         self.menuHelp.addAction(self.actionHV_firmware_version)
+        self.menuHelp.addAction(self.actionMetrics)
         self.menuHelp.addAction(self.actionOnline_documentation)
         self.menuHelp.addAction(self.actionAbout)
         self.menubar.addAction(self.menuExit.menuAction())
@@ -279,8 +334,32 @@ class Ui_MainWindow(object):
         self.prgSelectBtn.setText(_translate("MainWindow", "Select file :"))
         self.prgStartBtn.setText(_translate("MainWindow", "Start"))
         self.prgStopBtn.setText(_translate("MainWindow", "Stop"))
-        self.prgPlotVoltBtn.setText(_translate("MainWindow", "Plot current HV program"))
+        self.prgPlotVoltBtn.setText(_translate("MainWindow", "Plot voltage and current"))
+        self.rackLabel.setText(_translate("MainWindow", "Supplies"))
+        item = self.rackTable.horizontalHeaderItem(0)
+        item.setText(_translate("MainWindow", "Port"))
+        item = self.rackTable.horizontalHeaderItem(1)
+        item.setText(_translate("MainWindow", "V (kV)"))
+        item = self.rackTable.horizontalHeaderItem(2)
+        item.setText(_translate("MainWindow", "I (mA)"))
+        item = self.rackTable.horizontalHeaderItem(3)
+        item.setText(_translate("MainWindow", "HV on"))
+        item = self.rackTable.horizontalHeaderItem(4)
+        item.setText(_translate("MainWindow", "Fault"))
+        item = self.rackTable.horizontalHeaderItem(5)
+        item.setText(_translate("MainWindow", "Mode"))
         self.cmdOutLabel.setText(_translate("MainWindow", "Command output"))
+        self.outCommandFilter.setItemText(0, _translate("MainWindow", "All commands"))
+        self.outCommandFilter.setItemText(1, _translate("MainWindow", "Query"))
+        self.outCommandFilter.setItemText(2, _translate("MainWindow", "Set"))
+        self.outCommandFilter.setItemText(3, _translate("MainWindow", "Reset"))
+        self.outCommandFilter.setItemText(4, _translate("MainWindow", "Port"))
+        self.outCommandFilter.setItemText(5, _translate("MainWindow", "Keep-alive"))
+        self.outCommandFilter.setItemText(6, _translate("MainWindow", "Program"))
+        self.outCommandFilter.setItemText(7, _translate("MainWindow", "Stability"))
+        self.outSeverityFilter.setItemText(0, _translate("MainWindow", "All messages"))
+        self.outSeverityFilter.setItemText(1, _translate("MainWindow", "Warnings and errors"))
+        self.outSeverityFilter.setItemText(2, _translate("MainWindow", "Errors only"))
         self.menuExit.setTitle(_translate("MainWindow", "&Menu"))
         self.menuHelp.setTitle(_translate("MainWindow", "Help"))
         self.actionExit.setText(_translate("MainWindow", "Exit"))
@@ -288,7 +367,6 @@ class Ui_MainWindow(object):
         self.actionExit.setShortcut(_translate("MainWindow", "Ctrl+Q"))
         self.actionSettings.setText(_translate("MainWindow", "Settings"))
         self.actionHV_firmware_version.setText(_translate("MainWindow", "HV firmware version"))
+        self.actionMetrics.setText(_translate("MainWindow", "Communication metrics"))
         self.actionOnline_documentation.setText(_translate("MainWindow", "Online documentation"))
         self.actionAbout.setText(_translate("MainWindow", "About"))
-
-import resources_rc
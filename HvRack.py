@@ -0,0 +1,351 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the HvControllerGUI software.
+# The HvRack class manages several HV devices, each one on its own
+# serial port and polled by its own acquisition thread.
+#
+# Copyright 2018-2019 Aurélie Vancraeyenest
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import functools
+from PyQt5 import QtCore
+
+import HvController as hv
+import acqlog
+import correction
+import stability
+import workers
+
+# Fractional part of the golden ratio: successive multiples of it
+# spread evenly over [0, 1) whatever the number of devices
+GOLDEN_FRACTION = 0.6180339887498949
+
+
+class HvDeviceState():
+    '''
+    Last known state of a HV device of the rack
+
+    Attributes
+    ----------
+    port : str
+        Port name of the device
+    targetHV : float
+        Last voltage set by the user in kV
+    targetI : float
+        Last current set by the user in mA
+    reading : HvReading
+        Last reading of the HV status, None before the first query
+    error : str
+        Last query error, None if the last query succeeded
+    history : HvHistory
+        History of the readings, fed by the acquisition thread
+    monitor : StabilityMonitor
+        Stability of the voltage, updated by the acquisition thread:
+        only read its summaries
+    stable : bool
+        False from a violation of the stability band to its recovery
+    program : ProgramRun
+        Program running on the device, None if none
+    programPaused : bool
+        True if the program has been paused
+    '''
+
+    def __init__(self, port, hvhistory=None, monitor=None):
+        self.port = port
+        self.targetHV = 0.0
+        self.targetI = 0.0
+        self.reading = None
+        self.error = None
+        self.history = hvhistory
+        self.monitor = monitor
+        self.stable = True
+        self.program = None
+        self.programPaused = False
+
+
+class HvRack(QtCore.QObject):
+    '''
+    Manager of several HV devices, each one on its own serial port
+
+    Every device is owned by its own HvAcquisition thread so the devices
+    are polled concurrently, and the first query of each new device is
+    shifted within the query interval so the polls of the different
+    devices do not all fire at the same time.
+
+    Parameters
+    ----------
+    interval : float
+        Time between two keep-alive queries of a device after a change
+        (default 0.5 s)
+    adaptive : bool
+        Adapt the query interval of each device to its readings, see
+        KeepAliveScheduler (default True)
+    logDir : str
+        Directory of the binary acquisition logs of the devices, one
+        file per port named by acqlog.logName() (default None, no log)
+    telemetry : TelemetrySink
+        Sink recording the queries and commands of all the devices
+        (default None, no telemetry)
+    band : float
+        Half width of the stability band around the target voltage in
+        kV (default 0.2 kV)
+    dwell : float
+        Time out of (or back in) the band before a stability change in
+        seconds (default 2 s)
+    windows : tuple of float
+        Windows of the stability statistics in seconds (default
+        stability.WINDOWS)
+    correct : bool
+        Send the setpoint again from the acquisition thread when the
+        voltage leaves the band, see SetpointCorrector (default True)
+    maxTrim : int
+        Maximum trim of the voltage setpoint by the corrections in DAC
+        counts (default 0, no trim)
+
+    Supported signals
+    -----------------
+    reading : str, HvReading
+        Port name and last reading of the HV status
+    error : str, tuple
+        Port name and error traceback of a failed keep-alive query
+    closed : str
+        Port name, emitted once the acquisition thread has ended
+    programEnded : str, ProgramRun
+        Port name and program done, stopped or failed
+    stabilityChanged : str, StabilityEvent
+        Port name and change of the stability of the voltage
+    setpointCorrected : str, CorrectionStep
+        Port name and end of a correction of the setpoint
+    '''
+    #: obj: pyqtSignal(str, object) HV status of a device
+    reading = QtCore.pyqtSignal(str, object)
+    #: obj: pyqtSignal(str, tuple) Error traceback of a keep-alive query
+    error = QtCore.pyqtSignal(str, tuple)
+    #: obj: pyqtSignal(str) Acquisition thread of a device has ended
+    closed = QtCore.pyqtSignal(str)
+    #: obj: pyqtSignal(str, object) Program of a device has ended
+    programEnded = QtCore.pyqtSignal(str, object)
+    #: obj: pyqtSignal(str, object) Stability of a device has changed
+    stabilityChanged = QtCore.pyqtSignal(str, object)
+    #: obj: pyqtSignal(str, object) Correction of a setpoint has ended
+    setpointCorrected = QtCore.pyqtSignal(str, object)
+
+    def __init__(self, interval=0.5, logDir=None, adaptive=True,
+                 telemetry=None, band=0.2, dwell=2.0,
+                 windows=stability.WINDOWS, correct=True, maxTrim=0,
+                 parent=None):
+        super(HvRack, self).__init__(parent)
+        self.interval = interval
+        self.adaptive = adaptive
+        self.logDir = logDir
+        self.telemetry = telemetry
+        self.band = band
+        self.dwell = dwell
+        self.windows = windows
+        self.correct = correct
+        self.maxTrim = maxTrim
+        self.controllers = {}
+        self.acquisitions = {}
+        self.states = {}
+        self._opened = 0
+
+    def ports(self):
+        ''' Return the names of the open ports, in opening order '''
+        return list(self.controllers)
+
+    def openPort(self, port):
+        '''
+        Open the port of a new device and start its acquisition thread
+
+        Parameters
+        ----------
+        port : str
+            Port name
+
+        Raises
+        ------
+        serial.SerialException
+            If the port could not be opened
+        ValueError
+            If the existing acquisition log of the port has another
+            format
+        '''
+        hvdevice = hv.HvController()
+        hvdevice.telemetry = self.telemetry
+        log = None
+        if self.logDir is not None:
+            log = acqlog.AcquisitionLog(
+                    os.path.join(self.logDir, acqlog.logName(port)),
+                    hvdevice.MAX_VOLTAGE, hvdevice.MAX_CURENT,
+                    hvdevice.MAX_HEX_VAL_RECEIVE)
+        try:
+            hvdevice.openPortHV(port)
+        except Exception:
+            if log is not None:
+                log.close()
+            raise
+
+        startDelay = self.interval * (self._opened * GOLDEN_FRACTION % 1)
+        self._opened += 1
+        monitor = stability.StabilityMonitor(self.band, self.dwell,
+                                             windows=self.windows)
+        corrector = None
+        if self.correct:
+            lsb = hvdevice.MAX_VOLTAGE / hvdevice.MAX_HEX_VAL_SENT
+            corrector = correction.SetpointCorrector(self.band, lsb,
+                                                     maxTrim=self.maxTrim)
+        acquisition = workers.HvAcquisition(hvdevice, self.interval,
+                                            startDelay, acqlog=log,
+                                            adaptive=self.adaptive,
+                                            monitor=monitor,
+                                            corrector=corrector)
+        acquisition.reading.connect(functools.partial(self._onReading, port))
+        acquisition.error.connect(functools.partial(self._onError, port))
+        acquisition.programEnded.connect(
+                functools.partial(self._onProgramEnded, port))
+        acquisition.stabilityChanged.connect(
+                functools.partial(self._onStabilityChanged, port))
+        acquisition.setpointCorrected.connect(
+                functools.partial(self._onSetpointCorrected, port))
+        acquisition.finished.connect(functools.partial(self._onFinished,
+                                                       port))
+        self.controllers[port] = hvdevice
+        self.acquisitions[port] = acquisition
+        self.states[port] = HvDeviceState(port, acquisition.history,
+                                          monitor)
+        acquisition.start()
+
+    def closePort(self, port, worker=None):
+        '''
+        Reset the device, close its port and stop its acquisition thread
+
+        The thread is only stopped once the port is closed: if the reset
+        or the closing fails, the device stays in the rack and the
+        closing can be tried again.
+
+        Parameters
+        ----------
+        port : str
+            Port name
+        worker : HvWorker
+            Worker running the closePortHV() method of the device, to
+            connect to its signals (default created here)
+        '''
+        if worker is None:
+            worker = workers.HvWorker(self.controllers[port].closePortHV)
+        self.acquisitions[port].closePort(worker)
+
+    def closeAll(self):
+        '''
+        Close all the ports and wait for the acquisition threads, which
+        are stopped even if the closing of their port fails
+        '''
+        acquisitions = list(self.acquisitions.values())
+        for port in self.ports():
+            self.closePort(port)
+        for acquisition in acquisitions:
+            acquisition.stop()
+            acquisition.wait()
+
+    def submit(self, port, worker, priority=workers.PRIORITY_SET, key=None):
+        '''
+        Queue a command in the acquisition thread of a device
+
+        Parameters
+        ----------
+        port : str
+            Port name
+        worker : HvWorker
+            Worker wrapping a method of the device controller
+        priority : int
+            Priority class of the command, see CommandQueue (default
+            workers.PRIORITY_SET)
+        key : hashable
+            Coalescing key of the command (default None)
+        '''
+        self.acquisitions[port].submit(worker, priority, key)
+
+    def startProgram(self, port, run, output=None):
+        '''
+        Start a HV program on a device, stopping its running one
+
+        Parameters
+        ----------
+        port : str
+            Port name
+        run : ProgramRun
+            Program to run, not started yet
+        output : callable
+            Slot receiving the output message of the command (default
+            None)
+        '''
+        state = self.states[port]
+        state.program = run
+        state.programPaused = False
+        self.acquisitions[port].startProgram(run, output)
+
+    def pauseProgram(self, port, paused=True, output=None):
+        ''' Pause (or resume) the program of a device, see startProgram '''
+        self.states[port].programPaused = paused
+        self.acquisitions[port].pauseProgram(paused, output)
+
+    def stopProgram(self, port, output=None):
+        '''
+        Stop the program of a device, ahead of the other commands but
+        the resets, see startProgram
+        '''
+        self.acquisitions[port].stopProgram(output)
+
+    @QtCore.pyqtSlot(str, object)
+    def _onReading(self, port, reading):
+        state = self.states.get(port)
+        if state is not None:
+            state.reading = reading
+            state.error = None
+            self.reading.emit(port, reading)
+
+    @QtCore.pyqtSlot(str, tuple)
+    def _onError(self, port, error):
+        state = self.states.get(port)
+        if state is not None:
+            state.error = str(error[1])
+            self.error.emit(port, error)
+
+    @QtCore.pyqtSlot(str, object)
+    def _onProgramEnded(self, port, run):
+        state = self.states.get(port)
+        if state is not None and state.program is run:
+            state.program = None
+            state.programPaused = False
+        self.programEnded.emit(port, run)
+
+    @QtCore.pyqtSlot(str, object)
+    def _onStabilityChanged(self, port, event):
+        state = self.states.get(port)
+        if state is not None:
+            state.stable = event.kind != 'violation'
+            self.stabilityChanged.emit(port, event)
+
+    @QtCore.pyqtSlot(str, object)
+    def _onSetpointCorrected(self, port, step):
+        if port in self.states:
+            self.setpointCorrected.emit(port, step)
+
+    @QtCore.pyqtSlot(str)
+    def _onFinished(self, port):
+        self.controllers.pop(port, None)
+        self.acquisitions.pop(port, None)
+        self.states.pop(port, None)
+        self.closed.emit(port)
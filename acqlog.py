@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the HvControllerGUI software.
+# The acqlog module writes every reading of a HV device to a binary,
+# append-only acquisition log and reads it back as numpy arrays.
+#
+# Copyright 2018-2019 Aurélie Vancraeyenest
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import time
+
+import numpy as np
+
+from history import READING_DTYPE
+
+MAGIC = b'HVACQLOG'
+VERSION = 1
+
+#: Header of the file, little endian
+HEADER_DTYPE = np.dtype([('magic', 'S8'),
+                         ('version', '<u2'),
+                         ('recordSize', '<u2'),
+                         ('maxVoltage', '<f8'),
+                         ('maxCurrent', '<f8'),
+                         ('maxCounts', '<u4')])
+
+#: Record of one reading, as READING_DTYPE but little endian and with the
+#: timestamp in seconds since the epoch (time.time())
+RECORD_DTYPE = READING_DTYPE.newbyteorder('<')
+
+
+def logName(port):
+    '''
+    Return the default file name of the acquisition log of a port
+
+    Parameters
+    ----------
+    port : str
+        Port name, e.g. '/dev/ttyUSB0' or 'COM3'
+
+    Returns
+    -------
+    name : str
+        e.g. 'hvCtrl-ttyUSB0.hvlog'
+    '''
+    return 'hvCtrl-{}.hvlog'.format(os.path.basename(port))
+
+
+class AcquisitionLog():
+    '''
+    Binary, append-only acquisition log of a HV device
+
+    The file is a HEADER_DTYPE header holding the scale of the raw counts
+    (MAX_VOLTAGE, MAX_CURENT and MAX_HEX_VAL_RECEIVE of the controller)
+    followed by one RECORD_DTYPE record per reading. The number of
+    records is given by the file size, so the header never changes and
+    reopening a log appends to it. Each record is written by a single
+    unbuffered write: a crash loses at most the record being written,
+    which is truncated at the next opening.
+
+    Use loadLog() to read the file.
+
+    Parameters
+    ----------
+    path : str
+        Path of the log file, created if it does not exist
+    maxVoltage, maxCurrent, maxCounts : float
+        Scale of the ADC counts (default the HvController constants)
+
+    Raises
+    ------
+    ValueError
+        If the file exists with another format or another scale
+    '''
+
+    def __init__(self, path, maxVoltage=40.0, maxCurrent=3.0,
+                 maxCounts=0x3FF):
+        self.path = path
+        header = np.zeros((), dtype=HEADER_DTYPE)
+        header['magic'] = MAGIC
+        header['version'] = VERSION
+        header['recordSize'] = RECORD_DTYPE.itemsize
+        header['maxVoltage'] = maxVoltage
+        header['maxCurrent'] = maxCurrent
+        header['maxCounts'] = maxCounts
+
+        self._file = open(path, 'a+b', buffering=0)
+        size = self._file.seek(0, os.SEEK_END)
+        if size == 0:
+            self._file.write(header.tobytes())
+        else:
+            self._file.seek(0)
+            existing = self._file.read(HEADER_DTYPE.itemsize)
+            if existing != header.tobytes():
+                self._file.close()
+                raise ValueError('{} is not an acquisition log with the same '
+                                 'format and scale'.format(path))
+            excess = (size - HEADER_DTYPE.itemsize) % RECORD_DTYPE.itemsize
+            if excess:
+                self._file.truncate(size - excess)
+
+        # Readings are timestamped with time.monotonic()
+        self._epoch = time.time() - time.monotonic()
+        self._record = np.zeros((), dtype=RECORD_DTYPE)
+
+    def append(self, reading):
+        '''
+        Write a reading at the end of the log
+
+        Parameters
+        ----------
+        reading : HvReading
+            Reading to write
+        '''
+        record = self._record
+        record['timestamp'] = reading.timestamp + self._epoch
+        record['voltCounts'] = reading.voltCounts
+        record['curCounts'] = reading.curCounts
+        record['status'] = reading.status
+        self._file.write(record.tobytes())
+
+    def close(self):
+        ''' Close the log file '''
+        self._file.close()
+
+
+def loadLog(path):
+    '''
+    Map an acquisition log in memory
+
+    Parameters
+    ----------
+    path : str
+        Path of the log file
+
+    Returns
+    -------
+    header : numpy.void
+        HEADER_DTYPE header, with the scale of the counts
+    records : numpy.memmap
+        Read-only RECORD_DTYPE records, oldest first
+
+    Raises
+    ------
+    ValueError
+        If the file is not an acquisition log
+
+    Examples
+    --------
+    >>> header, records = loadLog('hvCtrl-ttyUSB0.hvlog')
+    >>> voltage = (records['voltCounts'] * header['maxVoltage']
+    ...            / header['maxCounts'])
+    '''
+    header = np.fromfile(path, dtype=HEADER_DTYPE, count=1)
+    if (len(header) == 0 or header[0]['magic'] != MAGIC
+            or header[0]['version'] != VERSION):
+        raise ValueError('{} is not an acquisition log'.format(path))
+    header = header[0]
+
+    size = os.path.getsize(path) - HEADER_DTYPE.itemsize
+    count = size // RECORD_DTYPE.itemsize
+    if count == 0:
+        return header, np.zeros(0, dtype=RECORD_DTYPE)
+    records = np.memmap(path, dtype=RECORD_DTYPE, mode='r',
+                        offset=HEADER_DTYPE.itemsize, shape=(count,))
+    return header, records
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the HvControllerGUI software.
+# Benchmark of the binary acquisition log: cost of an append and time to
+# load months of 2 Hz data and scale its voltage.
+#
+# Copyright 2018-2019 Aurélie Vancraeyenest
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import time
+import timeit
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import HvController as hv  # noqa: E402
+import acqlog  # noqa: E402
+
+
+def check(path):
+    '''Write, reopen with a torn last record and read back a short log'''
+    log = acqlog.AcquisitionLog(path)
+    readings = [hv.HvReading(time.monotonic(), i, 2 * i, i & 0xF, 0.0, 0.0)
+                for i in range(10)]
+    for reading in readings[:5]:
+        log.append(reading)
+    log.close()
+    with open(path, 'ab') as torn:
+        torn.write(b'\x00' * 3)
+    log = acqlog.AcquisitionLog(path)
+    for reading in readings[5:]:
+        log.append(reading)
+    log.close()
+
+    header, records = acqlog.loadLog(path)
+    assert header['maxCounts'] == hv.HvController.MAX_HEX_VAL_RECEIVE
+    assert records['voltCounts'].tolist() == list(range(10))
+    assert records['status'].tolist() == [i & 0xF for i in range(10)]
+    try:
+        acqlog.AcquisitionLog(path, maxVoltage=20.0)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('scale mismatch not detected')
+    os.remove(path)
+
+
+def main(days=90, number=10000):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, acqlog.logName('/dev/ttyBENCH'))
+        check(path)
+
+        log = acqlog.AcquisitionLog(path)
+        reading = hv.HvReading(time.monotonic(), 0x1FF, 0x0FF, 4, 20.0, 1.5)
+        best = min(timeit.repeat(lambda: log.append(reading),
+                                 number=number, repeat=5))
+        print('append      {:8.0f} ns'.format(1e9 * best / number))
+        log.close()
+
+        # Fill the log directly, as days of 2 Hz polls
+        count = days * 24 * 3600 * 2
+        records = np.zeros(count, dtype=acqlog.RECORD_DTYPE)
+        records['timestamp'] = time.time() + 0.5 * np.arange(count)
+        records['voltCounts'] = 0x1FF
+        with open(path, 'ab') as out:
+            records.tofile(out)
+        del records
+        print('{} days: {} records, {:.0f} MB'.format(
+                days, count, os.path.getsize(path) / 1e6))
+
+        start = time.perf_counter()
+        header, records = acqlog.loadLog(path)
+        loaded = time.perf_counter()
+        voltage = (records['voltCounts'] * header['maxVoltage']
+                   / header['maxCounts'])
+        scaled = time.perf_counter()
+        print('load        {:8.2f} ms'.format(1e3 * (loaded - start)))
+        print('scale       {:8.2f} ms'.format(1e3 * (scaled - loaded)))
+        del voltage, records
+
+
+if __name__ == '__main__':
+    main()
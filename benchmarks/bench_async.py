@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the HvControllerGUI software.
+# Benchmark of the aggregate query rate of many emulated HV devices,
+# driven either from a single asyncio event loop or a thread per device.
+#
+# Copyright 2018-2019 Aurélie Vancraeyenest
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import time
+import asyncio
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import HvController as hv  # noqa: E402
+import HvAsyncController as hva  # noqa: E402
+from HvEmulator import PtyEmulator  # noqa: E402
+
+
+def runThreads(ports, duration, framedRead):
+    '''Return the number of queries done with one thread per device'''
+    counts = [0] * len(ports)
+    stop = threading.Event()
+
+    def poll(index, port):
+        hvdevice = hv.HvController(framedRead=framedRead)
+        hvdevice.openPortHV(port)
+        try:
+            while not stop.is_set():
+                hvdevice.queryHV()
+                counts[index] += 1
+        finally:
+            hvdevice.device.close()
+
+    threads = [threading.Thread(target=poll, args=(i, port))
+               for i, port in enumerate(ports)]
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return sum(counts)
+
+
+async def runAsync(ports, duration):
+    '''Return the number of queries done from a single event loop'''
+    counts = [0] * len(ports)
+    deadline = time.monotonic() + duration
+
+    async def poll(index, port):
+        hvdevice = hva.HvAsyncController()
+        await hvdevice.open(port)
+        try:
+            while time.monotonic() < deadline:
+                await hvdevice.query()
+                counts[index] += 1
+        finally:
+            await hvdevice.close()
+
+    await asyncio.gather(*(poll(i, port) for i, port in enumerate(ports)))
+    return sum(counts)
+
+
+def main(count=32, duration=5.0, baudrate=9600):
+    devices = PtyEmulator(count=count, baudrate=baudrate)
+    devices.start()
+    try:
+        print('Aggregate query rate of {} devices at {} baud'
+              .format(count, baudrate))
+        results = [
+            ('threads, fixed sleep',
+             runThreads(devices.ports, duration, framedRead=False)),
+            ('threads, framed read',
+             runThreads(devices.ports, duration, framedRead=True)),
+            ('asyncio, single loop',
+             asyncio.run(runAsync(devices.ports, duration))),
+            ]
+        for name, total in results:
+            print('{:<22} {:8.1f} queries/s'.format(name, total / duration))
+    finally:
+        devices.stop()
+
+
+if __name__ == '__main__':
+    main()
+    # without wire time, the per-query overhead of each engine dominates
+    main(baudrate=10000000)
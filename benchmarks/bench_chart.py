@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the HvControllerGUI software.
+# Benchmark of the strip chart: full drawing and frame cost on 24 hours
+# of readings at 2 Hz, shown over 10 minutes and over 24 hours.
+#
+# Copyright 2018-2019 Aurélie Vancraeyenest
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+import numpy as np  # noqa: E402
+from PyQt5 import QtWidgets  # noqa: E402
+
+import HvController as hv  # noqa: E402
+import HvRack  # noqa: E402
+import history  # noqa: E402
+import stripchart  # noqa: E402
+
+RATE = 2.0
+FPS = 60.0
+
+
+class Clock():
+    ''' Simulated time.monotonic() '''
+
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def fill(hvhistory, count):
+    ''' Fill the history with a noisy ramp, return the last timestamp '''
+    rng = np.random.default_rng(0)
+    volts = np.clip(np.cumsum(rng.integers(-3, 4, count)) % 2000, 0, 1023)
+    for i in range(count):
+        hvhistory.append(hv.HvReading(i / RATE, int(volts[i]),
+                                      int(volts[i]) // 3, 4, 0.0, 0.0))
+    return (count - 1) / RATE
+
+
+def main(frames=600):
+    app = QtWidgets.QApplication(sys.argv[:1])
+    hvhistory = history.HvHistory()
+    last = fill(hvhistory, hvhistory.capacity)
+    device = HvRack.HvDeviceState('bench', hvhistory)
+    device.targetHV = 20.0
+    print('{} readings at {:g} Hz, 600x300 px'.format(len(hvhistory), RATE))
+    print('{:>8} {:>12} {:>12} {:>12}'.format('span', 'full (ms)',
+                                              'frame (us)', 'p99 (us)'))
+    for span in (600.0, 86400.0):
+        view = QtWidgets.QGraphicsView()
+        view.resize(600, 300)
+        view.show()
+        app.processEvents()
+        clock = Clock(last)
+        chart = stripchart.StripChart(view, span=span, clock=clock)
+        chart.setDevice(device)
+
+        start = time.perf_counter()
+        for i in range(10):
+            chart.setDevice(device)
+            chart.refresh()
+        full = 1e3 * (time.perf_counter() - start) / 10
+
+        durations = []
+        for i in range(frames):
+            clock.now += 1 / FPS
+            if i % int(FPS / RATE) == 0:
+                hvhistory.append(hv.HvReading(clock.now, 512, 170, 4,
+                                              0.0, 0.0))
+            start = time.perf_counter()
+            chart.refresh()
+            durations.append(time.perf_counter() - start)
+        durations = 1e6 * np.array(durations)
+        print('{:>8g} {:>12.2f} {:>12.1f} {:>12.1f}'.format(
+                span, full, durations.mean(), np.percentile(durations, 99)))
+        view.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the HvControllerGUI software.
+# Micro-benchmark of the encoding cost of the Q, V and S commands and of
+# the decoding cost of the Q answer, with the original string based code
+# and the table based codec.
+#
+# Copyright 2018-2019 Aurélie Vancraeyenest
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import HvController as hv  # noqa: E402
+import checksum  # noqa: E402
+import codec  # noqa: E402
+
+
+def legacyChksum(cmd):
+    '''Checksum as computed before the lookup table'''
+    arr = bytearray(cmd, 'ascii')
+    checksum = bytes(hex(sum(arr) % 256), 'ascii')
+    return checksum.lstrip(b'0x').zfill(2).upper()
+
+
+def legacyEncode(cmd):
+    '''Frame encoding as done before the codec module'''
+    return b'\x01' + bytes(cmd, 'ascii') + legacyChksum(cmd) + b'\x0D'
+
+
+def legacySet(voltToSet, curToSet):
+    '''S command encoding as done before the codec module'''
+    voltHex = round(voltToSet * hv.HvController.MAX_HEX_VAL_SENT
+                    / hv.HvController.MAX_VOLTAGE)
+    curHex = round(curToSet * hv.HvController.MAX_HEX_VAL_SENT
+                   / hv.HvController.MAX_CURENT)
+    return legacyEncode('S' + "%0.3X" % voltHex + "%0.3X" % curHex
+                        + '0000002')
+
+
+def legacyDecode(hvdevice, answer):
+    '''Q answer decoding as done before the codec module'''
+    checksum.checkChecksum(answer)
+
+    controlMode = {'0': 'voltage', '1': 'current'}
+    faultStatus = {'0': False, '1': True}
+    hvOnStatus = {'0': False, '1': True}
+
+    statusBits = bin(int(answer[10:11], 16)).lstrip('0b').zfill(3)
+    hvOn = hvOnStatus[statusBits[0]]
+    fault = faultStatus[statusBits[1]]
+    ctrlMode = controlMode[statusBits[2]]
+
+    voltage = round(int(answer[1:4], 16) * hvdevice.MAX_VOLTAGE
+                    / hvdevice.MAX_HEX_VAL_RECEIVE, 1)
+    current = round(int(answer[4:7], 16) * hvdevice.MAX_CURENT
+                    / hvdevice.MAX_HEX_VAL_RECEIVE, 1)
+    return voltage, current, hvOn, fault, ctrlMode
+
+
+def queryAnswer(voltCounts, curCounts, status):
+    '''Return the answer of the HV to a Q command'''
+    body = b'%03X%03X000%X' % (voltCounts, curCounts, status)
+    return b'R' + body + checksum.calculateChksum(body)
+
+
+def status(reading):
+    return (reading.voltage, reading.current, reading.hvOn,
+            reading.fault, reading.ctrlMode)
+
+
+def check(hvdevice):
+    '''Make sure the old and new codecs give the same results'''
+    for counts in range(0, 0x400, 13):
+        for state in range(8):
+            answer = queryAnswer(counts, 0x3FF - counts, state)
+            expected = legacyDecode(hvdevice, answer)
+            assert status(hvdevice._decodeQuery(answer)) == expected
+    assert codec.QUERY_FRAME == legacyEncode('Q')
+    assert codec.VERSION_FRAME == legacyEncode('V')
+    for volt in range(0, 401, 7):
+        for cur in range(0, 31, 3):
+            assert (bytes(hvdevice._setFrame(volt / 10, cur / 10, 'on'))
+                    == legacySet(volt / 10, cur / 10))
+
+
+def main(number=200000):
+    hvdevice = hv.HvController()
+    check(hvdevice)
+    uncached = hv.HvController()
+    uncached.FRAME_CACHE_SIZE = 0
+    answer = queryAnswer(0x1FF, 0x0FF, 4)
+    cases = [
+        ('Q before', lambda: legacyEncode('Q')),
+        ('Q after', lambda: codec.QUERY_FRAME),
+        ('V before', lambda: legacyEncode('V')),
+        ('V after', lambda: codec.VERSION_FRAME),
+        ('S before', lambda: legacySet(12.3, 1.2)),
+        ('S after', lambda: uncached._setFrame(12.3, 1.2, 'on')),
+        ('S cached', lambda: hvdevice._setFrame(12.3, 1.2, 'on')),
+        ('R before', lambda: legacyDecode(hvdevice, answer)),
+        ('R after', lambda: hvdevice._decodeQuery(answer)),
+        ]
+    print('Encoding cost per frame and decoding cost per answer (ns)')
+    for name, fn in cases:
+        best = min(timeit.repeat(fn, number=number, repeat=5))
+        print('{:<10} {:8.0f}'.format(name, 1e9 * best / number))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the HvControllerGUI software.
+# Benchmark of the command output console: cost of an append as the
+# session grows, with the former unbounded QTextEdit and with the
+# bounded and batched CommandConsole.
+#
+# Copyright 2018-2019 Aurélie Vancraeyenest
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from PyQt5 import QtWidgets  # noqa: E402
+
+import console  # noqa: E402
+
+MESSAGE = 'The set command sent succesfully: 10.0 V, 0.1 mA '
+
+
+def run(app, append, view, total, step, batch):
+    '''Print the cost of an append every step messages'''
+    for done in range(0, total, step):
+        start = time.perf_counter()
+        for i in range(step):
+            append(MESSAGE)
+            if i % batch == batch - 1:
+                app.processEvents()
+        app.processEvents()
+        cost = 1e6 * (time.perf_counter() - start) / step
+        print('{:>9} {:10.1f} {:>9}'.format(done + step, cost,
+                                            view.document().blockCount()))
+
+
+def main(total=50000, step=10000, batch=10):
+    app = QtWidgets.QApplication(sys.argv[:1])
+    print('{} messages, {} per event loop iteration'.format(total, batch))
+
+    print('\nQTextEdit.append (before)\n{:>9} {:>10} {:>9}'
+          .format('messages', 'us/append', 'lines'))
+    textEdit = QtWidgets.QTextEdit()
+    textEdit.setReadOnly(True)
+    textEdit.show()
+    run(app, textEdit.append, textEdit, total, step, batch)
+    textEdit.close()
+
+    print('\nCommandConsole, 5000 lines\n{:>9} {:>10} {:>9}'
+          .format('messages', 'us/append', 'lines'))
+    plainText = QtWidgets.QPlainTextEdit()
+    plainText.setReadOnly(True)
+    plainText.show()
+    outputs = console.CommandConsole(plainText)
+    run(app, lambda text: outputs.append(text, console.SET), plainText,
+        total, step, batch)
+    plainText.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the HvControllerGUI software.
+# Benchmark of the setpoint correction: recovery time of an emulated
+# device after the loss of its setpoint, and correction of a steady
+# offset of the output with and without the trim of the setpoint.
+#
+# Copyright 2018-2019 Aurélie Vancraeyenest
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import time
+import functools
+
+from PyQt5 import QtCore
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import HvController as hv  # noqa: E402
+import correction  # noqa: E402
+import stability  # noqa: E402
+import workers  # noqa: E402
+from HvEmulator import FjModel, PtyEmulator  # noqa: E402
+
+TARGET = 20.0
+
+
+class OffsetModel(FjModel):
+    ''' FJ model whose output is gain times the set voltage '''
+
+    def __init__(self, gain=0.985, **kwargs):
+        super(OffsetModel, self).__init__(**kwargs)
+        self.gain = gain
+
+    @property
+    def voltage(self):
+        return self.gain * super(OffsetModel, self).voltage
+
+
+def spin(app, duration, until=None):
+    '''Process the Qt events for duration seconds or until until()'''
+    end = time.monotonic() + duration
+    while time.monotonic() < end and not (until and until()):
+        app.processEvents()
+        time.sleep(0.005)
+
+
+def correct(app, devices, disturb=None, maxTrim=0, timeout=20.0):
+    '''
+    Run the correction of a device once
+
+    Returns the time from the disturbance (or from the end of the
+    settling when none) to the end of the correction in seconds, and
+    the CorrectionStep ending it, None if none before timeout
+    '''
+    port = devices.ports[0]
+    hvdevice = hv.HvController()
+    hvdevice.openPortHV(port)
+    hvdevice.setHV(TARGET, 1.0, verbosity=True)
+    lsb = hvdevice.MAX_VOLTAGE / hvdevice.MAX_HEX_VAL_SENT
+    acquisition = workers.HvAcquisition(
+            hvdevice, 0.5, monitor=stability.StabilityMonitor(settle=2.0),
+            corrector=correction.SetpointCorrector(lsb=lsb, maxTrim=maxTrim))
+    steps = []
+    acquisition.setpointCorrected.connect(steps.append)
+    acquisition.start()
+    try:
+        spin(app, 3.0)
+        if disturb is not None:
+            disturb(devices.model(port))
+        start = time.monotonic()
+        spin(app, timeout, lambda: steps)
+        elapsed = time.monotonic() - start
+    finally:
+        acquisition.stop()
+        acquisition.wait()
+        hvdevice.device.close()
+    return elapsed, (steps[0] if steps else None)
+
+
+def dropSetpoint(model):
+    model.setVoltage = int(model.setVoltage * 0.9)
+
+
+def main(repeat=5):
+    app = QtCore.QCoreApplication(sys.argv)
+    devices = PtyEmulator()
+    devices.start()
+    try:
+        print('Recovery after the loss of a {:g} kV setpoint (s)'.format(
+                TARGET))
+        print('{:<5} {:>10} {:>10} {:>9}'.format('run', 'total', 'metric',
+                                                 'commands'))
+        for i in range(repeat):
+            elapsed, step = correct(app, devices, dropSetpoint)
+            if step is None:
+                print('{:<5} {:>10}'.format(i, 'none'))
+            else:
+                print('{:<5} {:10.2f} {:10.2f} {:9d}'.format(
+                        i, elapsed, step.duration, step.attempts))
+    finally:
+        devices.stop()
+
+    devices = PtyEmulator(model=functools.partial(OffsetModel, gain=0.985))
+    devices.start()
+    try:
+        print('Steady offset of {:.1f} % of the output'.format(1.5))
+        print('{:<9} {:>10} {:>9} {:>6}'.format('max trim', 'result',
+                                                'commands', 'trim'))
+        for maxTrim in (0, 64):
+            elapsed, step = correct(app, devices, maxTrim=maxTrim)
+            print('{:<9} {:>10} {:9d} {:+6d}'.format(
+                    maxTrim, step.kind, step.attempts, step.trim))
+    finally:
+        devices.stop()
+
+
+if __name__ == '__main__':
+    main()
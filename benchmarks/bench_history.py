@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the HvControllerGUI software.
+# Micro-benchmark of the HvHistory ring buffer: cost of an append and of
+# the last n records and last seconds queries on a full buffer.
+#
+# Copyright 2018-2019 Aurélie Vancraeyenest
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import HvController as hv  # noqa: E402
+import history  # noqa: E402
+
+
+def check(capacity=100):
+    '''Compare the views with a plain list of the last records'''
+    hvhistory = history.HvHistory(capacity)
+    records = []
+    for i in range(3 * capacity + 7):
+        reading = hv.HvReading(0.5 * i, i & 0x3FF, (2 * i) & 0x3FF, i & 0xF,
+                               0.0, 0.0)
+        hvhistory.append(reading)
+        records.append(reading[:4])
+        for n in (1, capacity // 3, capacity):
+            assert hvhistory.last(n).tolist() == records[-n:][-len(records):]
+    window = hvhistory.window(10.0)
+    assert window.tolist() == records[-21:]
+    assert window.base is not None
+
+
+def main(capacity=172800, number=100000):
+    check()
+    hvhistory = history.HvHistory(capacity)
+    reading = hv.HvReading(0.0, 0x1FF, 0x0FF, 4, 20.0, 1.5)
+    for i in range(capacity):
+        hvhistory.append(reading._replace(timestamp=0.5 * i))
+    cases = [
+        ('append', lambda: hvhistory.append(reading)),
+        ('last 120', lambda: hvhistory.last(120)),
+        ('window 60 s', lambda: hvhistory.window(60.0)),
+        ]
+    print('Cost per call on a full buffer of {} records (ns)'
+          .format(capacity))
+    for name, fn in cases:
+        best = min(timeit.repeat(fn, number=number, repeat=5))
+        print('{:<12} {:8.0f}'.format(name, 1e9 * best / number))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the HvControllerGUI software.
+# Benchmark of the per-command latency of the HvController against a
+# pseudo-terminal emulated device, with and without framed reads.
+#
+# Copyright 2018-2019 Aurélie Vancraeyenest
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import time
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import HvController as hv  # noqa: E402
+from HvEmulator import PtyEmulator  # noqa: E402
+
+
+def measure(port, framedRead, repeat):
+    '''Return the list of queryHV() and setHV() durations in seconds'''
+    hvdevice = hv.HvController(framedRead=framedRead)
+    hvdevice.openPortHV(port)
+    durations = {'queryHV': [], 'setHV': []}
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            hvdevice.queryHV()
+            durations['queryHV'].append(time.perf_counter() - start)
+        for _ in range(repeat // 4 or 1):
+            start = time.perf_counter()
+            hvdevice.setHV(10.0, 1.0, verbosity=True)
+            durations['setHV'].append(time.perf_counter() - start)
+    finally:
+        hvdevice.device.close()
+    return durations
+
+
+def main(repeat=40, baudrate=9600):
+    devices = PtyEmulator(baudrate=baudrate)
+    devices.start()
+    try:
+        print('Per-command latency at {} baud (ms)'.format(baudrate))
+        for framedRead in (False, True):
+            durations = measure(devices.ports[0], framedRead, repeat)
+            for name, values in durations.items():
+                values = sorted(values)
+                print('{:<8} framedRead={:<5} mean {:7.2f}  p50 {:7.2f}  '
+                      'max {:7.2f}'.format(
+                          name, str(framedRead),
+                          1e3 * statistics.mean(values),
+                          1e3 * values[len(values) // 2],
+                          1e3 * values[-1]))
+    finally:
+        devices.stop()
+
+
+if __name__ == '__main__':
+    main()
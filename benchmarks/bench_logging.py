@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the HvControllerGUI software.
+# Benchmark of the cost of a log record for the calling thread: the former
+# logging.FileHandler against the QueueHandler of the logwriter module, on
+# a local file and on a file whose flushes take 5 ms like a network mount.
+#
+# Copyright 2018-2019 Aurélie Vancraeyenest
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+
+import logwriter  # noqa: E402
+
+SLOW_FLUSH = 0.005
+
+
+class SlowFileHandler(logging.FileHandler):
+    ''' FileHandler whose flushes take SLOW_FLUSH seconds '''
+
+    def flush(self):
+        super(SlowFileHandler, self).flush()
+        time.sleep(SLOW_FLUSH)
+
+
+class SlowBatchHandler(logwriter.BatchRotatingFileHandler):
+    ''' BatchRotatingFileHandler whose flushes take SLOW_FLUSH seconds '''
+
+    def flushBatch(self):
+        super(SlowBatchHandler, self).flushBatch()
+        time.sleep(SLOW_FLUSH)
+
+
+def measure(logger, count, interval):
+    ''' Time each of count records logged every interval seconds, in us '''
+    durations = np.empty(count)
+    for i in range(count):
+        start = time.perf_counter()
+        logger.info('Voltage %.2f kV out of the band', 20.0 + i * 1e-3)
+        durations[i] = time.perf_counter() - start
+        time.sleep(interval)
+    return 1e6 * durations
+
+
+def main(count=500, interval=0.001):
+    directory = tempfile.mkdtemp()
+    formatter = logging.Formatter(logwriter.LOG_FORMAT)
+    print('{} records, one every {:g} ms, caller time in us'.format(
+            count, 1e3 * interval))
+    print('{:<8} {:<12} {:>8} {:>8} {:>8} {:>8}'.format(
+            'file', 'handler', 'mean', 'p99', 'max', 'flushes'))
+    for slow in (False, True):
+        for queued in (False, True):
+            logger = logging.getLogger('bench-{}-{}'.format(slow, queued))
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+            path = os.path.join(directory, logger.name + '.log')
+            writer = None
+            if queued:
+                handler = (SlowBatchHandler if slow else
+                           logwriter.BatchRotatingFileHandler)(
+                        path, maxBytes=2 ** 20, backupCount=1)
+                writer = logwriter.LogWriter([handler], flushInterval=0.1)
+                logger.addHandler(writer.queueHandler)
+                writer.start()
+            else:
+                handler = (SlowFileHandler if slow else
+                           logging.FileHandler)(path, mode='w')
+                logger.addHandler(handler)
+            handler.setFormatter(formatter)
+            flushes = [0]
+            flush = handler.flushBatch if queued else handler.flush
+
+            def counted():
+                flushes[0] += 1
+                flush()
+
+            if queued:
+                handler.flushBatch = counted
+            else:
+                handler.flush = counted
+            durations = measure(logger, count, interval)
+            if writer is not None:
+                logger.removeHandler(writer.queueHandler)
+                writer.stop()
+            else:
+                logger.removeHandler(handler)
+                handler.close()
+            with open(path) as logFile:
+                assert sum(1 for line in logFile) == count
+            print('{:<8} {:<12} {:8.1f} {:8.1f} {:8.1f} {:8d}'.format(
+                    'slow' if slow else 'local',
+                    'queue' if queued else 'FileHandler', durations.mean(),
+                    np.percentile(durations, 99), durations.max(),
+                    flushes[0]))
+
+
+if __name__ == '__main__':
+    main()
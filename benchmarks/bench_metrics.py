@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the HvControllerGUI software.
+# Micro-benchmark of the cost of the metrics recorded on the hot path of
+# each transaction, and of a snapshot and a Prometheus export.
+#
+# Copyright 2018-2019 Aurélie Vancraeyenest
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import codec  # noqa: E402
+import metrics  # noqa: E402
+
+
+def main(number=200000, ports=8):
+    registry = metrics.MetricsRegistry()
+    recorders = [metrics.ControllerMetrics('COM{}'.format(i), registry)
+                 for i in range(ports)]
+    recorder = recorders[0]
+    answer = b'R1FF0FF0004XX\r'
+    cases = [
+        ('transaction', lambda: recorder.transaction(codec.QUERY_FRAME,
+                                                     answer, 0.0206), number),
+        ('snapshot', registry.snapshot, number // 100),
+        ('prometheus', registry.prometheus, number // 100),
+        ]
+    print('Cost per call with {} ports (ns)'.format(ports))
+    for name, fn, count in cases:
+        best = min(timeit.repeat(fn, number=count, repeat=5))
+        print('{:<12} {:10.0f}'.format(name, 1e9 * best / count))
+
+
+if __name__ == '__main__':
+    main()
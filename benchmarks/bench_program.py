@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the HvControllerGUI software.
+# Benchmark of the timing of the HV programs run by the acquisition
+# thread: lateness of each command and drift at the end of the program,
+# with and without a busy thread loading the interpreter like the GUI.
+#
+# Copyright 2018-2019 Aurélie Vancraeyenest
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+from PyQt5 import QtCore  # noqa: E402
+
+import HvController as hv  # noqa: E402
+import program  # noqa: E402
+import workers  # noqa: E402
+from HvEmulator import PtyEmulator  # noqa: E402
+
+PROGRAM = '''
+set, 1, 5.0, 1.0
+ramp, 8, 20.0, 1.0
+set, 1, 20.0, 1.0
+'''
+
+
+def runProgram(port, busy):
+    hvdevice = hv.HvController()
+    hvdevice.openPortHV(port)
+    acquisition = workers.HvAcquisition(hvdevice)
+    schedule = program.compileProgram(program.parseProgram(
+            PROGRAM.splitlines()), rampInterval=0.1)
+    run = program.ProgramRun(schedule, 'bench')
+    ended = threading.Event()
+    acquisition.programEnded.connect(lambda run: ended.set(),
+                                     QtCore.Qt.DirectConnection)
+
+    stop = threading.Event()
+
+    def load():
+        while not stop.is_set():
+            sum(range(2000))
+
+    loader = threading.Thread(target=load)
+    if busy:
+        loader.start()
+    acquisition.start()
+    try:
+        acquisition.startProgram(run)
+        ended.wait()
+    finally:
+        stop.set()
+        acquisition.stop()
+        acquisition.wait()
+        hvdevice.device.close()
+        if busy:
+            loader.join()
+    return run
+
+
+def main():
+    devices = PtyEmulator()
+    devices.start()
+    try:
+        print('Program of 10 s, commands every 0.1 s, lateness in ms')
+        print('{:<10} {:>6} {:>6} {:>6} {:>8} {:>10}'.format(
+                'load', 'mean', 'p99', 'max', 'skipped', 'end drift'))
+        for busy in (False, True):
+            run = runProgram(devices.ports[0], busy)
+            lateness = 1e3 * run.lateness()
+            last = np.flatnonzero(~np.isnan(run.achieved))[-1]
+            drift = 1e3 * (run.achieved[last] - run.schedule.times[last])
+            print('{:<10} {:6.1f} {:6.1f} {:6.1f} {:8d} {:10.1f}'.format(
+                    'busy' if busy else 'idle', lateness.mean(),
+                    np.percentile(lateness, 99), lateness.max(), run.skipped,
+                    drift))
+    finally:
+        devices.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the HvControllerGUI software.
+# Benchmark of the ramp planner: planning time and number of commands of
+# program.planRamp() against sampling the ramp at the command bandwidth
+# and rounding each setpoint like setHV().
+#
+# Copyright 2018-2019 Aurélie Vancraeyenest
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import HvController as hv  # noqa: E402
+import program  # noqa: E402
+
+MAX_VOLTAGE = hv.HvController.MAX_VOLTAGE
+MAX_COUNTS = hv.HvController.MAX_HEX_VAL_SENT
+
+#: start (kV), end (kV), duration (s), bandwidth (commands/s)
+RAMPS = ((0.0, 1.0, 600.0, 2.0),
+         (0.0, 20.0, 300.0, 2.0),
+         (0.0, 40.0, 60.0, 10.0),
+         (40.0, 0.0, 3600.0, 10.0))
+
+
+def sampledRamp(start, end, duration, bandwidth):
+    ''' One setpoint per command slot, rounded one at a time '''
+    count = int(duration * bandwidth)
+    codes = []
+    for i in range(1, count + 1):
+        voltToSet = start + (end - start) * i / count
+        codes.append(round(voltToSet * MAX_COUNTS / MAX_VOLTAGE))
+    return codes
+
+
+def main(repeat=20):
+    print('{:>18} {:>9} {:>9} {:>11} {:>11}'.format(
+            'ramp', 'sampled', 'planned', 'sampled us', 'planned us'))
+    for start, end, duration, bandwidth in RAMPS:
+        slewRate = abs(end - start) / duration
+        sampled = sampledRamp(start, end, duration, bandwidth)
+        times, codes = program.planRamp(start, end, slewRate, bandwidth,
+                                        MAX_VOLTAGE, MAX_COUNTS)
+        sampledTime = timeit.timeit(
+                lambda: sampledRamp(start, end, duration, bandwidth),
+                number=repeat) / repeat
+        plannedTime = timeit.timeit(
+                lambda: program.planRamp(start, end, slewRate, bandwidth,
+                                         MAX_VOLTAGE, MAX_COUNTS),
+                number=repeat) / repeat
+        name = '{:g}-{:g} kV {:g} s'.format(start, end, duration)
+        print('{:>18} {:>9} {:>9} {:>11.0f} {:>11.0f}'.format(
+                name, len(sampled), len(codes), 1e6 * sampledTime,
+                1e6 * plannedTime))
+
+
+if __name__ == '__main__':
+    main()
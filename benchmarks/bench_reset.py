@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the HvControllerGUI software.
+# Benchmark of the latency of a reset submitted to an acquisition thread
+# saturated with queued commands, with the reset priority and queued
+# behind the other commands as before the priority queue.
+#
+# Copyright 2018-2019 Aurélie Vancraeyenest
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import time
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import HvController as hv  # noqa: E402
+import workers  # noqa: E402
+from HvEmulator import PtyEmulator  # noqa: E402
+
+
+def resetLatency(port, priority, backlog):
+    '''Time from the submission of a reset to its answer, in seconds'''
+    hvdevice = hv.HvController()
+    hvdevice.openPortHV(port)
+    acquisition = workers.HvAcquisition(hvdevice)
+    done = threading.Event()
+
+    def reset():
+        hvdevice.resetHV(verbosity=True)
+        done.set()
+
+    acquisition.start()
+    try:
+        for i in range(backlog):
+            acquisition.submit(workers.HvWorker(hvdevice.setHV, i / 100, 0.1,
+                                                verbosity=True),
+                               workers.PRIORITY_PROGRAM)
+        time.sleep(0.1)
+        start = time.perf_counter()
+        acquisition.submit(workers.HvWorker(reset), priority)
+        done.wait()
+        return time.perf_counter() - start
+    finally:
+        acquisition.stop()
+        acquisition.wait()
+        hvdevice.device.close()
+
+
+def main(backlog=50, baudrate=9600):
+    devices = PtyEmulator(baudrate=baudrate)
+    devices.start()
+    try:
+        print('Reset latency behind {} queued program steps at {} baud (ms)'
+              .format(backlog, baudrate))
+        for name, priority in (('reset priority', workers.PRIORITY_RESET),
+                               ('queued (FIFO)', workers.PRIORITY_PROGRAM)):
+            latency = resetLatency(devices.ports[0], priority, backlog)
+            print('{:<15} {:8.1f}'.format(name, 1e3 * latency))
+    finally:
+        devices.stop()
+
+
+if __name__ == '__main__':
+    main()
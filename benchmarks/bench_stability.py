@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the HvControllerGUI software.
+# Benchmark of the stability monitor: cost of an update of the running
+# statistics against computing them over the window of the history, and
+# detection latency of a voltage step against the former check of one
+# reading every minute.
+#
+# Copyright 2018-2019 Aurélie Vancraeyenest
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+
+import HvController as hv  # noqa: E402
+import history  # noqa: E402
+import stability  # noqa: E402
+
+RATE = 2.0
+TARGET = 20.0
+NOISE = 0.02
+
+
+def updateCost(count=20000):
+    ''' Time of an update of the monitor and of the numpy statistics, us '''
+    rng = np.random.default_rng(0)
+    volts = TARGET + NOISE * rng.standard_normal(count)
+    times = np.arange(count) / RATE
+    monitor = stability.StabilityMonitor()
+    start = time.perf_counter()
+    for t, v in zip(times.tolist(), volts.tolist()):
+        monitor.update(t, v, TARGET)
+    monitorTime = time.perf_counter() - start
+
+    scale = hv.HvController.MAX_HEX_VAL_RECEIVE / hv.HvController.MAX_VOLTAGE
+    hvhistory = history.HvHistory()
+    for t, v in zip(times.tolist(), volts.tolist()):
+        hvhistory.append(hv.HvReading(t, int(v * scale), 0, 4, v, 0.0))
+    now = times[-1]
+    start = time.perf_counter()
+    for i in range(100):
+        for window in stability.WINDOWS:
+            records = hvhistory.window(window, now)
+            voltage = records['voltCounts'] * hvhistory.voltScale
+            voltage.mean(), voltage.std(ddof=1)
+            voltage.min(), voltage.max()
+            np.polyfit(records['timestamp'], voltage, 1)
+    numpyTime = (time.perf_counter() - start) / 100
+    return 1e6 * monitorTime / count, 1e6 * numpyTime
+
+
+def detectionLatency(steps=200, delta=0.5):
+    ''' Latency of the detection of voltage steps out of the band, in s '''
+    rng = np.random.default_rng(1)
+    monitorLatency = []
+    minuteLatency = []
+    for i in range(steps):
+        onset = 60 + rng.uniform(0, 60)
+        monitor = stability.StabilityMonitor(settle=0)
+        t = 0.0
+        while True:
+            t += 1 / RATE
+            voltage = TARGET + NOISE * rng.standard_normal()
+            if t >= onset:
+                voltage -= delta
+            if monitor.update(t, voltage, TARGET) is not None:
+                monitorLatency.append(t - onset)
+                break
+        # the former check read one reading at each minute tick
+        minuteLatency.append(60 * np.ceil(onset / 60) - onset)
+    return np.array(monitorLatency), np.array(minuteLatency)
+
+
+def main():
+    monitorUpdate, numpyUpdate = updateCost()
+    print('Cost of an update of the statistics of {} windows (us)'.format(
+            len(stability.WINDOWS)))
+    print('{:>12} {:>12}'.format('monitor', 'numpy'))
+    print('{:12.2f} {:12.1f}'.format(monitorUpdate, numpyUpdate))
+
+    monitor, minute = detectionLatency()
+    print('Detection latency of a step out of the band, polls at {:g} Hz '
+          '(s)'.format(RATE))
+    print('{:<12} {:>8} {:>8}'.format('check', 'mean', 'max'))
+    for name, latency in (('monitor', monitor), ('every 60 s', minute)):
+        print('{:<12} {:8.1f} {:8.1f}'.format(name, latency.mean(),
+                                              latency.max()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the HvControllerGUI software.
+# Benchmark of the start of the GUI: import time profile of the main
+# module from python -X importtime, and time from the start of the
+# interpreter to the main window shown, against the 300 ms target.
+#
+# Copyright 2018-2019 Aurélie Vancraeyenest
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+#: Target time from the start of the interpreter to the window shown, s
+TARGET = 0.3
+
+SHOW_WINDOW = '''
+import sys
+sys.path.insert(0, {root!r})
+from PyQt5 import QtWidgets
+import HvControllerGUI
+app = QtWidgets.QApplication(sys.argv)
+form = HvControllerGUI.MainWindow(telemetryFormat=None)
+form.show()
+app.processEvents()
+print('shown', flush=True)
+form.on_actionExit_triggered()
+'''
+
+
+def environment():
+    ''' Environment of the child interpreters, offscreen without display '''
+    env = dict(os.environ)
+    if (sys.platform.startswith('linux') and 'DISPLAY' not in env
+            and 'WAYLAND_DISPLAY' not in env):
+        env.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    return env
+
+
+def importProfile(repeat):
+    '''
+    Median cumulative import time of the modules imported by the GUI
+
+    Returns a dict of the time in seconds of each module imported
+    directly by HvControllerGUI, and of HvControllerGUI itself
+    '''
+    runs = []
+    for i in range(repeat):
+        result = subprocess.run(
+                [sys.executable, '-X', 'importtime', '-c',
+                 'import HvControllerGUI'], cwd=ROOT, env=environment(),
+                stderr=subprocess.PIPE, universal_newlines=True, check=True)
+        times = {}
+        for line in result.stderr.splitlines():
+            if not line.startswith('import time:') or 'cumulative' in line:
+                continue
+            own, cumulative, name = line[len('import time:'):].split('|')
+            # a module is listed after its imports, indented by 2 more
+            # spaces: keep the top level ones imported by the main module
+            indent = len(name) - len(name.lstrip()) - 1
+            if indent == 2:
+                times[name.strip()] = 1e-6 * int(cumulative)
+            elif indent == 0:
+                if name.strip() == 'HvControllerGUI':
+                    times[name.strip()] = 1e-6 * int(cumulative)
+                    break
+                times = {}
+        runs.append(times)
+    names = [name for name in runs[-1] if all(name in run for run in runs)]
+    return {name: statistics.median(run[name] for run in runs)
+            for name in names}
+
+
+def windowTimes(repeat):
+    ''' Times from the start of the interpreter to the window shown, s '''
+    code = SHOW_WINDOW.format(root=ROOT)
+    durations = []
+    with tempfile.TemporaryDirectory() as directory:
+        for i in range(repeat):
+            start = time.perf_counter()
+            child = subprocess.Popen([sys.executable, '-c', code],
+                                     cwd=directory, env=environment(),
+                                     stdout=subprocess.PIPE,
+                                     stderr=subprocess.DEVNULL,
+                                     universal_newlines=True)
+            line = child.stdout.readline()
+            durations.append(time.perf_counter() - start)
+            child.communicate()
+            if line.strip() != 'shown':
+                raise RuntimeError('the GUI did not start')
+    return durations
+
+
+def main():
+    parser = argparse.ArgumentParser(
+            description='Benchmark of the start of the GUI')
+    parser.add_argument('--repeat', type=int, default=7,
+                        help='number of starts measured (default 7)')
+    parser.add_argument('--top', type=int, default=12,
+                        help='number of imports listed (default 12)')
+    args = parser.parse_args()
+
+    profile = importProfile(args.repeat)
+    print('Median cumulative import time of HvControllerGUI and of its '
+          'imports (ms)')
+    names = sorted(profile, key=profile.get, reverse=True)
+    for name in names[:args.top]:
+        print('{:<24} {:8.1f}'.format(name, 1e3 * profile[name]))
+
+    durations = windowTimes(args.repeat)
+    print('Start of the interpreter to the window shown (ms), target {:g}'
+          .format(1e3 * TARGET))
+    print('{:>8} {:>8} {:>8} {:>8}'.format('first', 'median', 'max',
+                                           'target'))
+    print('{:8.1f} {:8.1f} {:8.1f} {:>8}'.format(
+            1e3 * durations[0], 1e3 * statistics.median(durations),
+            1e3 * max(durations),
+            'met' if statistics.median(durations) < TARGET else 'missed'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the HvControllerGUI software.
+# Benchmark of the telemetry sink: cost of a row for the acquisition
+# thread against writing and flushing each row at once, and size of a
+# simulated day of polls at 2 Hz in CSV, with and without the run-length
+# encoding of the status fields, and in Parquet.
+#
+# Copyright 2018-2019 Aurélie Vancraeyenest
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import csv
+import glob
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+
+import HvController as hv  # noqa: E402
+import codec  # noqa: E402
+import telemetry  # noqa: E402
+
+RATE = 2.0
+DAY = 86400
+
+
+def readings(count):
+    ''' Noisy readings at 20 kV, HV on, sampled at RATE '''
+    rng = np.random.default_rng(0)
+    volts = 512 + rng.integers(-2, 3, count)
+    scale = hv.HvController.MAX_VOLTAGE / hv.HvController.MAX_HEX_VAL_RECEIVE
+    return [hv.HvReading(i / RATE, int(v), 300, 4, int(v) * scale, 0.88)
+            for i, v in enumerate(volts)]
+
+
+def rowCost(directory, count=20000):
+    ''' Time of a poll row for the calling thread, in us '''
+    samples = readings(count)
+    sink = telemetry.TelemetrySink(directory)
+    start = time.perf_counter()
+    for reading in samples:
+        sink.poll('bench', reading)
+    sinkTime = time.perf_counter() - start
+    sink.close()
+
+    table = codec.STATUS_TABLE
+    with open(os.path.join(directory, 'direct.csv'), 'w',
+              newline='') as csvFile:
+        writer = csv.writer(csvFile)
+        start = time.perf_counter()
+        for reading in samples:
+            status = table[reading.status]
+            writer.writerow(('{:.3f}'.format(reading.timestamp), 'bench',
+                             'poll', '{:.4f}'.format(reading.voltage),
+                             '{:.4f}'.format(reading.current), '',
+                             reading.status, int(status[0]), int(status[1]),
+                             status[2]))
+            csvFile.flush()
+        directTime = time.perf_counter() - start
+    return 1e6 * sinkTime / count, 1e6 * directTime / count
+
+
+def daySize(directory, fileFormat):
+    ''' Size of a day of polls of a device in bytes '''
+    sink = telemetry.TelemetrySink(directory, fileFormat)
+    sink._epoch = time.mktime(time.localtime()[:3] + (0, 0, 1, 0, 0, -1))
+    for reading in readings(int(DAY * RATE) - 10):
+        sink.poll('day', reading)
+    sink.close()
+    path, = glob.glob(os.path.join(directory, 'telemetry-day-*.' + fileFormat))
+    return os.path.getsize(path)
+
+
+def main():
+    directory = tempfile.mkdtemp()
+    sinkRow, directRow = rowCost(directory)
+    print('Cost of a row for the acquisition thread (us)')
+    print('{:>12} {:>12}'.format('sink', 'direct'))
+    print('{:12.2f} {:12.2f}'.format(sinkRow, directRow))
+
+    print('Day of polls at {:g} Hz (MB)'.format(RATE))
+    csvSize = daySize(directory, 'csv')
+    # Same rows with the status fields '4,1,0,voltage' on every row
+    # instead of ',,,'
+    fullSize = csvSize + int(DAY * RATE) * len('410voltage')
+    print('{:>12} {:>12} {:>12}'.format('csv', 'csv no RLE', 'parquet'))
+    try:
+        parquetSize = '{:12.2f}'.format(daySize(directory, 'parquet') / 1e6)
+    except ImportError:
+        parquetSize = '{:>12}'.format('no pyarrow')
+    print('{:12.2f} {:12.2f} {}'.format(csvSize / 1e6, fullSize / 1e6,
+                                        parquetSize))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the HvControllerGUI software.
+# Benchmark suite run against emulated devices: per-command latency,
+# polling rate of a port, aggregate polling rate of several ports and
+# cost of the GUI update. The results are written as JSON to track the
+# regressions between releases.
+#
+# Copyright 2018-2019 Aurélie Vancraeyenest
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import datetime
+import tempfile
+import statistics
+import subprocess
+
+from PyQt5 import QtWidgets
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import HvController as hv  # noqa: E402
+import HvRack  # noqa: E402
+from HvEmulator import PtyEmulator  # noqa: E402
+
+
+def summary(durations):
+    '''Return the mean and percentiles of durations in seconds, in ms'''
+    cuts = statistics.quantiles(durations, n=100, method='inclusive')
+    return {'count': len(durations),
+            'mean': 1e3 * statistics.mean(durations),
+            'p50': 1e3 * cuts[49],
+            'p90': 1e3 * cuts[89],
+            'p99': 1e3 * cuts[98],
+            'max': 1e3 * max(durations)}
+
+
+def commandLatency(baudrate, repeat):
+    '''Latency of queryHV, setHV, version and resetHV on one port'''
+    devices = PtyEmulator(baudrate=baudrate)
+    devices.start()
+    hvdevice = hv.HvController()
+    hvdevice.openPortHV(devices.ports[0])
+    commands = {'queryHV': hvdevice.queryHV,
+                'setHV': lambda: hvdevice.setHV(10.0, 1.0, verbosity=True),
+                'version': hvdevice.version,
+                'resetHV': lambda: hvdevice.resetHV(verbosity=True)}
+    results = {}
+    try:
+        for name, command in commands.items():
+            durations = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                command()
+                durations.append(time.perf_counter() - start)
+            results[name] = summary(durations)
+    finally:
+        hvdevice.device.close()
+        devices.stop()
+    return results
+
+
+def spin(app, duration):
+    '''Process the Qt events for duration seconds'''
+    end = time.monotonic() + duration
+    while time.monotonic() < end:
+        app.processEvents()
+        time.sleep(0.001)
+
+
+def pollRate(app, baudrate, count, duration):
+    '''
+    Readings per second of count ports polled back to back
+
+    The ports are opened through a HvRack with a fixed zero interval and
+    the readings are delivered to the rack by the event loop, so the
+    whole acquisition path is measured. The readings are counted in the
+    history of each device.
+    '''
+    devices = PtyEmulator(count=count, baudrate=baudrate)
+    devices.start()
+    rack = HvRack.HvRack(interval=0, adaptive=False)
+    try:
+        for port in devices.ports:
+            rack.openPort(port)
+        spin(app, 0.2)
+        before = {port: len(rack.states[port].history)
+                  for port in rack.ports()}
+        spin(app, duration)
+        rates = [(len(rack.states[port].history) - before[port]) / duration
+                 for port in rack.ports()]
+    finally:
+        rack.closeAll()
+        # deliver the last readings and the end of the threads to the rack
+        spin(app, 0.1)
+        devices.stop()
+    return {'ports': count,
+            'total': sum(rates),
+            'perPortMin': min(rates),
+            'perPortMax': max(rates)}
+
+
+def updateStatusCost(app, repeat):
+    '''Time of MainWindow.updateStatus in microseconds'''
+    import HvControllerGUI
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        # the main window truncates hvCtrl.log in the current directory
+        os.chdir(tmp)
+        try:
+            window = HvControllerGUI.MainWindow()
+            for port in ('bench0', 'bench1'):
+                window.rack.states[port] = HvRack.HvDeviceState(port)
+                window._addRackRow(port)
+            window.activePort = 'bench0'
+            readings = [hv.HvReading(0.0, counts, counts // 2, status,
+                                     0.0, 0.0)
+                        for counts, status in ((0x1FF, 4), (0x200, 5),
+                                               (0x000, 2))]
+            readings = [reading._replace(
+                    voltage=round(40.0 * reading.voltCounts / 0x3FF, 1),
+                    current=round(3.0 * reading.curCounts / 0x3FF, 1))
+                        for reading in readings]
+            results = {}
+            for name, port in (('activePort', 'bench0'),
+                               ('otherPort', 'bench1')):
+                start = time.perf_counter()
+                for i in range(repeat):
+                    window.updateStatus(port, readings[i % len(readings)])
+                    if i % 3 == 2:
+                        # one rendering per frame of three readings
+                        window.statusView.flush()
+                app.processEvents()
+                results[name] = 1e6 * (time.perf_counter() - start) / repeat
+            window.close()
+        finally:
+            os.chdir(cwd)
+    return results
+
+
+def metadata(baudrate):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                                cwd=ROOT, capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'date': datetime.datetime.now().isoformat(timespec='seconds'),
+            'commit': commit,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'baudrate': baudrate,
+            'qtPlatform': os.environ.get('QT_QPA_PLATFORM')}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+            description='Run the benchmark suite against emulated devices')
+    parser.add_argument('-o', '--output', default='benchmark-results.json',
+                        help='JSON output file '
+                             '(default benchmark-results.json)')
+    parser.add_argument('-b', '--baudrate', type=int, default=9600,
+                        help='emulated baud rate (default 9600)')
+    parser.add_argument('-n', '--ports', type=int, nargs='+',
+                        default=[1, 4, 16, 32],
+                        help='numbers of ports of the aggregate polling rate '
+                             '(default 1 4 16 32)')
+    parser.add_argument('--quick', action='store_true',
+                        help='fewer repetitions, for a smoke run')
+    args = parser.parse_args(argv)
+    repeat, duration = (20, 1.0) if args.quick else (200, 5.0)
+
+    # the GUI benchmark needs a QApplication, offscreen to run headless
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    app = QtWidgets.QApplication([])
+
+    results = {'meta': metadata(args.baudrate)}
+    print('command latency...')
+    results['latency'] = commandLatency(args.baudrate, repeat)
+    print('polling rate...')
+    results['pollRate'] = [pollRate(app, args.baudrate, count, duration)
+                           for count in args.ports]
+    print('updateStatus...')
+    results['updateStatus'] = updateStatusCost(app, 100 * repeat)
+
+    with open(args.output, 'w') as output:
+        json.dump(results, output, indent=2)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -19,6 +19,9 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+#: ASCII coded hexadecimal checksum b'XX' of each byte sum modulo 256
+CHKSUM_TABLE = tuple(b'%02X' % value for value in range(256))
+
 
 def calculateChksum(cmd):
     '''
@@ -26,7 +29,7 @@ def calculateChksum(cmd):
 
     Parameters
     ----------
-    cmd : str
+    cmd : str or bytes
         String part of the command (e.g. Q051)
 
     Returns
@@ -35,10 +38,10 @@ def calculateChksum(cmd):
         Checksum value in bytes in the form b'XX'
 
     '''
-    arr = bytearray(cmd, 'ascii')
-    checksum = bytes(hex(sum(arr) % 256), 'ascii')   # in form  b'0x21'
+    if isinstance(cmd, str):
+        cmd = cmd.encode('ascii')
 
-    return checksum.lstrip(b'0x').zfill(2).upper()
+    return CHKSUM_TABLE[sum(cmd) & 0xFF]
 
 
 def checkChecksum(mesToCheck):
@@ -50,20 +53,22 @@ def checkChecksum(mesToCheck):
 
     Parameters
     ----------
-    mesToCheck : bytes
-        message from HV stripped from b'\\\\r', in bytes()
+    mesToCheck : bytes-like
+        message from HV stripped from b'\\\\r', in bytes() or memoryview
 
-    Raises
-    ------
-    AssertionError
-        If the received and the calculated checksum do not match
+    Returns
+    -------
+    valid : bool
+        True if the received and the calculated checksum match
     '''
 
     csumRed = mesToCheck[-2:]
-    csumCalc = calculateChksum(mesToCheck[1:-2].decode())
+    csumCalc = calculateChksum(mesToCheck[1:-2])
 
     try:
         assert csumRed == csumCalc
     except AssertionError:
         print('WARNING : Checksum error in the incoming message !')
         # raise ??
+        return False
+    return True
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the HvControllerGUI software.
+# The codec module provides the fast encoding of the commands sent to
+# a Glassman HV power supply and the decoding of its answers, based on
+# precomputed lookup tables.
+#
+# Copyright 2018-2019 Aurélie Vancraeyenest
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import string
+
+from checksum import CHKSUM_TABLE
+
+SOH = b'\x01'
+CR = b'\x0D'
+
+#: 3 digit uppercase ASCII hexadecimal of each 12 bit value
+HEX3_TABLE = tuple(b'%03X' % value for value in range(0x1000))
+#: Sum of the ASCII codes of each entry of HEX3_TABLE
+HEX3_SUM = tuple(sum(digits) for digits in HEX3_TABLE)
+
+# Byte sum of the constant part of the S command: 'S' and six '0'
+_SET_CONSTANT_SUM = ord('S') + 6 * ord('0')
+
+#: Value of each ASCII hexadecimal digit by byte value. Other bytes are
+#: worth 0x1000 so a field containing one decodes out of range
+HEX_DIGIT = tuple(int(chr(value), 16) if chr(value) in string.hexdigits
+                  else 0x1000 for value in range(256))
+
+#: (hvOn, fault, ctrlMode) of each value of the status digit of the
+#: answer to a Q command (bit 2: HV on, bit 1: fault, bit 0: mode)
+STATUS_TABLE = tuple((bool(status & 0b100), bool(status & 0b010),
+                      'current' if status & 0b001 else 'voltage')
+                     for status in range(16))
+
+#: Length of the answer to a Q command stripped from the CR, checksum
+#: included
+QUERY_ANSWER_LENGTH = 13
+
+#: Digital control byte of the S command
+DIGIT_CONTROL = {'off': ord('1'), 'on': ord('2'), 'reset': ord('4')}
+
+
+def _constantFrame(cmd):
+    return SOH + cmd + CHKSUM_TABLE[sum(cmd) & 0xFF] + CR
+
+
+#: Q command (query), constant
+QUERY_FRAME = _constantFrame(b'Q')
+#: V command (version), constant
+VERSION_FRAME = _constantFrame(b'V')
+#: C commands (configure) to enable or disable the timeout, constant
+CONFIG_FRAMES = {'enable': _constantFrame(b'C0'),
+                 'disable': _constantFrame(b'C1')}
+
+
+def encodeSet(voltHex, curHex, digitContr):
+    '''
+    Encode a S command
+
+    The S frame is b'\\\\x01SVVVCCC000000D' + checksum + b'\\\\x0D' with
+    VVV and CCC the 3 digit hexadecimal voltage and current, taken from
+    HEX3_TABLE, and D the digital control byte. The checksum is computed
+    from the precomputed digit sums, and the frame is formatted at once
+    into its bytes, the only object allocated.
+
+    The Q, V and C frames never change, use QUERY_FRAME, VERSION_FRAME
+    and CONFIG_FRAMES instead.
+
+    Parameters
+    ----------
+    voltHex : int
+        Voltage in DAC counts (0 to 0xFFF)
+    curHex : int
+        Current in DAC counts (0 to 0xFFF)
+    digitContr : str
+        'on' 'off' or 'reset'
+
+    Returns
+    -------
+    Command : bytes
+        Encoded S command, with the SOH and CR characters
+
+    Raises
+    ------
+    ValueError
+        If the voltage or the current is out of the 12 bit range
+    '''
+    if not (0 <= voltHex <= 0xFFF and 0 <= curHex <= 0xFFF):
+        raise ValueError('Set values out of range: {}, {}'
+                         .format(voltHex, curHex))
+    ctrl = DIGIT_CONTROL[digitContr]
+    return b'\x01S%b%b000000%c%b\r' % (
+            HEX3_TABLE[voltHex], HEX3_TABLE[curHex], ctrl,
+            CHKSUM_TABLE[(_SET_CONSTANT_SUM + HEX3_SUM[voltHex]
+                          + HEX3_SUM[curHex] + ctrl) & 0xFF])
+
+
+def decodeQuery(answer):
+    '''
+    Decode the answer to a Q command
+
+    The answer is b'RVVVCCC000T' + checksum with VVV and CCC the 3 digit
+    hexadecimal voltage and current and T the status digit. The fields
+    are read byte by byte, so slicing a memoryview of the receive buffer
+    creates no temporary bytes.
+
+    Parameters
+    ----------
+    answer : bytes-like
+        Answer of the HV stripped from b'\\\\r'
+
+    Returns
+    -------
+    voltCounts : int
+        Voltage in ADC counts
+    curCounts : int
+        Current in ADC counts
+    status : int
+        Status digit, see STATUS_TABLE
+
+    Raises
+    ------
+    ValueError
+        If the answer is not QUERY_ANSWER_LENGTH long, e.g. cut by a
+        read timeout, or if a field is not hexadecimal
+    '''
+    if len(answer) != QUERY_ANSWER_LENGTH:
+        raise ValueError('Invalid answer to the Q command: {}'
+                         .format(bytes(answer)))
+    digit = HEX_DIGIT
+    voltCounts = (digit[answer[1]] * 256 + digit[answer[2]] * 16
+                  + digit[answer[3]])
+    curCounts = (digit[answer[4]] * 256 + digit[answer[5]] * 16
+                 + digit[answer[6]])
+    status = digit[answer[10]]
+    if voltCounts > 0xFFF or curCounts > 0xFFF or status > 0xF:
+        raise ValueError('Invalid answer to the Q command: {}'
+                         .format(bytes(answer)))
+
+    return voltCounts, curCounts, status
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the HvControllerGUI software.
+# The CommandConsole class shows the command outputs in a bounded,
+# filterable text box, appended in batches.
+#
+# Copyright 2018-2019 Aurélie Vancraeyenest
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import logging
+from PyQt5 import QtCore, QtGui
+
+#: Command types of the messages, in the order of the filter list
+QUERY = 'query'
+SET = 'set'
+RESET = 'reset'
+PORT = 'port'
+KEEPALIVE = 'keep-alive'
+PROGRAM = 'program'
+STABILITY = 'stability'
+COMMANDS = (QUERY, SET, RESET, PORT, KEEPALIVE, PROGRAM, STABILITY)
+
+#: Minimum severity of each entry of the severity filter list
+SEVERITIES = (logging.DEBUG, logging.WARNING, logging.ERROR)
+
+
+class ConsoleEntry(collections.namedtuple('ConsoleEntry',
+                                          'command severity text')):
+    ''' Message of the console, with its command type and severity '''
+    __slots__ = ()
+
+
+class CommandConsole(QtCore.QObject):
+    '''
+    Bounded and batched console of the command outputs
+
+    The messages are kept in a ring of the last maxLines messages and
+    shown in a QPlainTextEdit limited to maxLines lines, so the memory
+    and the cost of an append stay constant however long the session.
+    The messages appended during an iteration of the event loop are
+    shown with a single append, at the end of the iteration.
+
+    The messages can be filtered by command type and minimum severity;
+    changing the filter shows the messages of the ring again.
+
+    Parameters
+    ----------
+    view : QPlainTextEdit
+        Text box showing the messages
+    maxLines : int
+        Number of messages and lines kept (default 5000)
+    '''
+
+    def __init__(self, view, maxLines=5000, parent=None):
+        super(CommandConsole, self).__init__(parent)
+        self.view = view
+        self.view.setMaximumBlockCount(maxLines)
+        self.commands = None
+        self.minSeverity = logging.DEBUG
+        self._entries = collections.deque(maxlen=maxLines)
+        self._pending = []
+        self._timer = QtCore.QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self.flush)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def append(self, text, command=None, severity=logging.INFO):
+        '''
+        Append a message, shown at the end of the event loop iteration
+
+        Parameters
+        ----------
+        text : str
+            Message, possibly on several lines
+        command : str
+            Command type of the message, one of COMMANDS (default None,
+            only shown without command filter)
+        severity : int
+            logging level of the message (default logging.INFO)
+        '''
+        entry = ConsoleEntry(command, severity, text)
+        self._entries.append(entry)
+        if self._shown(entry):
+            self._pending.append(text)
+            if not self._timer.isActive():
+                self._timer.start(0)
+
+    @QtCore.pyqtSlot()
+    def flush(self):
+        ''' Show the pending messages now '''
+        self._timer.stop()
+        if self._pending:
+            self.view.appendPlainText('\n'.join(self._pending))
+            self._pending = []
+
+    def setFilter(self, commands=None, minSeverity=logging.DEBUG):
+        '''
+        Only show the messages of some command types and severities
+
+        Parameters
+        ----------
+        commands : iterable of str
+            Command types to show (default None, all)
+        minSeverity : int
+            Minimum logging level to show (default logging.DEBUG, all)
+        '''
+        self.commands = None if commands is None else frozenset(commands)
+        self.minSeverity = minSeverity
+        self._timer.stop()
+        self._pending = []
+        self.view.setPlainText('\n'.join(entry.text for entry in self._entries
+                                         if self._shown(entry)))
+        self.view.moveCursor(QtGui.QTextCursor.End)
+
+    def clear(self):
+        ''' Remove all the messages '''
+        self._entries.clear()
+        self._pending = []
+        self.view.clear()
+
+    def _shown(self, entry):
+        return (entry.severity >= self.minSeverity
+                and (self.commands is None or entry.command in self.commands))
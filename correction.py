@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the HvControllerGUI software.
+# The correction module drives the closed-loop correction of the setpoint
+# of a HV device whose voltage left the stability band: the setpoint is
+# sent again, at a limited rate and with an optional trim, until a fresh
+# reading is back in the band.
+#
+# Copyright 2018-2019 Aurélie Vancraeyenest
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+
+
+class CorrectionStep(collections.namedtuple(
+        'CorrectionStep', 'kind attempts trim duration')):
+    '''
+    Next step of a setpoint correction
+
+    Attributes
+    ----------
+    kind : str
+        'send' to send the setpoint again with the trim, 'recovered'
+        when a reading is back in the band, 'failed' when the attempts
+        are exhausted
+    attempts : int
+        Number of setpoints sent by the correction, this one included
+    trim : int
+        Offset of the voltage setpoint in DAC counts
+    duration : float
+        Time since the start of the correction in seconds
+    '''
+    __slots__ = ()
+
+
+class SetpointCorrector():
+    '''
+    Closed-loop correction of the setpoint of a HV device
+
+    Started by begin() when the voltage leaves the band around the
+    target, then updated with each fresh reading. The setpoint is sent
+    again at once, then every interval seconds at most while the
+    voltage stays out of the band, up to maxAttempts times. From the
+    second attempt on, if maxTrim is not 0, the voltage setpoint is
+    trimmed towards the target by the error of the last reading,
+    rounded to DAC counts and limited to trimStep counts per attempt and
+    to maxTrim counts in all, to compensate a steady offset of the
+    supply. The correction ends at the first reading back in the band,
+    its duration being the recovery time, and is cancelled if the
+    target changes.
+
+    Parameters
+    ----------
+    band : float
+        Half width of the band around the target in kV (default 0.2 kV)
+    lsb : float
+        Voltage of a DAC count in kV (default 40 kV / 0xFFF)
+    interval : float
+        Minimum time between two setpoints sent in seconds (default 2 s)
+    maxAttempts : int
+        Maximum number of setpoints sent by a correction (default 3)
+    maxTrim : int
+        Maximum offset of the voltage setpoint in DAC counts (default 0,
+        no trim)
+    trimStep : int
+        Maximum change of the trim per attempt in DAC counts (default 16,
+        about 0.16 kV on a 40 kV supply)
+    '''
+
+    def __init__(self, band=0.2, lsb=40.0 / 0xFFF, interval=2.0,
+                 maxAttempts=3, maxTrim=0, trimStep=16):
+        self.band = band
+        self.lsb = lsb
+        self.interval = interval
+        self.maxAttempts = maxAttempts
+        self.maxTrim = maxTrim
+        self.trimStep = trimStep
+        self.active = False
+        self.attempts = 0
+        self.trim = 0
+        self.started = None
+        self.sentAt = None
+        self.target = None
+
+    def begin(self, now, voltage, target, trim=0):
+        '''
+        Start a correction
+
+        Parameters
+        ----------
+        now : float
+            time.monotonic() of the reading out of the band
+        voltage, target : float
+            Voltage read and target voltage in kV
+        trim : int
+            Trim of the setpoint in DAC counts when starting (default 0)
+
+        Returns
+        -------
+        step : CorrectionStep
+            First step, None if the rate limit delays it to a later
+            reading
+        '''
+        self.active = True
+        self.attempts = 0
+        self.trim = trim
+        self.started = now
+        self.target = target
+        return self.update(now, voltage, target)
+
+    def update(self, now, voltage, target):
+        '''
+        Check a fresh reading during a correction
+
+        Parameters
+        ----------
+        now : float
+            time.monotonic() of the reading
+        voltage, target : float
+            Voltage read and target voltage in kV
+
+        Returns
+        -------
+        step : CorrectionStep
+            Step to take, None if none (or if no correction is running)
+        '''
+        if not self.active:
+            return None
+        if target != self.target:
+            self.cancel()
+            return None
+        if abs(voltage - target) <= self.band:
+            return self._end('recovered', now)
+        if self.sentAt is not None and now - self.sentAt < self.interval:
+            return None
+        if self.attempts >= self.maxAttempts:
+            return self._end('failed', now)
+        if self.attempts > 0 and self.maxTrim:
+            step = round((target - voltage) / self.lsb)
+            step = max(-self.trimStep, min(self.trimStep, step))
+            self.trim = max(-self.maxTrim, min(self.maxTrim,
+                                               self.trim + step))
+        self.attempts += 1
+        self.sentAt = now
+        return CorrectionStep('send', self.attempts, self.trim,
+                              now - self.started)
+
+    def cancel(self):
+        ''' Stop the running correction, if any, without result '''
+        self.active = False
+
+    def _end(self, kind, now):
+        self.active = False
+        return CorrectionStep(kind, self.attempts, self.trim,
+                              now - self.started)
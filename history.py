@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the HvControllerGUI software.
+# The HvHistory class keeps the history of the HV readings in a fixed
+# capacity ring buffer, for plots and stability analysis.
+#
+# Copyright 2018-2019 Aurélie Vancraeyenest
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import bisect
+
+import numpy as np
+
+#: Record of one reading: monotonic time, raw ADC counts and status digit
+READING_DTYPE = np.dtype([('timestamp', 'f8'),
+                          ('voltCounts', 'u2'),
+                          ('curCounts', 'u2'),
+                          ('status', 'u1')])
+
+
+class HvHistory():
+    '''
+    Fixed capacity ring buffer of the HV readings
+
+    Every record is written twice, at index i and i + capacity of a
+    buffer of twice the capacity, so the last n records (n <= capacity)
+    are always contiguous: appending is O(1) and the window methods
+    return numpy views of the buffer, without any copy.
+
+    A view stays valid until capacity - n more records are appended,
+    copy it to keep it longer.
+
+    Parameters
+    ----------
+    capacity : int
+        Maximum number of records kept (default 24 h at 2 Hz)
+    maxVoltage, maxCurrent, maxCounts : float
+        Scale of the ADC counts (default the HvController constants)
+    '''
+
+    def __init__(self, capacity=172800, maxVoltage=40.0, maxCurrent=3.0,
+                 maxCounts=0x3FF):
+        self.capacity = capacity
+        self.voltScale = maxVoltage / maxCounts
+        self.curScale = maxCurrent / maxCounts
+        self._data = np.zeros(2 * capacity, dtype=READING_DTYPE)
+        self._next = 0
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def append(self, reading):
+        '''
+        Add a reading to the history, overwriting the oldest one if full
+
+        Parameters
+        ----------
+        reading : HvReading
+            Reading to add
+        '''
+        record = (reading.timestamp, reading.voltCounts, reading.curCounts,
+                  reading.status)
+        index = self._next
+        self._data[index] = record
+        self._data[index + self.capacity] = record
+        self._next = (index + 1) % self.capacity
+        if self._count < self.capacity:
+            self._count += 1
+
+    def last(self, n=None):
+        '''
+        Return a view of the last n records, oldest first
+
+        Parameters
+        ----------
+        n : int
+            Number of records (default all the records kept)
+
+        Returns
+        -------
+        records : numpy.ndarray
+            View of READING_DTYPE records
+        '''
+        count = self._count
+        n = count if n is None else min(n, count)
+        end = self._next + self.capacity
+        return self._data[end - n:end]
+
+    def window(self, seconds, now=None):
+        '''
+        Return a view of the records of the last seconds, oldest first
+
+        Parameters
+        ----------
+        seconds : float
+            Duration of the window
+        now : float
+            End of the window in time.monotonic() time (default the time
+            of the last record)
+
+        Returns
+        -------
+        records : numpy.ndarray
+            View of READING_DTYPE records
+        '''
+        records = self.last()
+        if len(records) == 0:
+            return records
+        if now is None:
+            now = records['timestamp'][-1]
+        # bisect on the strided column, numpy.searchsorted would copy it
+        start = bisect.bisect_left(records['timestamp'], now - seconds)
+        return records[start:]
+
+    def voltage(self, records):
+        ''' Return the voltages in kV of records '''
+        return records['voltCounts'] * self.voltScale
+
+    def current(self, records):
+        ''' Return the currents in mA of records '''
+        return records['curCounts'] * self.curScale
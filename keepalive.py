@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the HvControllerGUI software.
+# The KeepAliveScheduler class decides when the acquisition thread must
+# query a HV device, so its communication watchdog never expires.
+#
+# Copyright 2018-2019 Aurélie Vancraeyenest
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+class KeepAliveScheduler():
+    '''
+    Deadline based scheduler of the keep-alive queries of a HV device
+
+    Any transaction answered by the device (a query, a set or a reset)
+    resets its watchdog, so the next query is scheduled from the start
+    of the last answered transaction: no query is sent right after a
+    command of the user. The query interval adapts to the readings:
+    fastInterval after a command of the user and while the voltage
+    moves, the HV switches or a fault is active, interval after a
+    change, then growing by GROWTH per steady reading up to
+    slowInterval after steadyCount steady readings.
+
+    Whatever the interval, a query is due at the latest margin seconds
+    before the watchdog deadline, margin being the time left for the
+    query to reach the device. The slack, time left before the deadline
+    when a transaction starts, is kept in slack and minSlack; a negative
+    slack is a missed deadline.
+
+    Parameters
+    ----------
+    interval : float
+        Query interval after a change in seconds (default 0.5 s)
+    adaptive : bool
+        Adapt the interval to the readings (default True), otherwise
+        always use interval
+    fastInterval : float
+        Query interval during ramps and faults (default 0.2 s)
+    slowInterval : float
+        Query interval of a steady device (default 1.0 s)
+    watchdog : float
+        Communication timeout of the device (default 1.5 s)
+    margin : float
+        Time reserved for a query to reach the device (default 0.3 s)
+    tolerance : int
+        Voltage change in ADC counts below which a reading is steady
+        (default 2)
+    steadyCount : int
+        Number of steady readings before slowing down (default 4)
+    '''
+
+    GROWTH = 1.25
+
+    def __init__(self, interval=0.5, adaptive=True, fastInterval=0.2,
+                 slowInterval=1.0, watchdog=1.5, margin=0.3, tolerance=2,
+                 steadyCount=4):
+        self.watchdog = watchdog
+        self.margin = margin
+        latest = watchdog - margin
+        self.baseInterval = min(interval, latest)
+        self.adaptive = adaptive
+        self.fastInterval = min(fastInterval, self.baseInterval)
+        self.slowInterval = min(max(slowInterval, self.baseInterval), latest)
+        self.tolerance = tolerance
+        self.steadyCount = steadyCount
+
+        self.interval = self.baseInterval
+        self.lastKeepAlive = None
+        self.slack = None
+        self.minSlack = None
+        self._start = 0.0
+        self._lastPoll = None
+        self._reading = None
+        self._steady = 0
+
+    def start(self, now):
+        '''
+        Schedule the first query
+
+        Parameters
+        ----------
+        now : float
+            Time of the first query in time.monotonic() seconds
+        '''
+        self._start = now
+
+    def nextPoll(self):
+        ''' Return the due time of the next query, in monotonic seconds '''
+        if self.lastKeepAlive is None:
+            due = self._start
+        else:
+            due = min(self.lastKeepAlive + self.interval,
+                      self.deadline() - self.margin)
+        if self._lastPoll is not None:
+            # retry a failed query at the fast rate, not in a loop
+            due = max(due, self._lastPoll + self.fastInterval)
+        return due
+
+    def deadline(self):
+        ''' Return the watchdog deadline, None before the first answer '''
+        if self.lastKeepAlive is None:
+            return None
+        return self.lastKeepAlive + self.watchdog
+
+    def polled(self, now):
+        '''
+        Record that a keep-alive query is sent
+
+        Parameters
+        ----------
+        now : float
+            Time of the query in time.monotonic() seconds
+        '''
+        self._lastPoll = now
+
+    def commanded(self):
+        ''' Poll fast after a command which may change the HV status '''
+        if self.adaptive:
+            self.interval = self.fastInterval
+            self._steady = 0
+
+    def update(self, lastTransaction, reading):
+        '''
+        Record the last answered transaction and the last reading
+
+        Parameters
+        ----------
+        lastTransaction : float
+            Start of the last transaction answered by the device in
+            time.monotonic() seconds, None if none yet
+        reading : HvReading
+            Last reading of the device, None if none yet
+
+        Returns
+        -------
+        slack : float
+            Slack of the new transaction, None if there is none
+        '''
+        slack = None
+        if (lastTransaction is not None
+                and lastTransaction != self.lastKeepAlive):
+            if self.lastKeepAlive is not None:
+                slack = self.deadline() - lastTransaction
+                self.slack = slack
+                if self.minSlack is None or slack < self.minSlack:
+                    self.minSlack = slack
+            self.lastKeepAlive = lastTransaction
+
+        if reading is not None and reading is not self._reading:
+            if self.adaptive:
+                self._adapt(self._reading, reading)
+            self._reading = reading
+        return slack
+
+    def _adapt(self, previous, reading):
+        active = reading.fault or (
+                previous is not None
+                and (abs(reading.voltCounts - previous.voltCounts)
+                     > self.tolerance or reading.hvOn != previous.hvOn))
+        if active:
+            self.interval = self.fastInterval
+            self._steady = 0
+            return
+
+        self._steady += 1
+        if self._steady < self.steadyCount:
+            self.interval = self.baseInterval
+        else:
+            self.interval = min(max(self.interval, self.baseInterval)
+                                * self.GROWTH, self.slowInterval)
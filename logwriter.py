@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the HvControllerGUI software.
+# The logwriter module moves the file I/O of the application log to a
+# background thread: the loggers only enqueue their records, the writer
+# thread writes them in batches to rotating log files.
+#
+# Copyright 2018-2019 Aurélie Vancraeyenest
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import atexit
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+_STOP = object()
+
+
+class _BatchFlush():
+    '''
+    Mixin of the file handlers flushed once per batch by the LogWriter
+
+    The flush after each record of logging.StreamHandler is skipped,
+    the LogWriter calls flushBatch() after writing a batch. Closing the
+    file, at the rollovers and at the end, still flushes it.
+    '''
+
+    def flush(self):
+        pass
+
+    def flushBatch(self):
+        ''' Flush the records written since the last batch '''
+        logging.StreamHandler.flush(self)
+
+
+class BatchRotatingFileHandler(_BatchFlush,
+                               logging.handlers.RotatingFileHandler):
+    ''' RotatingFileHandler flushed once per batch by the LogWriter '''
+
+
+class BatchTimedRotatingFileHandler(_BatchFlush,
+                                    logging.handlers.TimedRotatingFileHandler):
+    ''' TimedRotatingFileHandler flushed once per batch by the LogWriter '''
+
+
+class LogWriter(threading.Thread):
+    '''
+    Writer thread of the records enqueued by a logging.QueueHandler
+
+    The records waiting in the queue are handled together, up to
+    batchSize at a time, then the handlers are flushed once. The flushes
+    are spaced by flushInterval seconds at least, except after a record
+    of flushLevel or above, which is flushed at once: a crash loses at
+    most flushInterval seconds of the lower level records.
+
+    Add queueHandler to the loggers to write their records.
+
+    Parameters
+    ----------
+    handlers : list of logging.Handler
+        Handlers writing the records, flushed by their flushBatch()
+        method if they have one, else by flush()
+    records : queue.SimpleQueue
+        Queue of the records (default a new queue)
+    flushInterval : float
+        Minimum time between two flushes in seconds (default 1 s)
+    batchSize : int
+        Maximum number of records handled between two flushes
+        (default 256)
+    flushLevel : int
+        Level of the records flushed at once (default logging.WARNING)
+    '''
+
+    def __init__(self, handlers, records=None, flushInterval=1.0,
+                 batchSize=256, flushLevel=logging.WARNING):
+        super(LogWriter, self).__init__(name='LogWriter', daemon=True)
+        self.handlers = list(handlers)
+        self.records = queue.SimpleQueue() if records is None else records
+        self.flushInterval = flushInterval
+        self.batchSize = batchSize
+        self.flushLevel = flushLevel
+        self.queueHandler = logging.handlers.QueueHandler(self.records)
+        self._stopped = False
+
+    def run(self):
+        lastFlush = time.monotonic()
+        pending = False
+        while True:
+            timeout = None
+            if pending:
+                timeout = max(0.0, lastFlush + self.flushInterval
+                              - time.monotonic())
+            try:
+                record = self.records.get(timeout=timeout)
+            except queue.Empty:
+                record = None
+            count = 0
+            urgent = False
+            while record is not None and record is not _STOP:
+                self.handle(record)
+                count += 1
+                urgent |= record.levelno >= self.flushLevel
+                if count >= self.batchSize:
+                    break
+                try:
+                    record = self.records.get_nowait()
+                except queue.Empty:
+                    record = None
+            pending |= count > 0
+            now = time.monotonic()
+            if pending and (urgent or record is _STOP
+                            or now - lastFlush >= self.flushInterval):
+                self.flush()
+                lastFlush = now
+                pending = False
+            if record is _STOP:
+                break
+
+    def handle(self, record):
+        ''' Write a record with the handlers whose level it reaches '''
+        for handler in self.handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+    def flush(self):
+        ''' Flush the handlers '''
+        for handler in self.handlers:
+            getattr(handler, 'flushBatch', handler.flush)()
+
+    def stop(self):
+        '''
+        Write the enqueued records, then stop the thread and close the
+        handlers, can be called several times
+        '''
+        if self._stopped:
+            return
+        self._stopped = True
+        if self.is_alive():
+            self.records.put(_STOP)
+            self.join()
+        for handler in self.handlers:
+            handler.close()
+
+
+def setupLogging(logger, path, level=logging.INFO, maxBytes=5 * 2 ** 20,
+                 backupCount=5, when=None, formatter=None, **kwargs):
+    '''
+    Log the records of a logger to a rotating file from a LogWriter
+
+    A logging.QueueHandler is added to the logger: logging a record only
+    formats and enqueues it, the file is written by the writer thread.
+    The file is appended to and rotated either by size, or by time if
+    when is given (see logging.handlers.TimedRotatingFileHandler), with
+    backupCount old files kept. The writer is stopped at exit.
+
+    Parameters
+    ----------
+    logger : logging.Logger
+        Logger to log from
+    path : str
+        Path of the log file
+    level : int
+        Minimum level of the records written (default logging.INFO)
+    maxBytes : int
+        Size of the file triggering a rotation (default 5 MiB)
+    backupCount : int
+        Number of rotated files kept (default 5)
+    when : str
+        Interval of a rotation by time, e.g. 'midnight' (default None,
+        rotation by size)
+    formatter : logging.Formatter
+        Format of the records (default LOG_FORMAT)
+    kwargs : dict
+        Arguments of the LogWriter
+
+    Returns
+    -------
+    writer : LogWriter
+        Started writer thread, stop it to close the file
+    '''
+    if when is None:
+        handler = BatchRotatingFileHandler(path, maxBytes=maxBytes,
+                                           backupCount=backupCount,
+                                           delay=True)
+    else:
+        handler = BatchTimedRotatingFileHandler(path, when=when,
+                                                backupCount=backupCount,
+                                                delay=True)
+    handler.setLevel(level)
+    handler.setFormatter(formatter or logging.Formatter(LOG_FORMAT))
+    writer = LogWriter([handler], **kwargs)
+    writer.queueHandler.setLevel(level)
+    logger.addHandler(writer.queueHandler)
+    writer.start()
+    atexit.register(writer.stop)
+    return writer
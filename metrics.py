@@ -0,0 +1,376 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the HvControllerGUI software.
+# The metrics module provides the counters and latency histograms of the
+# communication with the HV devices, readable as a snapshot from the GUI
+# and exported in the Prometheus text format.
+#
+# Copyright 2018-2019 Aurélie Vancraeyenest
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import bisect
+import threading
+
+#: Upper bounds in seconds of the buckets of the latency histograms
+LATENCY_BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.015, 0.02, 0.03, 0.05, 0.1,
+                   0.2, 0.5, 1.0)
+
+#: Upper bounds in seconds of the buckets of the poll lateness histograms
+LATENESS_BUCKETS = (0.001, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0)
+
+#: Upper bounds in seconds of the buckets of the watchdog slack histograms
+SLACK_BUCKETS = (0.0, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 1.25, 1.5)
+
+#: Upper bounds in seconds of the buckets of the recovery time histograms
+RECOVERY_BUCKETS = (0.2, 0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 60.0)
+
+#: Name of each command by its command byte
+COMMANDS = {ord('Q'): 'query', ord('S'): 'set', ord('V'): 'version',
+            ord('C'): 'configure'}
+
+
+class Counter():
+    ''' Monotonic counter '''
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class Histogram():
+    '''
+    Histogram with fixed buckets
+
+    counts[i] is the number of values lower or equal to bounds[i] and
+    greater than bounds[i - 1], the last count the number of values
+    greater than the last bound.
+    '''
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        '''
+        Return the upper bound of the bucket holding the q quantile
+
+        Returns inf if the quantile is above the last bound, None if the
+        histogram is empty.
+        '''
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        cumulated = 0
+        for bound, count in zip(self.bounds, self.counts):
+            cumulated += count
+            if cumulated >= rank:
+                return bound
+        return float('inf')
+
+
+class MetricsRegistry():
+    '''
+    Registry of the metrics, by name and labels
+
+    The series are created once, under a lock, and then updated without
+    any lock: each series must only be updated by one thread, which is
+    the case of the series of a device labelled by its port, only
+    updated by its acquisition thread. Reading a snapshot from another
+    thread is safe.
+    '''
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name, description, **labels):
+        '''
+        Return the counter of name and labels, created if needed
+
+        Parameters
+        ----------
+        name : str
+            Metric name, e.g. 'hv_bytes_sent_total'
+        description : str
+            Help text of the metric
+        labels : str
+            Labels of the series, e.g. port='COM4'
+        '''
+        return self._series(name, 'counter', description, labels, Counter)
+
+    def histogram(self, name, description, buckets=LATENCY_BUCKETS,
+                  **labels):
+        '''
+        Return the histogram of name and labels, created if needed
+
+        Parameters
+        ----------
+        name, description, labels : see counter()
+        buckets : tuple of float
+            Upper bounds of the buckets, ascending (default
+            LATENCY_BUCKETS)
+        '''
+        return self._series(name, 'histogram', description, labels,
+                            lambda: Histogram(buckets))
+
+    def _series(self, name, kind, description, labels, factory):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            metric = self._metrics.setdefault(name, (kind, description, {}))
+            if metric[0] != kind:
+                raise ValueError('{} is already a {}'.format(name, metric[0]))
+            series = metric[2].get(key)
+            if series is None:
+                series = metric[2][key] = factory()
+        return series
+
+    def snapshot(self):
+        '''
+        Return a copy of all the metrics
+
+        Returns
+        -------
+        metrics : dict
+            {name: {'type': 'counter' or 'histogram', 'help': str,
+            'series': list}}. A counter series is {'labels': dict,
+            'value': int}, a histogram series is {'labels': dict,
+            'buckets': [(bound, cumulated count)], 'sum': float,
+            'count': int, 'p50': float, 'p99': float}
+        '''
+        with self._lock:
+            metrics = [(name, kind, description, list(series.items()))
+                       for name, (kind, description, series)
+                       in self._metrics.items()]
+        snapshot = {}
+        for name, kind, description, series in metrics:
+            entries = []
+            for key, metric in series:
+                entry = {'labels': dict(key)}
+                if kind == 'counter':
+                    entry['value'] = metric.value
+                else:
+                    counts = list(metric.counts)
+                    cumulated = 0
+                    buckets = []
+                    for bound, count in zip(metric.bounds + (float('inf'),),
+                                            counts):
+                        cumulated += count
+                        buckets.append((bound, cumulated))
+                    entry.update(buckets=buckets, sum=metric.sum,
+                                 count=cumulated, p50=metric.quantile(0.5),
+                                 p99=metric.quantile(0.99))
+                entries.append(entry)
+            snapshot[name] = {'type': kind, 'help': description,
+                              'series': entries}
+        return snapshot
+
+    def prometheus(self):
+        ''' Return all the metrics in the Prometheus text format '''
+        lines = []
+        for name, metric in self.snapshot().items():
+            lines.append('# HELP {} {}'.format(name, metric['help']))
+            lines.append('# TYPE {} {}'.format(name, metric['type']))
+            for entry in metric['series']:
+                labels = entry['labels']
+                if metric['type'] == 'counter':
+                    lines.append('{}{} {}'.format(name, _labels(labels),
+                                                  entry['value']))
+                    continue
+                for bound, count in entry['buckets']:
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append('{}_bucket{} {}'.format(
+                            name, _labels(dict(labels, le=le)), count))
+                lines.append('{}_sum{} {!r}'.format(name, _labels(labels),
+                                                    entry['sum']))
+                lines.append('{}_count{} {}'.format(name, _labels(labels),
+                                                    entry['count']))
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(key, str(value)
+                                           .replace('\\', '\\\\')
+                                           .replace('"', '\\"'))
+                          for key, value in sorted(labels.items())) + '}'
+
+
+#: Default registry, used by the HV controllers
+REGISTRY = MetricsRegistry()
+
+
+class ControllerMetrics():
+    '''
+    Metrics of the communication with one HV device
+
+    Holds the series of the device, labelled by its port, so recording a
+    transaction only costs a few attribute and list updates.
+
+    Parameters
+    ----------
+    port : str
+        Port name of the device
+    registry : MetricsRegistry
+        Registry of the series (default REGISTRY)
+    '''
+
+    def __init__(self, port, registry=None):
+        if registry is None:
+            registry = REGISTRY
+        self.port = port
+        self.registry = registry
+        self.latency = {
+                byte: registry.histogram(
+                        'hv_command_latency_seconds',
+                        'Round-trip time of the commands to the HV device',
+                        port=port, command=command)
+                for byte, command in COMMANDS.items()}
+        self.bytesSent = registry.counter(
+                'hv_bytes_sent_total', 'Bytes sent to the HV device',
+                port=port)
+        self.bytesReceived = registry.counter(
+                'hv_bytes_received_total', 'Bytes received from the HV device',
+                port=port)
+        self.checksumFailures = registry.counter(
+                'hv_checksum_failures_total',
+                'Answers of the HV device with a wrong checksum', port=port)
+        self.pollLateness = registry.histogram(
+                'hv_poll_lateness_seconds',
+                'Delay of the keep-alive queries after their due time',
+                LATENESS_BUCKETS, port=port)
+        self.timerOverruns = registry.counter(
+                'hv_timer_overruns_total',
+                'Keep-alive queries started too late', port=port)
+        self.watchdogSlack = registry.histogram(
+                'hv_watchdog_slack_seconds',
+                'Time left before the watchdog deadline at each answered '
+                'command', SLACK_BUCKETS, port=port)
+        self.watchdogMisses = registry.counter(
+                'hv_watchdog_misses_total',
+                'Answered commands sent after the watchdog deadline',
+                port=port)
+        self.programLateness = registry.histogram(
+                'hv_program_lateness_seconds',
+                'Delay of the commands of the HV programs after their due '
+                'time', LATENESS_BUCKETS, port=port)
+        self.programSkipped = registry.counter(
+                'hv_program_skipped_total',
+                'Commands of the HV programs superseded before being sent',
+                port=port)
+        self.recoveryTime = registry.histogram(
+                'hv_recovery_seconds',
+                'Time from the start of a setpoint correction to the first '
+                'reading back in the stability band', RECOVERY_BUCKETS,
+                port=port)
+        self.corrections = registry.counter(
+                'hv_corrections_total',
+                'Setpoints sent again by the setpoint corrections', port=port)
+        self.correctionFailures = registry.counter(
+                'hv_correction_failures_total',
+                'Setpoint corrections ended without a reading back in the '
+                'stability band', port=port)
+
+    def transaction(self, cmdToSend, answer, duration):
+        '''
+        Record a command and its answer
+
+        Parameters
+        ----------
+        cmdToSend : bytes
+            Command sent, with the SOH character
+        answer : bytes
+            Raw answer received
+        duration : float
+            Round-trip time in seconds
+        '''
+        latency = self.latency.get(cmdToSend[1])
+        if latency is not None:
+            latency.observe(duration)
+        self.bytesSent.value += len(cmdToSend)
+        self.bytesReceived.value += len(answer)
+
+    def error(self, errorMes):
+        '''
+        Count an error answer of the device
+
+        Parameters
+        ----------
+        errorMes : bytes
+            Error message stripped from b'\\\\r', e.g. b'E2'
+        '''
+        self.registry.counter(
+                'hv_device_errors_total', 'Error answers of the HV device',
+                port=self.port, code=errorMes[:2].decode('ascii', 'replace')
+                ).inc()
+
+
+class MetricsServer(threading.Thread):
+    '''
+    HTTP server of the metrics in the Prometheus text format
+
+    Serves the registry on http://host:port/metrics (any path is
+    accepted) from a daemon thread, on the local host by default.
+
+    Parameters
+    ----------
+    port : int
+        TCP port (default 9108, 0 for any free port)
+    registry : MetricsRegistry
+        Registry to serve (default REGISTRY)
+    host : str
+        Address to listen on (default '127.0.0.1')
+    '''
+
+    def __init__(self, port=9108, registry=None, host='127.0.0.1'):
+        super(MetricsServer, self).__init__(daemon=True)
+        import http.server
+        if registry is None:
+            registry = REGISTRY
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = registry.prometheus().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type',
+                                 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = http.server.HTTPServer((host, port), Handler)
+        self.port = self.server.server_address[1]
+
+    def run(self):
+        self.server.serve_forever()
+
+    def stop(self):
+        ''' Stop serving and close the socket '''
+        if self.is_alive():
+            self.server.shutdown()
+        self.server.server_close()
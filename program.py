@@ -0,0 +1,409 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the HvControllerGUI software.
+# The program module loads the HV programs (recipes of timed steps and
+# ramps), compiles them into schedules of encoded S commands and tracks
+# their execution.
+#
+# Copyright 2018-2019 Aurélie Vancraeyenest
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import re
+
+import numpy as np
+
+import codec
+
+
+class ProgramStep(collections.namedtuple('ProgramStep',
+                                         'kind duration voltage current')):
+    '''
+    Step of a HV program
+
+    Attributes
+    ----------
+    kind : str
+        'set' to go to the values at once and hold them, 'ramp' to go
+        linearly from the previous voltage to the values
+    duration : float
+        Duration of the step in seconds
+    voltage : float
+        Voltage at the end of the step in kV
+    current : float
+        Current limit during the step in mA
+    '''
+    __slots__ = ()
+
+
+def parseProgram(lines):
+    '''
+    Parse the steps of a HV program
+
+    One step per line: kind, duration (s), voltage (kV), current (mA),
+    separated by commas or spaces, e.g. 'ramp, 60, 20.0, 1.5'. The
+    text after a '#' and the blank lines are ignored.
+
+    Parameters
+    ----------
+    lines : iterable of str
+        Lines of the program
+
+    Returns
+    -------
+    steps : list of ProgramStep
+
+    Raises
+    ------
+    ValueError
+        If a line is not a valid step, with its line number
+    '''
+    steps = []
+    for number, line in enumerate(lines, 1):
+        line = line.split('#', 1)[0].strip()
+        if not line:
+            continue
+        fields = re.split(r'[\s,;]+', line)
+        try:
+            if len(fields) != 4 or fields[0].lower() not in ('set', 'ramp'):
+                raise ValueError('expected: set|ramp, duration, voltage, '
+                                 'current')
+            step = ProgramStep(fields[0].lower(), *map(float, fields[1:]))
+            if not (step.duration >= 0 and step.voltage >= 0
+                    and step.current >= 0):
+                raise ValueError('negative value')
+        except ValueError as err:
+            raise ValueError('Line {}: {!r}: {}'.format(number, line, err))
+        steps.append(step)
+    if not steps:
+        raise ValueError('The program has no step')
+    return steps
+
+
+def loadProgram(path):
+    ''' Load the steps of a HV program file, see parseProgram() '''
+    with open(path) as programFile:
+        return parseProgram(programFile)
+
+
+class ProgramSchedule():
+    '''
+    HV program compiled into encoded S commands
+
+    Attributes
+    ----------
+    times : numpy.ndarray
+        Time of each command from the start of the program in seconds,
+        ascending
+    voltCounts, curCounts : numpy.ndarray
+        Voltage and current of each command in DAC counts
+    frames : list of bytes
+        Encoded S command of each command
+    duration : float
+        Duration of the program in seconds
+    '''
+
+    def __init__(self, times, voltCounts, curCounts, duration,
+                 maxVoltage=40.0, maxCurrent=3.0, maxCounts=0xFFF):
+        self.times = times
+        self.voltCounts = voltCounts
+        self.curCounts = curCounts
+        self.duration = duration
+        self.voltScale = maxVoltage / maxCounts
+        self.curScale = maxCurrent / maxCounts
+        self.frames = [codec.encodeSet(volt, cur, 'on')
+                       for volt, cur in zip(voltCounts.tolist(),
+                                            curCounts.tolist())]
+
+    def __len__(self):
+        return len(self.times)
+
+    @property
+    def voltage(self):
+        ''' Voltage of each command in kV '''
+        return self.voltCounts * self.voltScale
+
+    @property
+    def current(self):
+        ''' Current of each command in mA '''
+        return self.curCounts * self.curScale
+
+
+def planRamp(startVoltage, endVoltage, slewRate, bandwidth, maxVoltage=40.0,
+             maxCounts=0xFFF):
+    '''
+    Plan the DAC codes of a linear voltage ramp and their emit times
+
+    Each code between the codes of the start and end voltages is due
+    when the ideal ramp crosses the rounding boundary of the code, i.e.
+    when the rounded ramp changes. The due times are delayed to the next
+    multiple of 1 / bandwidth, and only the last code of each multiple
+    is kept: each command sends a new code, never ahead of the ideal
+    ramp. The end code, always the last one, is sent at the end of the
+    ramp at the latest, and the command before it is dropped if closer
+    than 1 / bandwidth, so the commands are at least 1 / bandwidth
+    apart. All the codes are computed at once with numpy.
+
+    Parameters
+    ----------
+    startVoltage, endVoltage : float
+        Voltage at the start and at the end of the ramp in kV, the
+        start code being already set
+    slewRate : float
+        Speed of the ramp in kV/s, positive
+    bandwidth : float
+        Maximum commands per second
+    maxVoltage, maxCounts : float
+        Scale of the DAC counts (default the HvController constants)
+
+    Returns
+    -------
+    times : numpy.ndarray
+        Emit time of each code from the start of the ramp in seconds,
+        ascending, at most the duration of the ramp
+    codes : numpy.ndarray
+        DAC code of each command, uint16
+
+    Raises
+    ------
+    ValueError
+        If the slew rate or the bandwidth is not positive
+    '''
+    if not (slewRate > 0 and bandwidth > 0):
+        raise ValueError('The slew rate and the bandwidth must be positive')
+    lsb = maxVoltage / maxCounts
+    startCode = round(startVoltage / lsb)
+    endCode = round(endVoltage / lsb)
+    step = 1 if endCode >= startCode else -1
+    codes = np.arange(startCode + step, endCode + step, step)
+    # the rounded ramp reaches code k at the boundary k -/+ 1/2 lsb
+    times = np.abs((codes - 0.5 * step) * lsb - startVoltage) / slewRate
+    slots = np.ceil(times * bandwidth - 1e-9)
+    last = np.ones(len(slots), dtype=bool)
+    last[:-1] = slots[1:] != slots[:-1]
+    times = slots[last] / bandwidth
+    codes = codes[last].astype(np.uint16)
+    duration = abs(endVoltage - startVoltage) / slewRate
+    if len(times) and times[-1] > duration:
+        times[-1] = duration
+        # the end code supersedes a command too close before it
+        if len(times) > 1 and times[-1] - times[-2] < 1 / bandwidth - 1e-9:
+            times = np.delete(times, -2)
+            codes = np.delete(codes, -2)
+    return times, codes
+
+
+def compileProgram(steps, maxVoltage=40.0, maxCurrent=3.0, maxCounts=0xFFF,
+                   rampInterval=0.5, startVoltage=0.0):
+    '''
+    Compile the steps of a HV program into a schedule of S commands
+
+    A set step is a single command at its start. A ramp step sets its
+    current at its start, then sends the distinct DAC codes of the ramp
+    planned by planRamp(), at most one every rampInterval seconds. The
+    commands equal to the previous one are dropped.
+
+    Parameters
+    ----------
+    steps : list of ProgramStep
+        Steps of the program
+    maxVoltage, maxCurrent, maxCounts : float
+        Scale of the DAC counts (default the HvController constants)
+    rampInterval : float
+        Minimum time between two commands of a ramp in seconds (default
+        0.5 s)
+    startVoltage : float
+        Voltage of the device at the start of the program in kV, the
+        start of a first ramp step (default 0 kV)
+
+    Returns
+    -------
+    schedule : ProgramSchedule
+
+    Raises
+    ------
+    ValueError
+        If a value is above the full scale
+    '''
+    times, voltCounts, curs = [], [], []
+    start = 0.0
+    voltage = startVoltage
+    for step in steps:
+        if step.voltage > maxVoltage or step.current > maxCurrent:
+            raise ValueError('Step {} above the full scale of {} kV, {} mA'
+                             .format(tuple(step), maxVoltage, maxCurrent))
+        ramp = (step.kind == 'ramp' and step.duration > 0
+                and step.voltage != voltage)
+        code = round((voltage if ramp else step.voltage) * maxCounts
+                     / maxVoltage)
+        times.append(np.array([start]))
+        voltCounts.append(np.array([code], np.uint16))
+        if ramp:
+            rampTimes, codes = planRamp(
+                    voltage, step.voltage,
+                    abs(step.voltage - voltage) / step.duration,
+                    1 / rampInterval, maxVoltage, maxCounts)
+            times[-1] = np.concatenate((times[-1], start + rampTimes))
+            voltCounts[-1] = np.concatenate((voltCounts[-1], codes))
+        curs.append(np.full(len(times[-1]), step.current))
+        start += step.duration
+        voltage = step.voltage
+
+    times = np.concatenate(times)
+    voltCounts = np.concatenate(voltCounts)
+    curCounts = np.rint(np.concatenate(curs) * maxCounts
+                        / maxCurrent).astype(np.uint16)
+    changed = np.ones(len(times), dtype=bool)
+    changed[1:] = ((voltCounts[1:] != voltCounts[:-1])
+                   | (curCounts[1:] != curCounts[:-1]))
+    return ProgramSchedule(times[changed], voltCounts[changed],
+                           curCounts[changed], start, maxVoltage, maxCurrent,
+                           maxCounts)
+
+
+class ProgramRun():
+    '''
+    Execution of a ProgramSchedule on the monotonic clock
+
+    The due time of each command is the start time plus its time in the
+    schedule plus the time spent paused, computed from the start and not
+    from the previous command, so the delays of the commands do not add
+    up over the program. A command overdue when a later one is already
+    due is superseded and skipped, counted in skipped. The run is done
+    once the duration of the program has elapsed, or once stopped.
+
+    The time of each command sent, from the start of the program and
+    without the pauses, is recorded in achieved (NaN if not sent), to
+    be compared with schedule.times.
+
+    Parameters
+    ----------
+    schedule : ProgramSchedule
+        Schedule to run
+    name : str
+        Name of the program, e.g. its file name (default '')
+    '''
+
+    def __init__(self, schedule, name=''):
+        self.schedule = schedule
+        self.name = name
+        self.index = 0
+        self.start = None
+        self.pausedAt = None
+        self.pausedTime = 0.0
+        self.skipped = 0
+        self.error = None
+        self.stopped = False
+        self.finished = False
+        self.achieved = np.full(len(schedule), np.nan)
+
+    @property
+    def done(self):
+        ''' True once the program has elapsed or the run stopped '''
+        return self.stopped or self.finished
+
+    @property
+    def paused(self):
+        return self.pausedAt is not None
+
+    def begin(self, now):
+        ''' Start the run at now, in time.monotonic() seconds '''
+        self.start = now
+
+    def pause(self, now):
+        ''' Pause the run at now, in time.monotonic() seconds '''
+        if self.pausedAt is None:
+            self.pausedAt = now
+
+    def resume(self, now):
+        ''' Resume a paused run at now, in time.monotonic() seconds '''
+        if self.pausedAt is not None:
+            self.pausedTime += now - self.pausedAt
+            self.pausedAt = None
+
+    def stop(self, error=None):
+        ''' Stop the run, the remaining commands are not sent '''
+        self.stopped = True
+        if error is not None:
+            self.error = error
+
+    def nextDue(self):
+        '''
+        Due time of the next command, or of the end of the program once
+        all the commands are sent, None if paused or done
+        '''
+        if self.done or self.paused or self.start is None:
+            return None
+        if self.index < len(self.schedule):
+            offset = self.schedule.times[self.index]
+        else:
+            offset = self.schedule.duration
+        return self.start + self.pausedTime + offset
+
+    def due(self, now):
+        '''
+        Return the index of the command to send at now, None if none
+
+        The overdue commands superseded by a later one are skipped. The
+        run is finished when the end of the program is due.
+        '''
+        due = self.nextDue()
+        if due is None or due > now:
+            return None
+        if self.index >= len(self.schedule):
+            self.finished = True
+            return None
+        elapsed = now - self.start - self.pausedTime
+        last = int(np.searchsorted(self.schedule.times, elapsed,
+                                   side='right')) - 1
+        last = max(last, self.index)
+        self.skipped += last - self.index
+        self.index = last
+        return last
+
+    def sent(self, index, now):
+        '''
+        Record that the command index was sent at now
+
+        Returns
+        -------
+        lateness : float
+            Delay of the command after its due time in seconds
+        '''
+        elapsed = now - self.start - self.pausedTime
+        self.achieved[index] = elapsed
+        self.index = index + 1
+        return elapsed - self.schedule.times[index]
+
+    def lateness(self):
+        ''' Delay of each command sent after its due time, in seconds '''
+        sent = ~np.isnan(self.achieved)
+        return self.achieved[sent] - self.schedule.times[sent]
+
+    def summary(self):
+        ''' Return a text summary of the run '''
+        lateness = self.lateness()
+        if self.error is not None:
+            state = 'failed: {}'.format(self.error)
+        elif not self.finished:
+            state = 'stopped'
+        else:
+            state = 'done'
+        text = ('Program {} {}: {} of {} commands sent, {} skipped'
+                .format(self.name, state, len(lateness), len(self.schedule),
+                        self.skipped))
+        if len(lateness):
+            text += (', lateness mean {:.1f} ms, max {:.1f} ms'
+                     .format(1e3 * lateness.mean(), 1e3 * lateness.max()))
+        return text
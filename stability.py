@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the HvControllerGUI software.
+# The stability module follows the voltage of a HV device at every
+# reading: running statistics over sliding time windows, updated in
+# constant time, and detection of the departures from the setpoint.
+#
+# Copyright 2018-2019 Aurélie Vancraeyenest
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import math
+
+#: Default windows of the statistics in seconds
+WINDOWS = (10.0, 60.0, 600.0)
+
+
+class WindowSummary(collections.namedtuple(
+        'WindowSummary', 'window count mean std min max slope')):
+    '''
+    Statistics of the voltage over a sliding window
+
+    Attributes
+    ----------
+    window : float
+        Duration of the window in seconds
+    count : int
+        Number of readings in the window
+    mean, std, min, max : float
+        Mean, standard deviation, minimum and maximum voltage in kV
+    slope : float
+        Drift of the voltage, slope of its least squares line in kV/s
+    '''
+    __slots__ = ()
+
+
+class StabilityEvent(collections.namedtuple(
+        'StabilityEvent', 'kind time voltage target duration summary')):
+    '''
+    Change of the stability of a HV device
+
+    Attributes
+    ----------
+    kind : str
+        'violation' when the voltage left the band around the target,
+        'recovered' when it came back
+    time : float
+        time.monotonic() of the reading confirming the change
+    voltage : float
+        Voltage of this reading in kV
+    target : float
+        Target voltage in kV
+    duration : float
+        Time since the first reading out of the band for a violation,
+        time from it to the first reading back in the band for a
+        recovery, in seconds
+    summary : WindowSummary
+        Statistics of the shortest window at this reading
+    '''
+    __slots__ = ()
+
+
+class WindowStats():
+    '''
+    Running statistics of the readings of the last window seconds
+
+    Each reading is added, and the readings older than the window
+    removed, in constant (amortized) time: the mean, the variance and
+    the co-moment of the time and the voltage are updated with the
+    Welford formulas, both ways, and the minimum and maximum are kept
+    in monotonic queues. Nothing is recomputed over the window.
+
+    Parameters
+    ----------
+    window : float
+        Duration of the window in seconds
+    '''
+
+    def __init__(self, window):
+        self.window = window
+        self.clear()
+
+    def clear(self):
+        ''' Remove all the readings '''
+        self._samples = collections.deque()
+        self._mins = collections.deque()
+        self._maxs = collections.deque()
+        self.count = 0
+        self._meanT = 0.0
+        self._meanV = 0.0
+        self._m2T = 0.0
+        self._m2V = 0.0
+        self._coTV = 0.0
+
+    def add(self, timestamp, voltage):
+        '''
+        Add a reading and drop the ones out of the window
+
+        Parameters
+        ----------
+        timestamp : float
+            Time of the reading in seconds, not before the previous one
+        voltage : float
+            Voltage in kV
+        '''
+        self._samples.append((timestamp, voltage))
+        self.count += 1
+        dt = timestamp - self._meanT
+        dv = voltage - self._meanV
+        self._meanT += dt / self.count
+        self._meanV += dv / self.count
+        self._m2T += dt * (timestamp - self._meanT)
+        self._m2V += dv * (voltage - self._meanV)
+        self._coTV += dt * (voltage - self._meanV)
+
+        mins = self._mins
+        while mins and mins[-1][1] >= voltage:
+            mins.pop()
+        mins.append((timestamp, voltage))
+        maxs = self._maxs
+        while maxs and maxs[-1][1] <= voltage:
+            maxs.pop()
+        maxs.append((timestamp, voltage))
+
+        start = timestamp - self.window
+        while self._samples[0][0] < start:
+            self._remove(*self._samples.popleft())
+        while mins[0][0] < start:
+            mins.popleft()
+        while maxs[0][0] < start:
+            maxs.popleft()
+
+    def _remove(self, timestamp, voltage):
+        self.count -= 1
+        dt = timestamp - self._meanT
+        dv = voltage - self._meanV
+        self._meanT -= dt / self.count
+        self._meanV -= dv / self.count
+        self._m2T -= dt * (timestamp - self._meanT)
+        self._m2V -= dv * (voltage - self._meanV)
+        self._coTV -= dt * (voltage - self._meanV)
+
+    @property
+    def mean(self):
+        return self._meanV if self.count else math.nan
+
+    @property
+    def std(self):
+        ''' Sample standard deviation, NaN below 2 readings '''
+        if self.count < 2:
+            return math.nan
+        return math.sqrt(max(self._m2V, 0.0) / (self.count - 1))
+
+    @property
+    def min(self):
+        return self._mins[0][1] if self.count else math.nan
+
+    @property
+    def max(self):
+        return self._maxs[0][1] if self.count else math.nan
+
+    @property
+    def slope(self):
+        ''' Least squares slope in kV/s, NaN below 2 distinct times '''
+        if self.count < 2 or self._m2T <= 0:
+            return math.nan
+        return self._coTV / self._m2T
+
+    def summary(self):
+        ''' Return the statistics as a WindowSummary '''
+        return WindowSummary(self.window, self.count, self.mean, self.std,
+                             self.min, self.max, self.slope)
+
+
+class StabilityMonitor():
+    '''
+    Stability of the voltage of a HV device, updated at every reading
+
+    The readings feed one WindowStats per window. Given a target, the
+    voltage is in the band if it differs from the target by at most
+    band kV. The state changes, with a StabilityEvent, once the voltage
+    has stayed on the other side of the band for dwell seconds, so over
+    two readings at least: a single reading out of the band is not a
+    violation. The readings of the settle seconds following a change of
+    the target, while the HV ramps, are not checked.
+
+    Parameters
+    ----------
+    band : float
+        Half width of the band around the target in kV (default 0.2 kV)
+    dwell : float
+        Time on the other side of the band before a change in seconds
+        (default 2 s)
+    settle : float
+        Time not checked after a change of the target in seconds
+        (default 10 s)
+    windows : tuple of float
+        Durations of the windows of the statistics in seconds, the
+        shortest one first (default WINDOWS)
+    '''
+
+    def __init__(self, band=0.2, dwell=2.0, settle=10.0, windows=WINDOWS):
+        self.band = band
+        self.dwell = dwell
+        self.settle = settle
+        self.stats = tuple(WindowStats(window) for window in windows)
+        self.target = None
+        self.violated = False
+        self.violatedSince = None
+        self._settleUntil = None
+        self._changeSince = None
+        self.summaries = tuple(stats.summary() for stats in self.stats)
+
+    def update(self, timestamp, voltage, target=None):
+        '''
+        Add a reading and check it against the target
+
+        Parameters
+        ----------
+        timestamp : float
+            time.monotonic() of the reading
+        voltage : float
+            Voltage in kV
+        target : float
+            Target voltage in kV (default None, not checked and the
+            state cleared)
+
+        Returns
+        -------
+        event : StabilityEvent
+            Change of the state confirmed by this reading, None if none
+        '''
+        for stats in self.stats:
+            stats.add(timestamp, voltage)
+        self.summaries = tuple(stats.summary() for stats in self.stats)
+
+        if target != self.target:
+            self.target = target
+            self._changeSince = None
+            self._settleUntil = timestamp + self.settle
+        if target is None:
+            self.violated = False
+            self.violatedSince = None
+            return None
+        if timestamp < self._settleUntil:
+            return None
+
+        if (abs(voltage - target) > self.band) == self.violated:
+            self._changeSince = None
+            return None
+        if self._changeSince is None:
+            self._changeSince = timestamp
+        if timestamp - self._changeSince < self.dwell:
+            return None
+        return self._change(timestamp, voltage)
+
+    def _change(self, timestamp, voltage):
+        self.violated = not self.violated
+        if self.violated:
+            self.violatedSince = self._changeSince
+            kind, duration = 'violation', timestamp - self._changeSince
+        else:
+            kind = 'recovered'
+            duration = self._changeSince - self.violatedSince
+            self.violatedSince = None
+        self._changeSince = None
+        return StabilityEvent(kind, timestamp, voltage, self.target,
+                              duration, self.summaries[0])
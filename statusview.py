@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the HvControllerGUI software.
+# The StatusView class renders the readings of the HV devices in the
+# main window, only touching the widgets whose value changed.
+#
+# Copyright 2018-2019 Aurélie Vancraeyenest
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+import importlib
+from PyQt5 import QtCore, QtGui
+
+ICON_RED_LED = ":/icons/led-red-on.png"
+ICON_GREEN_LED = ":/icons/green-led-on.png"
+
+#: Refresh rate used when the screen does not report one, in Hz
+DEFAULT_REFRESH_RATE = 60.0
+
+_PIXMAPS = {}
+
+
+def pixmap(path, size=None):
+    '''
+    Return the pixmap of an icon, decoded once and then cached
+
+    The icons are registered from the resources_rc module at the first
+    call, and not when the window is built, so the start of the GUI does
+    not decode them.
+
+    Parameters
+    ----------
+    path : str
+        Resource path of the icon, e.g. ICON_RED_LED
+    size : QSize
+        Size the icon is scaled to once, in device independent pixels
+        (default None, the size of the image)
+    '''
+    key = path if size is None else (path, size.width(), size.height())
+    icon = _PIXMAPS.get(key)
+    if icon is None:
+        # registers the icons with Qt on its first import
+        importlib.import_module('resources_rc')
+        icon = QtGui.QPixmap(path)
+        if size is not None:
+            ratio = QtGui.QGuiApplication.instance().devicePixelRatio()
+            icon = icon.scaled(size * ratio, QtCore.Qt.KeepAspectRatio,
+                               QtCore.Qt.SmoothTransformation)
+            icon.setDevicePixelRatio(ratio)
+        _PIXMAPS[key] = icon
+    return icon
+
+
+def rackRow(table, port):
+    ''' Return the row of a HV device in the supplies table, or -1 '''
+    for row in range(table.rowCount()):
+        if table.item(row, 0).text() == port:
+            return row
+    return -1
+
+
+class StatusView(QtCore.QObject):
+    '''
+    View-model of the HV status shown by the main window
+
+    The readings are not rendered when they are received: the last
+    reading of each device is kept until the next frame, at most
+    refreshRate times per second, so a burst of readings costs a single
+    rendering. A rendering compares each displayed value with the one
+    last rendered in the same widget and only updates the widgets whose
+    value changed, using LED pixmaps decoded and scaled once, at the
+    first rendering.
+
+    Parameters
+    ----------
+    ui : Ui_MainWindow
+        Main window holding the rackTable, voltValueRead, curValueRead,
+        ctrlModeVoltBtn, ctrlModeCurBtn, hvOnLed and faultLed widgets
+    activePort : callable
+        Return the port of the device shown in the control panel
+    refreshRate : float
+        Maximum renderings per second (default the refresh rate of the
+        screen, DEFAULT_REFRESH_RATE if unknown)
+    '''
+
+    def __init__(self, ui, activePort, refreshRate=None, parent=None):
+        super(StatusView, self).__init__(parent)
+        self.ui = ui
+        self.activePort = activePort
+        if refreshRate is None:
+            screen = QtGui.QGuiApplication.primaryScreen()
+            refreshRate = screen.refreshRate() if screen is not None else 0
+            if refreshRate <= 0:
+                refreshRate = DEFAULT_REFRESH_RATE
+        self.frame = 1.0 / refreshRate
+        self._pending = {}
+        self._rows = {}
+        self._panel = {}
+        self._lastFrame = 0.0
+        self._timer = QtCore.QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self.flush)
+
+    def update(self, port, reading):
+        '''
+        Schedule the rendering of a reading at the next frame
+
+        Parameters
+        ----------
+        port : str
+            Port name of the HV device
+        reading : HvReading
+            Reading to render, replacing any reading of the device not
+            rendered yet
+        '''
+        self._pending[port] = reading
+        if not self._timer.isActive():
+            delay = self._lastFrame + self.frame - time.monotonic()
+            self._timer.start(max(0, int(delay * 1000)))
+
+    @QtCore.pyqtSlot()
+    def flush(self):
+        ''' Render the pending readings now '''
+        self._timer.stop()
+        self._lastFrame = time.monotonic()
+        pending, self._pending = self._pending, {}
+        activePort = self.activePort()
+        for port, reading in pending.items():
+            self._renderRow(port, reading)
+            if port == activePort:
+                self._renderPanel(reading)
+
+    def invalidate(self):
+        '''
+        Forget the values rendered in the control panel
+
+        To call when the panel widgets are changed elsewhere, e.g.
+        enabled or disabled, so the next reading is fully rendered.
+        '''
+        self._panel.clear()
+
+    def forget(self, port):
+        ''' Drop the pending and rendered values of a closed device '''
+        self._pending.pop(port, None)
+        self._rows.pop(port, None)
+
+    def _renderRow(self, port, reading):
+        row = rackRow(self.ui.rackTable, port)
+        if row < 0:
+            return
+        rendered = self._rows.setdefault(port, {})
+        for column, value in enumerate((reading.voltage, reading.current,
+                                        reading.hvOn, reading.fault,
+                                        reading.ctrlMode), 1):
+            text = str(value)
+            if rendered.get(column) != text:
+                rendered[column] = text
+                self.ui.rackTable.item(row, column).setText(text)
+
+    def _renderPanel(self, reading):
+        ui = self.ui
+        rendered = self._panel
+        if rendered.get('voltage') != reading.voltage:
+            rendered['voltage'] = reading.voltage
+            ui.voltValueRead.display(reading.voltage)
+        if rendered.get('current') != reading.current:
+            rendered['current'] = reading.current
+            ui.curValueRead.display(reading.current)
+
+        if rendered.get('ctrlMode') != reading.ctrlMode:
+            rendered['ctrlMode'] = reading.ctrlMode
+            if reading.ctrlMode == "voltage":
+                ui.ctrlModeVoltBtn.setChecked(True)
+            elif reading.ctrlMode == "current":
+                ui.ctrlModeCurBtn.setChecked(True)
+
+        if rendered.get('hvOn', ()) != reading.hvOn:
+            rendered['hvOn'] = reading.hvOn
+            size = ui.hvOnLed.maximumSize()
+            if reading.hvOn is True:
+                ui.hvOnLed.setPixmap(pixmap(ICON_GREEN_LED, size))
+            elif reading.hvOn is False:
+                ui.hvOnLed.setPixmap(pixmap(ICON_RED_LED, size))
+            else:
+                ui.hvOnLed.setEnabled(False)
+
+        if rendered.get('fault', ()) != reading.fault:
+            rendered['fault'] = reading.fault
+            # the LED is drawn disabled when there is no fault
+            ui.faultLed.setPixmap(pixmap(ICON_RED_LED,
+                                         ui.faultLed.maximumSize()))
+            ui.faultLed.setEnabled(reading.fault is True)
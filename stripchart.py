@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the HvControllerGUI software.
+# The StripChart class draws the voltage and current history of a HV
+# device as a scrolling strip chart in a QGraphicsView.
+#
+# Copyright 2018-2019 Aurélie Vancraeyenest
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import math
+import time
+
+import numpy as np
+from PyQt5 import QtCore, QtGui, QtWidgets
+
+VOLTAGE_COLOR = QtGui.QColor(0, 70, 200)
+CURRENT_COLOR = QtGui.QColor(200, 40, 40)
+SETPOINT_COLOR = QtGui.QColor(0, 150, 0)
+BAND_COLOR = QtGui.QColor(0, 150, 0, 40)
+GRID_COLOR = QtGui.QColor(220, 220, 220)
+
+
+def decimate(times, values, start, pixelTime, columns):
+    '''
+    Min/max decimation of a time series to pixel columns
+
+    Parameters
+    ----------
+    times : numpy.ndarray
+        Ascending times of the values
+    values : numpy.ndarray
+        Values of the series
+    start : float
+        Time of the left edge of the first column
+    pixelTime : float
+        Duration of a column
+    columns : int
+        Number of columns
+
+    Returns
+    -------
+    filled : numpy.ndarray
+        Indexes of the columns holding at least one value
+    first, low, high, last : numpy.ndarray
+        First, minimum, maximum and last value of each filled column
+    '''
+    edges = start + pixelTime * np.arange(columns + 1)
+    bounds = np.searchsorted(times, edges)
+    filled = np.flatnonzero(np.diff(bounds))
+    starts = bounds[filled]
+    if len(starts) == 0:
+        empty = values[:0]
+        return filled, empty, empty, empty, empty
+    # reduceat reduces up to the next start, the last one up to the end
+    values = values[:bounds[-1]]
+    return (filled, values[starts], np.minimum.reduceat(values, starts),
+            np.maximum.reduceat(values, starts),
+            values[bounds[filled + 1] - 1])
+
+
+class _PixmapItem(QtWidgets.QGraphicsItem):
+    ''' Graphics item painting a pixmap modified in place '''
+
+    def __init__(self):
+        super(_PixmapItem, self).__init__()
+        self.pixmap = QtGui.QPixmap()
+
+    def boundingRect(self):
+        return QtCore.QRectF(self.pixmap.rect())
+
+    def paint(self, painter, option, widget=None):
+        painter.drawPixmap(0, 0, self.pixmap)
+
+
+class StripChart(QtCore.QObject):
+    '''
+    Live strip chart of the voltage and the current of a HV device
+
+    The chart shows the last span seconds of the history of the device,
+    one pixel column per span / width seconds: each column is drawn with
+    the minimum and the maximum of its readings (min/max decimation),
+    so drawing costs the same whatever the number of readings. The
+    voltage target and its stability band are drawn in the columns
+    along with the readings.
+
+    The chart is drawn in a pixmap: a full drawing is only done when the
+    device or the size of the view change. At each frame, at most
+    refreshRate times per second, the pixmap is scrolled by the elapsed
+    columns and only the columns of the new readings are drawn.
+
+    The history is read while the acquisition thread appends to it, so
+    the last reading may be missing from a frame; it is drawn in the
+    next one.
+
+    Parameters
+    ----------
+    view : QGraphicsView
+        View of the chart
+    span : float
+        Duration shown in seconds (default 600 s)
+    maxVoltage, maxCurrent : float
+        Full scale of the voltage in kV and of the current in mA
+        (default the HvController constants)
+    band : float
+        Half-width of the stability band around the voltage target in kV
+        (default 0.2 kV)
+    refreshRate : float
+        Maximum frames per second (default 60)
+    clock : callable
+        Time of the readings, time.monotonic() (default)
+    '''
+
+    def __init__(self, view, span=600.0, maxVoltage=40.0, maxCurrent=3.0,
+                 band=0.2, refreshRate=60.0, clock=time.monotonic,
+                 parent=None):
+        super(StripChart, self).__init__(parent)
+        self.view = view
+        self.span = span
+        self.maxVoltage = maxVoltage
+        self.maxCurrent = maxCurrent
+        self.band = band
+        self.clock = clock
+        self.device = None
+
+        self.scene = QtWidgets.QGraphicsScene(self)
+        self._item = _PixmapItem()
+        self.scene.addItem(self._item)
+        self._legend = self.scene.addSimpleText(
+                'voltage 0-{:g} kV'.format(maxVoltage))
+        self._legend.setBrush(VOLTAGE_COLOR)
+        self._legend.setPos(4, 2)
+        self._legendCurrent = self.scene.addSimpleText(
+                'current 0-{:g} mA'.format(maxCurrent))
+        self._legendCurrent.setBrush(CURRENT_COLOR)
+        self._legendCurrent.setPos(4, 16)
+        view.setScene(self.scene)
+        view.setHorizontalScrollBarPolicy(QtCore.Qt.ScrollBarAlwaysOff)
+        view.setVerticalScrollBarPolicy(QtCore.Qt.ScrollBarAlwaysOff)
+        view.setAlignment(QtCore.Qt.AlignLeft | QtCore.Qt.AlignTop)
+        view.viewport().installEventFilter(self)
+
+        self._column = None
+        self._drawnUntil = None
+        self._timer = QtCore.QTimer(self)
+        self._timer.setInterval(int(1000 / refreshRate))
+        self._timer.timeout.connect(self.refresh)
+
+    def setDevice(self, device):
+        '''
+        Chart the history of a device
+
+        Parameters
+        ----------
+        device : HvDeviceState
+            Device to chart, with its history and voltage target (None
+            to clear the chart)
+        '''
+        self.device = device
+        self._column = None
+
+    def start(self):
+        ''' Start drawing the frames '''
+        self._column = None
+        self._timer.start()
+        self.refresh()
+
+    def stop(self):
+        ''' Stop drawing the frames, the chart keeps its last frame '''
+        self._timer.stop()
+
+    def isActive(self):
+        return self._timer.isActive()
+
+    def eventFilter(self, watched, event):
+        if event.type() == QtCore.QEvent.Resize:
+            self._column = None
+            if self._timer.isActive():
+                QtCore.QTimer.singleShot(0, self.refresh)
+        return False
+
+    @QtCore.pyqtSlot()
+    def refresh(self):
+        ''' Draw a frame, scrolling the chart to the current time '''
+        size = self.view.viewport().size()
+        width, height = size.width(), size.height()
+        if width <= 0 or height <= 0:
+            return
+        pixelTime = self.span / width
+        now = self.clock()
+        column = math.floor(now / pixelTime)
+        pixmap = self._item.pixmap
+
+        if (self._column is None or pixmap.size() != size
+                or column - self._column >= width):
+            if pixmap.size() != size:
+                self._item.prepareGeometryChange()
+                pixmap = self._item.pixmap = QtGui.QPixmap(size)
+                self.scene.setSceneRect(0, 0, width, height)
+            first = column - width + 1
+            self._drawnUntil = None
+        else:
+            shift = column - self._column
+            if shift == 0 and not self._hasNewRecords():
+                return
+            if shift > 0:
+                pixmap.scroll(-shift, 0, pixmap.rect())
+            first = column - width + 1
+            if self._drawnUntil is not None:
+                first = max(first, math.floor(self._drawnUntil / pixelTime))
+            else:
+                first = max(first, self._column + 1)
+        self._column = column
+        self._draw(pixmap, first, column, pixelTime, now)
+        self._item.update()
+
+    def _hasNewRecords(self):
+        history = self.device.history if self.device is not None else None
+        if history is None or len(history) == 0:
+            return False
+        return (self._drawnUntil is None
+                or history.last(1)['timestamp'][0] > self._drawnUntil)
+
+    def _draw(self, pixmap, first, last, pixelTime, now):
+        ''' Draw the columns first to last, in absolute column indexes '''
+        width, height = pixmap.width(), pixmap.height()
+        left = width - 1 - (last - first)
+        painter = QtGui.QPainter(pixmap)
+        try:
+            painter.fillRect(left, 0, width - left, height, QtCore.Qt.white)
+            painter.setPen(GRID_COLOR)
+            for fraction in (0.25, 0.5, 0.75):
+                y = int(height * fraction)
+                painter.drawLine(left, y, width - 1, y)
+            if self.device is None:
+                return
+
+            target = self.device.targetHV
+            yScale = (height - 1) / self.maxVoltage
+            top = height - 1 - (target + self.band) * yScale
+            painter.fillRect(QtCore.QRectF(left, top, width - left,
+                                           2 * self.band * yScale),
+                             BAND_COLOR)
+            pen = QtGui.QPen(SETPOINT_COLOR, 1, QtCore.Qt.DashLine)
+            painter.setPen(pen)
+            y = height - 1 - target * yScale
+            painter.drawLine(QtCore.QPointF(left, y),
+                             QtCore.QPointF(width - 1, y))
+
+            history = self.device.history
+            if history is None or len(history) == 0:
+                return
+            start = first * pixelTime
+            records = history.window(now - start, now)
+            # the record before the first column links the lines to it
+            records = history.last(len(records) + 1)
+            if len(records) == 0:
+                return
+            times = np.ascontiguousarray(records['timestamp'])
+            self._drawnUntil = times[-1]
+            for values, scale, color in (
+                    (records['voltCounts'] * history.voltScale,
+                     self.maxVoltage, VOLTAGE_COLOR),
+                    (records['curCounts'] * history.curScale,
+                     self.maxCurrent, CURRENT_COLOR)):
+                painter.setPen(color)
+                self._drawSeries(painter, times, values, start, pixelTime,
+                                 last - first + 1, left, times[0] < start,
+                                 (height - 1) / scale, height - 1)
+        finally:
+            painter.end()
+
+    @staticmethod
+    def _drawSeries(painter, times, values, start, pixelTime, columns, left,
+                    linked, yScale, bottom):
+        filled, firsts, lows, highs, lasts = decimate(
+                times, values, start, pixelTime, columns)
+        ys = [(bottom - column * yScale).tolist()
+              for column in (firsts, lows, highs, lasts)]
+        xs = (filled + left).tolist()
+        lines = []
+        if linked:
+            # previous point, left of the drawn columns
+            previous = (left + math.floor((times[0] - start) / pixelTime),
+                        bottom - values[0] * yScale)
+        else:
+            previous = None
+        for x, first, low, high, lastValue in zip(xs, *ys):
+            if previous is not None:
+                lines.append(QtCore.QLineF(previous[0], previous[1],
+                                           x, first))
+            lines.append(QtCore.QLineF(x, low, x, high))
+            previous = (x, lastValue)
+        painter.drawLines(lines)
@@ -0,0 +1,429 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the HvControllerGUI software.
+# The telemetry module records every query and every command of the HV
+# devices as structured rows, written by a background thread to daily
+# CSV or Parquet files for the offline analysis (e.g. with pandas).
+#
+# Copyright 2018-2019 Aurélie Vancraeyenest
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import atexit
+import csv
+import glob
+import importlib.util
+import logging
+import os
+import queue
+import threading
+import time
+
+import codec
+
+#: Columns of the telemetry files
+COLUMNS = ('time', 'port', 'kind', 'voltage', 'current', 'answer', 'status',
+           'hvOn', 'fault', 'ctrlMode')
+#: Columns left empty while unchanged since the previous row of the file
+STATUS_COLUMNS = ('status', 'hvOn', 'fault', 'ctrlMode')
+#: Kinds of rows: query, S commands of setHV() ('set' for 'on'), resetHV()
+#: and of the programs
+KINDS = ('poll', 'set', 'off', 'reset', 'program')
+FORMATS = ('csv', 'parquet')
+
+_STOP = object()
+
+
+def telemetryName(port, day, fileFormat='csv'):
+    '''
+    Return the file name of the telemetry of a port for a day
+
+    Parameters
+    ----------
+    port : str
+        Port name, e.g. '/dev/ttyUSB0' or 'COM3'
+    day : str
+        Local date, 'YYYY-MM-DD'
+    fileFormat : str
+        'csv' or 'parquet' (default 'csv')
+
+    Returns
+    -------
+    name : str
+        e.g. 'telemetry-ttyUSB0-2019-03-01.csv'
+    '''
+    return 'telemetry-{}-{}.{}'.format(os.path.basename(port), day,
+                                       fileFormat)
+
+
+def _day(timestamp):
+    ''' Return the local date of a time.time() and the end of the day '''
+    year, month, day = time.localtime(timestamp)[:3]
+    end = time.mktime((year, month, day + 1, 0, 0, 0, 0, 0, -1))
+    return '{:04d}-{:02d}-{:02d}'.format(year, month, day), end
+
+
+class _PortBuffer():
+    ''' Rows of a port not handed to the writer yet, one list per column '''
+
+    def __init__(self, port):
+        self.port = port
+        self.day = None
+        self.dayEnd = float('-inf')
+        self.lastStatus = None
+        self.clear()
+
+    def clear(self):
+        self.times = []
+        self.kinds = []
+        self.voltages = []
+        self.currents = []
+        self.answers = []
+        self.statuses = []
+
+
+class TelemetrySink():
+    '''
+    Full-rate telemetry of the HV devices, in daily files per port
+
+    Every query (poll) and every S command of a HvController whose
+    telemetry is this sink is recorded as a row of COLUMNS: time (since
+    the epoch), port, kind (see KINDS), voltage (kV) and current (mA),
+    read for a poll or set for a command, answer of a command ('A' or
+    the error code, empty for a poll), and the status digit of a poll
+    with its hvOn, fault and ctrlMode fields.
+
+    The rows are buffered in memory by column, the calling acquisition
+    thread only appends to lists, and handed as a chunk to the writer
+    thread every chunkSize rows or flushInterval seconds. The writer
+    appends them to the file of the port and the day, e.g.
+    telemetry-ttyUSB0-2019-03-01.csv, a new file being started at local
+    midnight. The status fields are run-length encoded: they are left
+    empty (null) while equal to the ones of the previous poll of the
+    file, the first poll of a file having them all. loadTelemetry()
+    fills them again.
+
+    The CSV files are appended to across restarts, a crash loses at
+    most the last flushInterval seconds. The Parquet files (requires
+    pyarrow) are written by row groups of rowGroupSize rows and are only
+    readable once closed, at midnight or by close(); a restart on the
+    same day starts a new file, suffixed by a number.
+
+    Parameters
+    ----------
+    directory : str
+        Directory of the files (default '.')
+    fileFormat : str
+        'csv' or 'parquet' (default 'csv')
+    chunkSize : int
+        Maximum rows of a port buffered before writing (default 4096)
+    flushInterval : float
+        Maximum time a row is buffered in seconds (default 10 s)
+    rowGroupSize : int
+        Rows per row group of the Parquet files (default 65536)
+
+    Raises
+    ------
+    ValueError
+        If the format is unknown
+    ImportError
+        If the format is 'parquet' and pyarrow is not installed
+    '''
+
+    def __init__(self, directory='.', fileFormat='csv', chunkSize=4096,
+                 flushInterval=10.0, rowGroupSize=65536):
+        if fileFormat not in FORMATS:
+            raise ValueError('Unknown telemetry format {!r}, expected one '
+                             'of {}'.format(fileFormat, FORMATS))
+        # pyarrow is only needed, and imported by the writer, for Parquet
+        if (fileFormat == 'parquet'
+                and importlib.util.find_spec('pyarrow') is None):
+            raise ImportError('pyarrow is needed for the Parquet telemetry')
+        self.directory = directory
+        self.fileFormat = fileFormat
+        self.chunkSize = chunkSize
+        self.flushInterval = flushInterval
+        self.rowGroupSize = rowGroupSize
+        self.logger = logging.getLogger('hvController')
+        # Readings are timestamped with time.monotonic()
+        self._epoch = time.time() - time.monotonic()
+        self._buffers = {}
+        self._lock = threading.Lock()
+        self._chunks = queue.SimpleQueue()
+        self._files = {}
+        self._closed = False
+        self._writer = threading.Thread(target=self._run,
+                                        name='TelemetryWriter', daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    def poll(self, port, reading):
+        '''
+        Record a query of a device
+
+        Parameters
+        ----------
+        port : str
+            Port name of the device
+        reading : HvReading
+            Decoded answer of the query
+        '''
+        self._record(port, reading.timestamp + self._epoch, 'poll',
+                     reading.voltage, reading.current, '', reading.status)
+
+    def command(self, port, kind, voltage, current, answer):
+        '''
+        Record a S command sent to a device, timed now
+
+        Parameters
+        ----------
+        port : str
+            Port name of the device
+        kind : str
+            'set', 'off', 'reset' or 'program'
+        voltage, current : float
+            Voltage in kV and current in mA set
+        answer : str
+            'A' if accepted, else the answer or error code of the device
+        '''
+        self._record(port, time.time(), kind, voltage, current, answer, None)
+
+    def _record(self, port, timestamp, kind, voltage, current, answer,
+                status):
+        with self._lock:
+            if self._closed:
+                return
+            buffer = self._buffers.get(port)
+            if buffer is None:
+                buffer = self._buffers[port] = _PortBuffer(port)
+            if timestamp >= buffer.dayEnd:
+                self._handOver(buffer)
+                buffer.day, buffer.dayEnd = _day(timestamp)
+                buffer.lastStatus = None
+            if status is not None:
+                if status == buffer.lastStatus:
+                    status = None
+                else:
+                    buffer.lastStatus = status
+            buffer.times.append(timestamp)
+            buffer.kinds.append(kind)
+            buffer.voltages.append(voltage)
+            buffer.currents.append(current)
+            buffer.answers.append(answer)
+            buffer.statuses.append(status)
+            if (len(buffer.times) >= self.chunkSize
+                    or timestamp - buffer.times[0] >= self.flushInterval):
+                self._handOver(buffer)
+
+    def _handOver(self, buffer):
+        if buffer.times:
+            self._chunks.put((buffer.port, buffer.day, buffer.times,
+                              buffer.kinds, buffer.voltages, buffer.currents,
+                              buffer.answers, buffer.statuses))
+            buffer.clear()
+
+    def flush(self):
+        ''' Hand all the buffered rows over to the writer thread '''
+        with self._lock:
+            for buffer in self._buffers.values():
+                self._handOver(buffer)
+
+    def close(self):
+        '''
+        Write all the buffered rows, stop the writer thread and close the
+        files, can be called several times
+        '''
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            for buffer in self._buffers.values():
+                self._handOver(buffer)
+        self._chunks.put(_STOP)
+        self._writer.join()
+
+    # ------------- Writer thread -------------
+
+    def _run(self):
+        while True:
+            chunk = self._chunks.get()
+            if chunk is _STOP:
+                break
+            try:
+                self._write(chunk)
+            except Exception as err:
+                self.logger.warning('Telemetry of %s not written: %s',
+                                    chunk[0], err)
+        for port in list(self._files):
+            self._closeFile(port)
+
+    def _write(self, chunk):
+        port, day = chunk[:2]
+        opened = self._files.get(port)
+        if opened is None or opened.day != day:
+            if opened is not None:
+                self._closeFile(port)
+            self._files[port] = opened = self._open(port, day)
+        if opened.csv is not None:
+            opened.csv.writerows(zip(*self._csvColumns(chunk)))
+            opened.file.flush()
+        else:
+            opened.pending.append(chunk)
+            opened.rows += len(chunk[2])
+            if opened.rows >= self.rowGroupSize:
+                self._writeRowGroup(opened)
+
+    def _open(self, port, day):
+        opened = _TelemetryFile(day)
+        path = os.path.join(self.directory,
+                            telemetryName(port, day, self.fileFormat))
+        if self.fileFormat == 'csv':
+            opened.file = open(path, 'a', newline='')
+            opened.csv = csv.writer(opened.file)
+            if opened.file.tell() == 0:
+                opened.csv.writerow(COLUMNS)
+        else:
+            import pyarrow.parquet
+            root, ext = os.path.splitext(path)
+            number = 0
+            while os.path.exists(path):
+                number += 1
+                path = '{}-{}{}'.format(root, number, ext)
+            opened.parquet = pyarrow.parquet.ParquetWriter(path,
+                                                           _parquetSchema())
+        return opened
+
+    def _closeFile(self, port):
+        opened = self._files.pop(port)
+        if opened.csv is not None:
+            opened.file.close()
+        else:
+            self._writeRowGroup(opened)
+            opened.parquet.close()
+
+    @staticmethod
+    def _csvColumns(chunk):
+        port, day, times, kinds, voltages, currents, answers, statuses = chunk
+        table = codec.STATUS_TABLE
+        return (['{:.3f}'.format(t) for t in times],
+                [port] * len(times),
+                kinds,
+                ['{:.4f}'.format(v) for v in voltages],
+                ['{:.4f}'.format(c) for c in currents],
+                answers,
+                ['' if s is None else s for s in statuses],
+                ['' if s is None else int(table[s][0]) for s in statuses],
+                ['' if s is None else int(table[s][1]) for s in statuses],
+                ['' if s is None else table[s][2] for s in statuses])
+
+    @staticmethod
+    def _writeRowGroup(opened):
+        if not opened.pending:
+            return
+        import pyarrow
+        table = codec.STATUS_TABLE
+        columns = {name: [] for name in COLUMNS}
+        for chunk in opened.pending:
+            port, day, times, kinds, voltages, currents, answers, \
+                statuses = chunk
+            columns['time'] += times
+            columns['port'] += [port] * len(times)
+            columns['kind'] += kinds
+            columns['voltage'] += voltages
+            columns['current'] += currents
+            columns['answer'] += answers
+            columns['status'] += statuses
+            columns['hvOn'] += [None if s is None else table[s][0]
+                                for s in statuses]
+            columns['fault'] += [None if s is None else table[s][1]
+                                 for s in statuses]
+            columns['ctrlMode'] += [None if s is None else table[s][2]
+                                    for s in statuses]
+        opened.parquet.write_table(pyarrow.Table.from_pydict(
+                columns, schema=opened.parquet.schema))
+        opened.pending = []
+        opened.rows = 0
+
+
+class _TelemetryFile():
+    ''' File of a port being written by the writer thread '''
+
+    def __init__(self, day):
+        self.day = day
+        self.file = None
+        self.csv = None
+        self.parquet = None
+        self.pending = []
+        self.rows = 0
+
+
+def _parquetSchema():
+    import pyarrow
+    return pyarrow.schema([('time', pyarrow.float64()),
+                           ('port', pyarrow.string()),
+                           ('kind', pyarrow.string()),
+                           ('voltage', pyarrow.float64()),
+                           ('current', pyarrow.float64()),
+                           ('answer', pyarrow.string()),
+                           ('status', pyarrow.int8()),
+                           ('hvOn', pyarrow.bool_()),
+                           ('fault', pyarrow.bool_()),
+                           ('ctrlMode', pyarrow.string())])
+
+
+def loadTelemetry(paths):
+    '''
+    Load telemetry files in a pandas DataFrame (requires pandas)
+
+    The run-length encoded status fields are filled again from the
+    previous row of their file.
+
+    Parameters
+    ----------
+    paths : str or list of str
+        Paths of the CSV or Parquet files, or a glob pattern
+
+    Returns
+    -------
+    data : pandas.DataFrame
+        Rows of the files in order, with the COLUMNS and the time as UTC
+        datetimes
+
+    Examples
+    --------
+    >>> data = loadTelemetry('telemetry-ttyUSB0-2019-03-*.csv')
+    >>> polls = data[data['kind'] == 'poll'].set_index('time')
+    >>> polls['voltage'].resample('1h').agg(['mean', 'std', 'min', 'max'])
+    '''
+    import pandas  # only needed to load the files
+
+    if isinstance(paths, str):
+        paths = sorted(glob.glob(paths))
+    frames = []
+    for path in paths:
+        if path.endswith('.parquet'):
+            frame = pandas.read_parquet(path)
+        else:
+            frame = pandas.read_csv(path, keep_default_na=False,
+                                    na_values={name: ''
+                                               for name in STATUS_COLUMNS},
+                                    dtype={'port': str, 'kind': str,
+                                           'answer': str, 'ctrlMode': str})
+        frame[list(STATUS_COLUMNS)] = frame[list(STATUS_COLUMNS)].ffill()
+        frames.append(frame)
+    data = pandas.concat(frames, ignore_index=True)
+    data['status'] = data['status'].astype('Int8')
+    data['hvOn'] = data['hvOn'].astype('boolean')
+    data['fault'] = data['fault'].astype('boolean')
+    data['time'] = pandas.to_datetime(data['time'], unit='s', utc=True)
+    return data
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the HvControllerGUI software.
+# Tests of the asyncio controller: its S commands are kept and recorded
+# as those of the HvController, and a port hanging up fails its commands.
+#
+# Copyright 2018-2019 Aurélie Vancraeyenest
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import asyncio
+import unittest
+
+import serial
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import HvController as hv  # noqa: E402
+import HvAsyncController as hva  # noqa: E402
+from HvEmulator import PtyEmulator  # noqa: E402
+
+
+class Records():
+    ''' Telemetry keeping the kind of the polls and the commands '''
+
+    def __init__(self):
+        self.rows = []
+
+    def poll(self, port, reading):
+        self.rows.append(('poll',))
+
+    def command(self, port, kind, voltage, current, answer):
+        self.rows.append((kind, round(voltage, 6), current, answer))
+
+
+@unittest.skipIf(sys.platform == 'win32', 'no pseudo-terminals')
+class AsyncSetTest(unittest.TestCase):
+
+    def setUp(self):
+        self.devices = PtyEmulator()
+        self.devices.start()
+        self.port = self.devices.ports[0]
+
+    def tearDown(self):
+        self.devices.stop()
+
+    def syncRun(self):
+        hvdevice = hv.HvController()
+        hvdevice.telemetry = Records()
+        hvdevice.openPortHV(self.port)
+        try:
+            hvdevice.setHV(50.0, 1.0, trim=8)
+            hvdevice.queryHV()
+            setpoint = hvdevice.setpoint, hvdevice.trim
+        finally:
+            hvdevice.closePortHV()
+        return hvdevice.telemetry.rows, setpoint
+
+    async def asyncRun(self):
+        hvdevice = hva.HvAsyncController()
+        hvdevice.telemetry = Records()
+        await hvdevice.open(self.port)
+        try:
+            await hvdevice.set(50.0, 1.0, trim=8)
+            await hvdevice.query()
+            setpoint = hvdevice.setpoint, hvdevice.trim
+        finally:
+            await hvdevice.close()
+        return hvdevice.telemetry.rows, setpoint
+
+    def test_set_as_the_controller(self):
+        rows, setpoint = asyncio.run(self.asyncRun())
+        self.assertEqual((rows, setpoint), self.syncRun())
+        # the set and its query, the query and the reset of the closing
+        self.assertEqual([row[0] for row in rows],
+                         ['set', 'poll', 'poll', 'reset', 'poll'])
+        self.assertEqual(setpoint, ((50.0, 1.0, 'on'), 8))
+
+
+@unittest.skipIf(sys.platform == 'win32', 'no pseudo-terminals')
+class AsyncHangUpTest(unittest.TestCase):
+    ''' Port whose pseudo-terminal is closed, the device never answering '''
+
+    def setUp(self):
+        import pty
+        self.master, self.slave = pty.openpty()
+
+    def tearDown(self):
+        os.close(self.slave)
+        if self.master is not None:
+            os.close(self.master)
+
+    async def hangUp(self, pending):
+        hvdevice = hva.HvAsyncController()
+        await hvdevice.open(os.ttyname(self.slave))
+        fd = hvdevice.device.fileno()
+        if pending:
+            query = asyncio.ensure_future(hvdevice.query())
+            await asyncio.sleep(0.05)
+        os.close(self.master)
+        self.master = None
+        if pending:
+            with self.assertRaises(serial.SerialException):
+                await asyncio.wait_for(query, 1.0)
+        else:
+            await asyncio.sleep(0.05)
+        # the port is no longer watched by the event loop
+        self.assertFalse(asyncio.get_running_loop().remove_reader(fd))
+        with self.assertRaises(serial.SerialException):
+            await hvdevice.query()
+        with self.assertRaises(serial.SerialException):
+            await hvdevice.close()
+        self.assertFalse(hvdevice.device.is_open)
+
+    def test_hang_up_while_idle(self):
+        asyncio.run(self.hangUp(pending=False))
+
+    def test_hang_up_during_a_command(self):
+        asyncio.run(self.hangUp(pending=True))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the HvControllerGUI software.
+# Tests of the decoding of the answer to the Q command.
+#
+# Copyright 2018-2019 Aurélie Vancraeyenest
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import codec  # noqa: E402
+from checksum import calculateChksum  # noqa: E402
+
+
+def queryAnswer(fields):
+    ''' Answer to a Q command with its checksum, stripped from the CR '''
+    return b'R' + fields + calculateChksum(fields)
+
+
+class DecodeQueryTest(unittest.TestCase):
+
+    def test_answer(self):
+        answer = queryAnswer(b'3FF1A00005')
+        self.assertEqual(codec.decodeQuery(answer), (0x3FF, 0x1A0, 5))
+        self.assertEqual(codec.decodeQuery(memoryview(answer)),
+                         (0x3FF, 0x1A0, 5))
+
+    def test_truncated_answer(self):
+        answer = queryAnswer(b'3FF1A00005')
+        for length in (0, 1, 7, 10, 12):
+            with self.assertRaises(ValueError):
+                codec.decodeQuery(answer[:length])
+
+    def test_invalid_digit(self):
+        with self.assertRaises(ValueError):
+            codec.decodeQuery(queryAnswer(b'3FG1A00005'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the HvControllerGUI software.
+# Tests of the planning of the ramps of the HV programs.
+#
+# Copyright 2018-2019 Aurélie Vancraeyenest
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import program  # noqa: E402
+
+LSB = 40.0 / 0xFFF
+
+
+class PlanRampTest(unittest.TestCase):
+
+    def checkRamp(self, startVoltage, endVoltage, slewRate, bandwidth):
+        times, codes = program.planRamp(startVoltage, endVoltage, slewRate,
+                                        bandwidth)
+        duration = abs(endVoltage - startVoltage) / slewRate
+        if len(times) > 1:
+            self.assertGreaterEqual(np.diff(times).min(),
+                                    1 / bandwidth - 1e-9)
+        self.assertTrue((times > 0).all())
+        self.assertLessEqual(times[-1], duration)
+        self.assertEqual(codes[-1], round(endVoltage / LSB))
+        # no command ahead of the ideal ramp
+        ideal = startVoltage + np.sign(endVoltage - startVoltage) * (
+                slewRate * times)
+        self.assertTrue((np.abs(codes * LSB - startVoltage)
+                         <= np.abs(ideal - startVoltage) + LSB / 2 + 1e-9)
+                        .all())
+
+    def test_last_command_gap(self):
+        # the end code fell 0.468 s after the previous command at 2 Hz
+        self.checkRamp(5.37, 33.9, 3.82, 2.0)
+
+    def test_random_ramps(self):
+        rng = np.random.default_rng(0)
+        for i in range(500):
+            start, end = rng.uniform(0, 40, 2)
+            if round(start / LSB) == round(end / LSB):
+                continue
+            self.checkRamp(start, end, rng.uniform(0.05, 10),
+                           rng.uniform(0.2, 5))
+
+    def test_invalid_rate(self):
+        with self.assertRaises(ValueError):
+            program.planRamp(0, 10, 0, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the HvControllerGUI software.
+# Tests of the command queue and of the acquisition thread: the start of
+# a program dropped while still queued must end it, and a failed closing
+# must leave the port open.
+#
+# Copyright 2018-2019 Aurélie Vancraeyenest
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import time
+import unittest
+
+from PyQt5 import QtCore
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import HvController as hv  # noqa: E402
+import HvRack  # noqa: E402
+import program  # noqa: E402
+import workers  # noqa: E402
+from HvEmulator import HvEmulator, PtyEmulator  # noqa: E402
+
+APP = QtCore.QCoreApplication.instance() or QtCore.QCoreApplication([])
+
+
+def programRun(name='test'):
+    ''' Run of a program holding 1 kV for 10 s '''
+    schedule = program.compileProgram([program.ProgramStep('set', 10.0, 1.0,
+                                                           0.1)])
+    return program.ProgramRun(schedule, name)
+
+
+def slowCommand(duration=0.3):
+    ''' Command keeping the acquisition thread busy for duration seconds '''
+    time.sleep(duration)
+    return 'done'
+
+
+def spin(duration, until):
+    ''' Process the Qt events until until() or for duration seconds '''
+    end = time.monotonic() + duration
+    while time.monotonic() < end and not until():
+        APP.processEvents()
+        time.sleep(0.01)
+
+
+class CommandQueueTest(unittest.TestCase):
+
+    def test_reset_drops_set_and_program(self):
+        dropped = []
+        queue = workers.CommandQueue(dropped.append)
+        queue.put('poll', workers.PRIORITY_POLL)
+        queue.put('set', workers.PRIORITY_SET)
+        queue.put('program', workers.PRIORITY_PROGRAM)
+        queue.put('reset', workers.PRIORITY_RESET)
+        self.assertEqual(dropped, ['set', 'program'])
+        self.assertEqual(queue.get(0), 'reset')
+        self.assertEqual(queue.get(0), 'poll')
+        self.assertIsNone(queue.get(0))
+
+    def test_stop_drops_program_only(self):
+        dropped = []
+        queue = workers.CommandQueue(dropped.append)
+        queue.put('set', workers.PRIORITY_SET, key='set')
+        queue.put('program', workers.PRIORITY_PROGRAM)
+        queue.put('stop', workers.PRIORITY_STOP)
+        self.assertEqual(dropped, ['program'])
+        self.assertEqual(queue.get(0), 'stop')
+        self.assertEqual(queue.get(0), 'set')
+        self.assertIsNone(queue.get(0))
+
+    def test_replaced_command_is_dropped(self):
+        dropped = []
+        queue = workers.CommandQueue(dropped.append)
+        queue.put('first', workers.PRIORITY_SET, key='set')
+        queue.put('second', workers.PRIORITY_SET, key='set')
+        self.assertEqual(dropped, ['first'])
+        self.assertEqual(queue.get(0), 'second')
+        self.assertIsNone(queue.get(0))
+
+
+class ProgramCommandsTest(unittest.TestCase):
+    ''' Program commands queued in an acquisition thread not started '''
+
+    def setUp(self):
+        self.acquisition = workers.HvAcquisition(
+                hv.HvController(device=HvEmulator()))
+        self.ended = []
+        self.acquisition.programEnded.connect(self.ended.append)
+
+    def test_stop_of_a_pending_start(self):
+        run = programRun()
+        self.acquisition.startProgram(run)
+        self.acquisition.stopProgram()
+        self.assertEqual(self.ended, [run])
+        self.assertTrue(run.stopped)
+        self.assertIsNone(run.start)
+        stop = self.acquisition._commands.get(0)
+        self.assertEqual(stop.fn(), 'No program running')
+        self.assertIsNone(self.acquisition._commands.get(0))
+
+    def test_reset_of_a_pending_start(self):
+        run = programRun()
+        self.acquisition.startProgram(run)
+        self.acquisition.submit(workers.HvWorker(lambda: None),
+                                workers.PRIORITY_RESET)
+        self.assertEqual(self.ended, [run])
+
+    def test_new_start_ends_the_pending_one(self):
+        first, second = programRun('first'), programRun('second')
+        self.acquisition.startProgram(first)
+        self.acquisition.startProgram(second)
+        self.assertEqual(self.ended, [first])
+
+    def test_pause_does_not_overtake_the_start(self):
+        run = programRun()
+        self.acquisition.startProgram(run)
+        self.acquisition.pauseProgram()
+        start = self.acquisition._commands.get(0)
+        pause = self.acquisition._commands.get(0)
+        self.assertEqual(start.fn, self.acquisition._startProgram)
+        self.assertEqual(pause.fn, self.acquisition._pauseProgram)
+
+
+@unittest.skipIf(sys.platform == 'win32', 'no pseudo-terminals')
+class RackProgramTest(unittest.TestCase):
+    ''' Stop and reset of a program whose start waits for a command '''
+
+    def setUp(self):
+        self.devices = PtyEmulator()
+        self.devices.start()
+        self.port = self.devices.ports[0]
+        self.rack = HvRack.HvRack()
+        self.rack.openPort(self.port)
+        self.ended = []
+        self.rack.programEnded.connect(
+                lambda port, run: self.ended.append(run))
+
+    def tearDown(self):
+        self.rack.closeAll()
+        spin(0.2, lambda: not self.rack.ports())
+        self.devices.stop()
+
+    def test_stop_and_reset_while_the_start_is_pending(self):
+        state = self.rack.states[self.port]
+        # a slow command in flight keeps the start queued
+        self.rack.submit(self.port, workers.HvWorker(slowCommand))
+        time.sleep(0.05)
+        run = programRun()
+        self.rack.startProgram(self.port, run)
+        self.assertIs(state.program, run)
+        self.rack.stopProgram(self.port)
+        self.rack.submit(self.port, workers.HvWorker(
+                self.rack.controllers[self.port].resetHV, verbosity=True),
+                workers.PRIORITY_RESET)
+        spin(2.0, lambda: state.program is None)
+        self.assertIsNone(state.program)
+        self.assertFalse(state.programPaused)
+        self.assertEqual(self.ended, [run])
+
+    def test_stop_keeps_the_pending_set(self):
+        outputs = []
+        self.rack.submit(self.port, workers.HvWorker(slowCommand))
+        time.sleep(0.05)
+        setWk = workers.HvWorker(self.rack.controllers[self.port].setHV,
+                                 1.0, 0.1, verbosity=True)
+        setWk.signals.output.connect(outputs.append)
+        self.rack.submit(self.port, setWk, workers.PRIORITY_SET, key='set')
+        self.rack.stopProgram(self.port, outputs.append)
+        spin(2.0, lambda: len(outputs) == 2)
+        self.assertEqual(outputs[0], 'No program running')
+        self.assertEqual(len(outputs), 2)
+        self.assertEqual(self.rack.controllers[self.port].setpoint,
+                         (1.0, 0.1, 'on'))
+
+    def test_program_runs_after_the_pending_start(self):
+        state = self.rack.states[self.port]
+        run = programRun()
+        self.rack.startProgram(self.port, run)
+        self.rack.pauseProgram(self.port)
+        spin(2.0, lambda: run.start is not None and run.paused)
+        self.assertTrue(run.paused)
+        self.rack.stopProgram(self.port)
+        spin(2.0, lambda: state.program is None)
+        self.assertEqual(self.ended, [run])
+
+
+@unittest.skipIf(sys.platform == 'win32', 'no pseudo-terminals')
+class RackCloseTest(unittest.TestCase):
+    ''' Closing of a port whose reset fails '''
+
+    def setUp(self):
+        self.devices = PtyEmulator()
+        self.devices.start()
+        self.port = self.devices.ports[0]
+        self.rack = HvRack.HvRack()
+        self.rack.openPort(self.port)
+
+    def tearDown(self):
+        self.rack.closeAll()
+        self.devices.stop()
+
+    def test_failed_close_can_be_tried_again(self):
+        hvdevice = self.rack.controllers[self.port]
+        errors = []
+        worker = workers.HvWorker(hvdevice.closePortHV)
+        worker.signals.error.connect(errors.append)
+        self.devices.model(self.port).injectError(6)
+        self.rack.closePort(self.port, worker)
+        spin(2.0, lambda: errors)
+        self.assertEqual(errors[0][0], hv.HvError)
+        spin(0.3, lambda: False)
+        self.assertIn(self.port, self.rack.ports())
+        self.assertTrue(hvdevice.device.is_open)
+
+        self.rack.closePort(self.port)
+        spin(2.0, lambda: not self.rack.ports())
+        self.assertEqual(self.rack.ports(), [])
+        self.assertFalse(hvdevice.device.is_open)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -19,8 +19,16 @@
 
 import traceback
 import sys
+import time
+import heapq
+import itertools
+import threading
 from PyQt5 import QtCore
 
+import history
+import keepalive
+import stability
+
 
 class HvSignals(QtCore.QObject):
     '''
@@ -66,3 +74,523 @@ class HvWorker(QtCore.QRunnable):
             self.signals.output.emit(output)
         finally:
             self.signals.done.emit()
+
+
+#: Priority classes of the commands, the lowest value first
+PRIORITY_RESET = 0
+PRIORITY_STOP = 1
+PRIORITY_SET = 2
+PRIORITY_PROGRAM = 3
+PRIORITY_POLL = 4
+
+#: Priority classes of the pending commands dropped by a command
+_DROPPED_BY = {PRIORITY_RESET: (PRIORITY_SET, PRIORITY_PROGRAM),
+               PRIORITY_STOP: (PRIORITY_PROGRAM,)}
+
+
+class CommandQueue():
+    '''
+    Thread-safe priority queue of the commands of a HV device
+
+    The commands are taken by priority class (PRIORITY_RESET, then
+    PRIORITY_STOP, PRIORITY_SET, PRIORITY_PROGRAM and PRIORITY_POLL), in
+    order of submission within a class, so a reset waits at most for the
+    command in progress whatever the number of queued commands.
+
+    A command put with the key of a pending command replaces it (e.g.
+    only the latest setpoint matters), keeping the place of the pending
+    one. A reset drops the pending set and program commands, which must
+    not turn the HV on again after it, and the stop of a program the
+    pending program commands only. The dropped commands are never run
+    and emit no signal, but are passed to dropped, if given.
+
+    Parameters
+    ----------
+    dropped : callable
+        Called with each command dropped or replaced, outside the lock
+        of the queue (default None)
+    '''
+
+    def __init__(self, dropped=None):
+        self.dropped = dropped
+        self._heap = []
+        self._keys = {}
+        self._order = itertools.count()
+        self._condition = threading.Condition()
+
+    def __len__(self):
+        with self._condition:
+            return sum(1 for entry in self._heap if entry[2] is not None)
+
+    def put(self, command, priority=PRIORITY_SET, key=None):
+        '''
+        Queue a command
+
+        Parameters
+        ----------
+        command : object
+            Command to queue, e.g. a HvWorker
+        priority : int
+            Priority class (default PRIORITY_SET)
+        key : hashable
+            Coalescing key (default None, never coalesced)
+        '''
+        dropped = []
+        with self._condition:
+            droppedClasses = _DROPPED_BY.get(priority, ())
+            for entry in self._heap:
+                if entry[0] in droppedClasses and entry[2] is not None:
+                    dropped.append(entry[2])
+                    self._drop(entry)
+            pending = self._keys.get(key) if key is not None else None
+            if pending is not None and pending[0] == priority:
+                dropped.append(pending[2])
+                pending[2] = command
+            else:
+                entry = [priority, next(self._order), command, key]
+                if key is not None:
+                    self._keys[key] = entry
+                heapq.heappush(self._heap, entry)
+                self._condition.notify()
+        if self.dropped is not None:
+            for command in dropped:
+                self.dropped(command)
+
+    def get(self, timeout=None):
+        '''
+        Remove and return the first command
+
+        Parameters
+        ----------
+        timeout : float
+            Maximum waiting time in seconds (default None, no limit)
+
+        Returns
+        -------
+        command : object
+            First command, None if the timeout expired
+        '''
+        with self._condition:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while True:
+                while self._heap and self._heap[0][2] is None:
+                    heapq.heappop(self._heap)
+                if self._heap:
+                    entry = heapq.heappop(self._heap)
+                    command = entry[2]
+                    self._drop(entry)
+                    return command
+                remaining = (None if deadline is None
+                             else deadline - time.monotonic())
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._condition.wait(remaining)
+
+    def _drop(self, entry):
+        if entry[3] is not None and self._keys.get(entry[3]) is entry:
+            del self._keys[entry[3]]
+        entry[2] = None
+
+
+class HvAcquisition(QtCore.QThread):
+    '''
+    Long-lived acquisition thread owning the HV controller and its port
+
+    The thread performs the keep-alive query of the HV device and runs
+    the HvWorker commands submitted by the GUI one after the other, by
+    priority (see CommandQueue), so only this thread talks to the serial
+    port, one transaction at a time, once it is started. The queries
+    are scheduled by a KeepAliveScheduler, in scheduler: any answered
+    command counts as a keep-alive and the query interval adapts to the
+    readings, within the watchdog of the device.
+
+    Parameters
+    ----------
+    hvdevice : HvController
+        Controller with an open port
+    interval : float
+        Time between two keep-alive queries of a device after a change
+        in seconds (default 0.5 s)
+    adaptive : bool
+        Adapt the query interval to the readings (default True)
+    startDelay : float
+        Delay before the first query in seconds (default 0 s), used to
+        stagger the queries of several devices
+    hvhistory : HvHistory
+        History fed with every new reading (default created here with
+        the scale of the controller)
+    acqlog : AcquisitionLog
+        Log written with every new reading and closed when the thread
+        ends (default None, no log)
+    monitor : StabilityMonitor
+        Monitor updated with every new reading and the target voltage
+        of the setpoint of the controller (default created here with
+        its default band and windows)
+    corrector : SetpointCorrector
+        Corrector of the setpoint when the voltage leaves the band of
+        the monitor (default None, no correction)
+
+    The delay of each keep-alive query after its due time is recorded
+    in the metrics of the controller, and counted as a timer overrun
+    above OVERRUN_TOLERANCE seconds, as is the watchdog slack of each
+    answered command.
+
+    The thread also runs the HV programs: the S commands of a
+    ProgramRun are sent by the thread itself at their due time, between
+    the queued commands, which are run first. A program is started,
+    paused and stopped through the queue (see startProgram()) and
+    stopped when the thread ends.
+
+    The stability of the voltage is checked at every new reading by the
+    monitor, except while a program runs, and its changes are emitted
+    by stabilityChanged. When the voltage leaves the band, the corrector
+    sends the setpoint of the controller again, and possibly trims it,
+    from this thread: the reading taken right after each setpoint and
+    the queries, at the fast rate until the end of the correction, are
+    checked at once. The end of the correction is emitted by
+    setpointCorrected and its duration recorded in the recovery time
+    metric.
+
+    Supported signals
+    -----------------
+    reading : HvReading
+        New reading of the HV status after a transaction
+    error : tuple
+        Error traceback of a failed keep-alive query
+    programEnded : ProgramRun
+        Program done, stopped or failed, also emitted, by the thread
+        queuing the command dropping it, for a program whose start is
+        dropped from the queue before running
+    stabilityChanged : StabilityEvent
+        Voltage out of the band around the target for the dwell time of
+        the monitor, or back in it
+    setpointCorrected : CorrectionStep
+        Correction of the setpoint ended, recovered or failed
+    '''
+    #: obj: pyqtSignal(object) New HV status after a transaction
+    reading = QtCore.pyqtSignal(object)
+    #: obj: pyqtSignal(tuple) Error traceback of a keep-alive query
+    error = QtCore.pyqtSignal(tuple)
+    #: obj: pyqtSignal(object) ProgramRun done, stopped or failed
+    programEnded = QtCore.pyqtSignal(object)
+    #: obj: pyqtSignal(object) StabilityEvent of the voltage
+    stabilityChanged = QtCore.pyqtSignal(object)
+    #: obj: pyqtSignal(object) CorrectionStep ending a correction
+    setpointCorrected = QtCore.pyqtSignal(object)
+
+    OVERRUN_TOLERANCE = 0.05
+
+    _STOP = object()
+
+    def __init__(self, hvdevice, interval=0.5, startDelay=0, hvhistory=None,
+                 acqlog=None, adaptive=True, monitor=None, corrector=None,
+                 parent=None):
+        super(HvAcquisition, self).__init__(parent)
+        self.hvdevice = hvdevice
+        self.scheduler = keepalive.KeepAliveScheduler(interval, adaptive)
+        self.startDelay = startDelay
+        if hvhistory is None:
+            hvhistory = history.HvHistory(
+                    maxVoltage=hvdevice.MAX_VOLTAGE,
+                    maxCurrent=hvdevice.MAX_CURENT,
+                    maxCounts=hvdevice.MAX_HEX_VAL_RECEIVE)
+        self.history = hvhistory
+        self.acqlog = acqlog
+        self.monitor = (stability.StabilityMonitor() if monitor is None
+                        else monitor)
+        self.corrector = corrector
+        self._published = None
+        self.program = None
+        self._commands = CommandQueue(self._dropped)
+        self._running = True
+
+    def submit(self, worker, priority=PRIORITY_SET, key=None):
+        '''
+        Queue a command to be run in the acquisition thread
+
+        Parameters
+        ----------
+        worker : HvWorker
+            Worker wrapping the controller method to run
+        priority : int
+            Priority class of the command (default PRIORITY_SET)
+        key : hashable
+            Coalescing key, a pending command with the same key and
+            priority is replaced by this one (default None)
+        '''
+        self._commands.put(worker, priority, key)
+
+    def startProgram(self, run, output=None):
+        '''
+        Queue the start of a HV program, stopping the running one
+
+        Parameters
+        ----------
+        run : ProgramRun
+            Program to run, not started yet
+        output : callable
+            Slot connected to the output signal of the queued worker
+            (default None)
+        '''
+        self._submitProgram(HvWorker(self._startProgram, run), output,
+                            PRIORITY_PROGRAM, 'program')
+
+    def pauseProgram(self, paused=True, output=None):
+        '''
+        Queue the pause (or the resumption) of the running HV program
+
+        Parameters
+        ----------
+        paused : bool
+            True to pause, False to resume (default True)
+        output : callable
+            see startProgram()
+        '''
+        # same class as the start, so that it cannot overtake it
+        self._submitProgram(HvWorker(self._pauseProgram, paused), output,
+                            PRIORITY_PROGRAM, 'program-pause')
+
+    def stopProgram(self, output=None):
+        '''
+        Queue the stop of the running HV program, ahead of the other
+        commands but the resets, dropping the pending program commands
+
+        Parameters
+        ----------
+        output : callable
+            see startProgram()
+        '''
+        self._submitProgram(HvWorker(self._stopProgram), output,
+                            PRIORITY_STOP, 'program-stop')
+
+    def closePort(self, worker):
+        '''
+        Queue the closing of the port, ahead of the other commands like
+        a reset, and stop the thread once the port is closed
+
+        If the closing fails, the port stays open and queried, so that
+        the user can try again.
+
+        Parameters
+        ----------
+        worker : HvWorker
+            Worker running the closePortHV() method of the device
+        '''
+        close = worker.fn
+
+        def closeAndStop(*args, **kwargs):
+            output = close(*args, **kwargs)
+            if not self.hvdevice.device.is_open:
+                self._running = False
+            return output
+
+        worker.fn = closeAndStop
+        self.submit(worker, PRIORITY_RESET)
+
+    def stop(self):
+        '''
+        Stop the thread once the queued resets are done
+
+        The commands of the other priority classes still pending are
+        dropped.
+        '''
+        self._commands.put(self._STOP, PRIORITY_RESET)
+
+    def run(self):
+        scheduler = self.scheduler
+        scheduler.start(time.monotonic() + self.startDelay)
+        while self._running:
+            nextQuery = scheduler.nextPoll()
+            nextStep = (self.program.nextDue() if self.program is not None
+                        else None)
+            due = nextQuery if nextStep is None else min(nextQuery, nextStep)
+            worker = self._commands.get(
+                    timeout=max(0, due - time.monotonic()))
+            if worker is None:
+                now = time.monotonic()
+                if nextStep is not None and nextStep <= nextQuery:
+                    self._runProgram(now)
+                else:
+                    self._recordLateness(now - nextQuery)
+                    scheduler.polled(now)
+                    self._query()
+            else:
+                if worker is self._STOP:
+                    self._running = False
+                    break
+                worker.run()
+                scheduler.commanded()
+            self._recordSlack(scheduler.update(self.hvdevice.lastTransaction,
+                                               self.hvdevice.lastReading))
+            self._publish()
+        if self.program is not None:
+            self.program.stop()
+            self._endProgram()
+        if self.acqlog is not None:
+            self.acqlog.close()
+
+    def _recordLateness(self, lateness):
+        metrics = self.hvdevice.metrics
+        if metrics is not None:
+            metrics.pollLateness.observe(lateness)
+            if lateness > self.OVERRUN_TOLERANCE:
+                metrics.timerOverruns.inc()
+
+    def _recordSlack(self, slack):
+        metrics = self.hvdevice.metrics
+        if metrics is not None and slack is not None:
+            metrics.watchdogSlack.observe(slack)
+            if slack < 0:
+                metrics.watchdogMisses.inc()
+
+    def _submitProgram(self, worker, output, priority, key):
+        if output is not None:
+            worker.signals.output.connect(output)
+        self.submit(worker, priority, key)
+
+    def _dropped(self, worker):
+        # a program whose start is dropped, by a stop, a reset or a new
+        # start, ends without running
+        if getattr(worker, 'fn', None) == self._startProgram:
+            run = worker.args[0]
+            run.stop()
+            self.programEnded.emit(run)
+
+    def _startProgram(self, run):
+        if self.program is not None:
+            self.program.stop()
+            self._endProgram()
+        self.program = run
+        run.begin(time.monotonic())
+        return ('Program {} started: {} commands over {:.0f} s'
+                .format(run.name, len(run.schedule), run.schedule.duration))
+
+    def _pauseProgram(self, paused):
+        if self.program is None:
+            return 'No program running'
+        if paused:
+            self.program.pause(time.monotonic())
+            return 'Program {} paused'.format(self.program.name)
+        self.program.resume(time.monotonic())
+        return 'Program {} resumed'.format(self.program.name)
+
+    def _stopProgram(self):
+        if self.program is None:
+            return 'No program running'
+        self.program.stop()
+        self._endProgram()
+        return 'Program stopped'
+
+    def _runProgram(self, now):
+        run = self.program
+        skipped = run.skipped
+        index = run.due(now)
+        if index is not None:
+            try:
+                answer = self.hvdevice.sendSetFrame(run.schedule.frames[index])
+            except Exception:
+                run.stop(str(sys.exc_info()[1]))
+            else:
+                lateness = run.sent(index, now)
+                if answer != b'A':
+                    run.stop('answer {}'.format(answer))
+                metrics = self.hvdevice.metrics
+                if metrics is not None:
+                    metrics.programLateness.observe(lateness)
+                    metrics.programSkipped.inc(run.skipped - skipped)
+            self.scheduler.commanded()
+        if run.done:
+            self._endProgram()
+
+    def _endProgram(self):
+        run, self.program = self.program, None
+        self.programEnded.emit(run)
+
+    def _query(self):
+        try:
+            self.hvdevice.queryHV()
+        except Exception:
+            exctype, value = sys.exc_info()[:2]
+            self.error.emit((exctype, value, traceback.format_exc()))
+
+    def _publish(self):
+        reading = self.hvdevice.lastReading
+        # a correction may take a new reading while checking this one
+        while reading is not None and reading is not self._published:
+            self._published = reading
+            self.history.append(reading)
+            if self.acqlog is not None:
+                self.acqlog.append(reading)
+            self.reading.emit(reading)
+            self._checkStability(reading)
+            reading = self.hvdevice.lastReading
+
+    def _checkStability(self, reading):
+        target = (self.hvdevice.targetVoltage if self.program is None
+                  else None)
+        event = self.monitor.update(reading.timestamp, reading.voltage,
+                                    target)
+        if event is not None:
+            self.stabilityChanged.emit(event)
+        corrector = self.corrector
+        if corrector is None:
+            return
+        if event is not None and event.kind == 'violation':
+            step = corrector.begin(reading.timestamp, reading.voltage, target,
+                                   self.hvdevice.trim)
+        else:
+            step = corrector.update(reading.timestamp, reading.voltage,
+                                    target)
+        if corrector.active:
+            # poll fast until the end of the correction
+            self.scheduler.commanded()
+        if step is not None:
+            self._correct(step)
+
+    def _correct(self, step):
+        metrics = self.hvdevice.metrics
+        if step.kind == 'send':
+            try:
+                self.hvdevice.restoreSetpoint(trim=step.trim)
+            except Exception:
+                self.corrector.cancel()
+                step = step._replace(kind='failed')
+            else:
+                if metrics is not None:
+                    metrics.corrections.inc()
+                self.scheduler.commanded()
+                return
+        if metrics is not None:
+            if step.kind == 'recovered':
+                metrics.recoveryTime.observe(step.duration)
+            else:
+                metrics.correctionFailures.inc()
+        self.setpointCorrected.emit(step)
+
+
+class PortScanner(QtCore.QThread):
+    '''
+    Thread listing the serial ports of the computer
+
+    The ports are emitted by portFound as they are listed: one by one
+    from the device registry on Windows, where the listing is slow, all
+    at the end elsewhere. The listing module is imported by the thread
+    too, so neither delays the start of the GUI.
+
+    Supported signals
+    -----------------
+    portFound : str
+        Device name of a serial port, e.g. 'COM4'
+    '''
+    #: obj: pyqtSignal(str) Serial port found
+    portFound = QtCore.pyqtSignal(str)
+
+    def run(self):
+        if sys.platform == 'win32':
+            from serial.tools.list_ports_windows import iterate_comports
+            ports = iterate_comports()
+        else:
+            from serial.tools import list_ports
+            ports = list_ports.comports()
+        for port in ports:
+            self.portFound.emit(port.device)